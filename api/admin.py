@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Patient, Appointment, Address, Contact, Anamnesis
+from .models import Patient, Appointment, Address, Contact, Anamnesis, Reminder
 
 @admin.register(Patient)
 class PatientAdmin(admin.ModelAdmin):
@@ -22,3 +22,8 @@ class AnamnesisAdmin(admin.ModelAdmin):
     list_display = ("id", "paciente", "data_atualizacao")
     readonly_fields = ("data_atualizacao",)
 
+@admin.register(Reminder)
+class ReminderAdmin(admin.ModelAdmin):
+    list_display = ("id", "paciente", "canal", "destino", "status", "tentativas", "enviado_em")
+    list_filter = ("status", "canal")
+    list_select_related = ("paciente",)
@@ -0,0 +1,80 @@
+from django.db import connection, transaction
+from django.db.models import BooleanField, Value
+from django.utils import timezone
+
+from .models import Appointment, ArchivedAppointment, Reminder
+from .signals import appointments_archived
+
+# Statuses that never change again once the day has passed
+TERMINAL_STATUSES = ('concluido', 'cancelado', 'nao_compareceu')
+
+# Columns shared by both tables (the archive keeps the original names)
+ARCHIVED_COLUMNS = [field.column for field in ArchivedAppointment._meta.concrete_fields if field.name != 'arquivado_em']
+
+HISTORY_FIELDS = ['id', 'paciente', 'data', 'horario', 'tipo', 'status', 'observacoes', 'duracao', 'serie', 'data_original']
+
+
+def archivable(antes):
+    """Appointments before ``antes`` in a terminal status (served by the (status, data) index)."""
+    return Appointment.objects.filter(status__in=TERMINAL_STATUSES, data__lt=antes)
+
+
+def archive_chunk(ids):
+    """Move the appointments ``ids`` to the archive in one transaction; returns how many moved.
+
+    Rows are copied with INSERT ... SELECT, so they never round-trip through
+    Python objects.
+    """
+    quote = connection.ops.quote_name
+    columns = ', '.join(quote(column) for column in ARCHIVED_COLUMNS)
+    placeholders = ', '.join(['%s'] * len(ids))
+    table, pk = quote(Appointment._meta.db_table), quote(Appointment._meta.pk.column)
+    insert_sql = (
+        f'INSERT INTO {quote(ArchivedAppointment._meta.db_table)} ({columns}, {quote("arquivado_em")}) '
+        f'SELECT {columns}, %s FROM {table} WHERE {pk} IN ({placeholders})'
+    )
+    # Plain DELETE rather than QuerySet.delete(): no per-row post_delete (tombstones,
+    # SSE events, one version bump per row), since an archived appointment was not
+    # deleted; receivers get one appointments_archived signal per chunk instead.
+    # The reminders, the only rows pointing at appointments, are deleted first.
+    delete_sql = f'DELETE FROM {table} WHERE {pk} IN ({placeholders})'
+    arquivado_em = ArchivedAppointment._meta.get_field('arquivado_em').get_db_prep_save(timezone.now(), connection)
+    with transaction.atomic():
+        Reminder.objects.filter(agendamento_id__in=ids).delete()
+        with connection.cursor() as cursor:
+            cursor.execute(insert_sql, [arquivado_em, *ids])
+            moved = cursor.rowcount
+            cursor.execute(delete_sql, ids)
+        transaction.on_commit(lambda: appointments_archived.send(sender=Appointment, ids=ids))
+    return moved
+
+
+def archive_appointments(antes, lote=1000, on_chunk=None):
+    """Move every archivable appointment before ``antes``, ``lote`` rows per
+    transaction so writers are never blocked for long. Returns the total moved.
+
+    ``on_chunk(total)`` is called after each chunk, e.g. to report progress.
+    """
+    total = 0
+    while True:
+        ids = list(archivable(antes).order_by('id').values_list('id', flat=True)[:lote])
+        if not ids:
+            return total
+        total += archive_chunk(ids)
+        if on_chunk is not None:
+            on_chunk(total)
+
+
+def patient_history(paciente_id, status=None):
+    """Every appointment of a patient, current and archived, as dicts ordered
+    by (data, horario, id), with ``arquivado`` telling where each came from.
+
+    One UNION query; both sides use their (paciente, data) index.
+    """
+    current = Appointment.objects.filter(paciente_id=paciente_id)
+    archived = ArchivedAppointment.objects.filter(paciente_id=paciente_id)
+    if status:
+        current, archived = current.filter(status=status), archived.filter(status=status)
+    current = current.values(*HISTORY_FIELDS).annotate(arquivado=Value(False, output_field=BooleanField()))
+    archived = archived.values(*HISTORY_FIELDS).annotate(arquivado=Value(True, output_field=BooleanField()))
+    return current.union(archived, all=True).order_by('data', 'horario', 'id')
@@ -0,0 +1,165 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.settings import api_settings
+
+REVOKED_KEY = 'jwt:revogado:{}'
+USER_VERSION_KEY = 'jwt:usuario:{}'
+
+
+class TokenCache:
+    """Bounded LRU of verified access tokens and their users, per process.
+
+    Entries are keyed by the raw token, so a hit means the exact same bytes
+    were verified before, and indexed by ``jti`` and user id for invalidation.
+    They expire at the token's ``exp`` or after ``ttl`` seconds, whichever
+    comes first. Each entry also keeps the user's version in the Django cache
+    when it was stored (see ``invalidate_user``).
+    """
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._by_jti = {}
+        self._by_user = {}
+
+    def get(self, raw_token):
+        with self._lock:
+            entry = self._entries.get(raw_token)
+            if entry is None:
+                return None
+            if entry['expira_em'] <= time.time():
+                self._remove(raw_token)
+                return None
+            self._entries.move_to_end(raw_token)
+            return entry['user'], entry['token'], entry['versao']
+
+    def set(self, raw_token, user, validated_token, versao=None):
+        expira_em = min(validated_token.get('exp', 0), time.time() + self.ttl)
+        jti = validated_token.get(api_settings.JTI_CLAIM)
+        with self._lock:
+            if raw_token in self._entries:
+                self._remove(raw_token)
+            self._entries[raw_token] = {
+                'user': user, 'token': validated_token, 'expira_em': expira_em, 'jti': jti, 'versao': versao,
+            }
+            if jti is not None:
+                self._by_jti[jti] = raw_token
+            self._by_user.setdefault(user.pk, set()).add(raw_token)
+            while len(self._entries) > self.max_size:
+                self._remove(next(iter(self._entries)))
+
+    def evict_jti(self, jti):
+        with self._lock:
+            raw_token = self._by_jti.get(jti)
+            if raw_token is not None:
+                self._remove(raw_token)
+
+    def evict_user(self, user_id):
+        with self._lock:
+            for raw_token in list(self._by_user.get(user_id, ())):
+                self._remove(raw_token)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_jti.clear()
+            self._by_user.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _remove(self, raw_token):
+        entry = self._entries.pop(raw_token)
+        self._by_jti.pop(entry['jti'], None)
+        tokens = self._by_user.get(entry['user'].pk)
+        if tokens is not None:
+            tokens.discard(raw_token)
+            if not tokens:
+                del self._by_user[entry['user'].pk]
+
+
+token_cache = TokenCache(
+    getattr(settings, 'JWT_AUTH_CACHE_SIZE', 1024),
+    getattr(settings, 'JWT_AUTH_CACHE_TTL', 300),
+)
+
+
+def revoke_token(validated_token):
+    """Reject ``validated_token`` from now until it expires (logout)."""
+    jti = validated_token.get(api_settings.JTI_CLAIM)
+    if jti is None:
+        return
+    timeout = max(int(validated_token.get('exp', 0) - time.time()), 1)
+    cache.set(REVOKED_KEY.format(jti), True, timeout)
+    token_cache.evict_jti(jti)
+
+
+def invalidate_user(user_id):
+    """Drop the cached tokens of a user that changed, in this process at once
+    and in the others on their next request (through the user's version)."""
+    token_cache.evict_user(user_id)
+    key = USER_VERSION_KEY.format(user_id)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, time.time_ns(), None)
+
+
+def shared_state(validated_token, user_id):
+    """(revoked, user version) from the Django cache, in one round trip.
+
+    Revocations and user changes reach every process only when the cache is
+    shared between them (``CACHE_BACKEND``); with the default per-process
+    LocMemCache they stay in the process that handled them.
+    """
+    jti = validated_token.get(api_settings.JTI_CLAIM)
+    keys = [USER_VERSION_KEY.format(user_id)]
+    if jti is not None:
+        keys.append(REVOKED_KEY.format(jti))
+    values = cache.get_many(keys)
+    return len(keys) > 1 and keys[1] in values, values.get(keys[0])
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """JWTAuthentication that skips token decoding and the user SELECT for
+    tokens seen recently (see ``TokenCache``).
+
+    Cached users are dropped when the user is saved or deleted (see
+    ``api.signals``) and tokens revoked through logout are rejected; both
+    are checked against the Django cache on every request.
+    """
+
+    cache = token_cache
+
+    def authenticate(self, request):
+        header = self.get_header(request)
+        if header is None:
+            return None
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+
+        cached = self.cache.get(raw_token)
+        if cached is not None:
+            user, validated_token, versao = cached
+        else:
+            validated_token = self.get_validated_token(raw_token)
+            user = self.get_user(validated_token)
+        revoked, current = shared_state(validated_token, user.pk)
+        if revoked:
+            raise AuthenticationFailed('Token revogado.', code='token_revoked')
+        if cached is not None and versao != current:
+            # The user changed in another process
+            user = self.get_user(validated_token)
+            cached = None
+        if cached is None:
+            self.cache.set(raw_token, user, validated_token, current)
+        return user, validated_token
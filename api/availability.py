@@ -0,0 +1,68 @@
+import datetime
+from itertools import groupby
+
+from .models import Appointment, format_horario
+from .recurrence import virtual_occurrences
+
+
+def busy_intervals(inicio, fim):
+    """(data, inicio_minutos, fim_minutos) of blocking appointments in the range, sorted.
+
+    Stored rows come from one query served by the (data, inicio_minutos,
+    fim_minutos) index; occurrences of recurring series are expanded for the
+    range and merged in.
+    """
+    stored = (
+        Appointment.objects.blocking()
+        .filter(data__range=(inicio, fim), inicio_minutos__isnull=False)
+        .order_by('data', 'inicio_minutos')
+        .values_list('data', 'inicio_minutos', 'fim_minutos')
+    )
+    recurring = [
+        (occurrence.data, occurrence.inicio_minutos, occurrence.fim_minutos)
+        for occurrence in virtual_occurrences(inicio, fim)
+        if occurrence.inicio_minutos is not None
+    ]
+    if not recurring:
+        return stored
+    return sorted([*stored, *recurring], key=lambda row: (row[0], row[1]))
+
+
+def free_windows(intervals, abertura, fechamento, duracao):
+    """Sweep the sorted busy ``intervals`` of one day and yield free (inicio, fim) gaps.
+
+    Only gaps inside [abertura, fechamento) that fit ``duracao`` minutes are yielded.
+    """
+    cursor = abertura
+    for start, end in intervals:
+        gap_end = min(start, fechamento)
+        if gap_end - cursor >= duracao:
+            yield cursor, gap_end
+        cursor = max(cursor, end)
+        if cursor >= fechamento:
+            return
+    if fechamento - cursor >= duracao:
+        yield cursor, fechamento
+
+
+def availability(inicio, fim, abertura, fechamento, duracao, intervals=None):
+    """Return one entry per day between ``inicio`` and ``fim`` with its free windows."""
+    if intervals is None:
+        intervals = busy_intervals(inicio, fim)
+    busy = {
+        day: [(start, end) for _, start, end in rows]
+        for day, rows in groupby(intervals, key=lambda row: row[0])
+    }
+
+    days = []
+    day = inicio
+    while day <= fim:
+        days.append({
+            'data': str(day),
+            'livres': [
+                {'inicio': format_horario(start), 'fim': format_horario(end)}
+                for start, end in free_windows(busy.get(day, []), abertura, fechamento, duracao)
+            ],
+        })
+        day += datetime.timedelta(days=1)
+    return days
@@ -0,0 +1,27 @@
+from django.core.cache import cache
+
+
+def _version_key(namespace):
+    return f'api:versao:{namespace}'
+
+
+def get_version(namespace):
+    """Return the current version number of a cache namespace.
+
+    Cached entries embed the version in their key, so bumping it invalidates
+    every entry of the namespace at once without having to enumerate keys.
+    """
+    key = _version_key(namespace)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, 1, timeout=None)
+        version = cache.get(key, 1)
+    return version
+
+
+def bump_version(namespace):
+    key = _version_key(namespace)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, 2, timeout=None)
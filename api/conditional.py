@@ -0,0 +1,55 @@
+import hashlib
+import math
+
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+from .versions import table_versions
+
+
+class ConditionalGetMixin:
+    """ETag / Last-Modified support for viewsets, derived from table versions.
+
+    ``conditional_models`` lists every model whose rows end up in the
+    responses. A GET whose If-None-Match still matches gets ``304 Not
+    Modified`` before the queryset or serializer run. Actions other than
+    list/retrieve opt in by calling ``not_modified()``.
+
+    Only the ETag validates: HTTP dates have one-second precision, so a
+    write in the same second as a client's fetch would leave its
+    If-Modified-Since matching. Last-Modified is still sent, rounded up so
+    it never predates a change.
+    """
+
+    conditional_models = ()
+
+    def get_conditional_state(self, request):
+        versions = table_versions(*self.conditional_models)
+        signature = '|'.join(f'{tabela}:{versao}' for tabela, (versao, _) in sorted(versions.items()))
+        digest = hashlib.sha1(f'{request.get_full_path()}|{signature}'.encode('utf-8')).hexdigest()
+        timestamps = [atualizado_em for _, atualizado_em in versions.values() if atualizado_em is not None]
+        last_modified = math.ceil(max(timestamps).timestamp()) if timestamps else None
+        return f'"{digest}"', last_modified
+
+    def not_modified(self, request):
+        """Return a 304 response if the client's copy is current, else None."""
+        if request.method not in ('GET', 'HEAD'):
+            return None
+        etag, _ = self.conditional_state = self.get_conditional_state(request)
+        return get_conditional_response(request, etag=etag)
+
+    def list(self, request, *args, **kwargs):
+        return self.not_modified(request) or super().list(request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.not_modified(request) or super().retrieve(request, *args, **kwargs)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        state = getattr(self, 'conditional_state', None)
+        if state is not None and response.status_code in (200, 304):
+            etag, last_modified = state
+            response['ETag'] = etag
+            if last_modified is not None:
+                response['Last-Modified'] = http_date(last_modified)
+        return response
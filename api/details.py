@@ -0,0 +1,94 @@
+from django.conf import settings
+from django.core.cache import cache
+
+from .cache import get_version
+from .models import Appointment, Anamnesis
+from .replicas import read_alias, cache_timeout
+from .serializers import ContactSerializer
+
+
+def details_cache_key(pk, alias=None):
+    """Entries built from a replica are kept apart from the primary's ones."""
+    return f'agendamento-detalhes:{alias or read_alias()}:{pk}'
+
+
+def patient_cache_namespace(paciente_id):
+    return f'paciente:{paciente_id}'
+
+
+def build_appointment_details(agendamento):
+    paciente = agendamento.paciente
+
+    # Dados do paciente
+    dados_paciente = {
+        'id': paciente.id,
+        'nome': paciente.nome,
+        'cpf': paciente.cpf,
+        'data_nascimento': paciente.data_nascimento,
+        'sexo': paciente.get_sexo_display() if paciente.sexo else None,
+        'email': paciente.email,
+        'contatos': ContactSerializer(paciente.contatos.all(), many=True).data
+    }
+
+    # Dados relevantes da anamnese
+    try:
+        anamnese = paciente.anamnese
+        dados_anamnese = {
+            'alergias': anamnese.alergias,
+            'medicamentos': anamnese.medicamentos,
+            'problemas_saude': anamnese.problemas_saude,
+            'diabetes': anamnese.diabetes,
+            'hipertensao': anamnese.hipertensao,
+            'problemas_cardiacos': anamnese.problemas_cardiacos,
+            'gestante': anamnese.gestante
+        }
+    except Anamnesis.DoesNotExist:
+        dados_anamnese = None
+
+    # Dados do agendamento
+    dados_agendamento = {
+        'id': agendamento.id,
+        'data': agendamento.data,
+        'horario': agendamento.horario,
+        'tipo': agendamento.tipo,
+        'status': agendamento.status,
+        'status_display': Appointment.STATUS_DISPLAY.get(agendamento.status, agendamento.status),
+        'duracao': agendamento.duracao,
+        'observacoes': agendamento.observacoes
+    }
+
+    return {
+        'agendamento': dados_agendamento,
+        'paciente': dados_paciente,
+        'anamnese': dados_anamnese
+    }
+
+
+def appointment_details(pk):
+    """Return the ``detalhes`` payload of an appointment, or None if it does not exist.
+
+    Built from one joined query (appointment, patient, anamnesis) plus the
+    contacts prefetch, then cached per appointment. The entry is dropped when
+    the appointment changes and ignored once the patient's version is bumped
+    (patient, contacts or anamnesis changed), see ``api.signals``.
+    """
+    key = details_cache_key(pk)
+    cached = cache.get(key)
+    if cached is not None:
+        paciente_id, version, data = cached
+        if version == get_version(patient_cache_namespace(paciente_id)):
+            return data
+
+    agendamento = (
+        Appointment.objects.select_related('paciente', 'paciente__anamnese')
+        .prefetch_related('paciente__contatos')
+        .filter(pk=pk)
+        .first()
+    )
+    if agendamento is None:
+        return None
+
+    version = get_version(patient_cache_namespace(agendamento.paciente_id))
+    data = build_appointment_details(agendamento)
+    cache.set(key, (agendamento.paciente_id, version, data), cache_timeout(getattr(settings, 'API_DETALHES_CACHE_TIMEOUT', 300)))
+    return data
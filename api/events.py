@@ -0,0 +1,98 @@
+import asyncio
+import itertools
+import json
+import threading
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils.module_loading import import_string
+
+
+class Subscription:
+    """A client's queue of agenda events for one date."""
+
+    def __init__(self, data, max_size=100):
+        self.data = data
+        self.queue = asyncio.Queue(maxsize=max_size)
+        try:
+            self.loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.loop = None
+
+    def put(self, event):
+        if self.loop is not None and self.loop.is_running():
+            self.loop.call_soon_threadsafe(self._put_nowait, event)
+        else:
+            self._put_nowait(event)
+
+    def _put_nowait(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # Slow client: drop the oldest event rather than block publishers
+            self.queue.get_nowait()
+            self.queue.put_nowait(event)
+
+    async def get(self):
+        return await self.queue.get()
+
+
+class InProcessBroker:
+    """Fan-out of agenda events to the subscribers of a date, within one process.
+
+    Publishers are model signal handlers running in sync threads; subscribers
+    are async SSE streams, so events are handed over with call_soon_threadsafe.
+    With several worker processes, point AGENDA_EVENTS_BROKER to a broker
+    backed by a shared channel instead.
+    """
+
+    def __init__(self):
+        self._subscribers = {}
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+
+    def subscribe(self, data):
+        subscription = Subscription(str(data))
+        with self._lock:
+            self._subscribers.setdefault(subscription.data, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.data)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.data]
+
+    def has_subscribers(self, data=None):
+        with self._lock:
+            if data is None:
+                return bool(self._subscribers)
+            return str(data) in self._subscribers
+
+    def publish(self, data, event):
+        event = dict(event, id=next(self._ids))
+        with self._lock:
+            subscribers = list(self._subscribers.get(str(data), ()))
+        for subscription in subscribers:
+            subscription.put(event)
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                path = getattr(settings, 'AGENDA_EVENTS_BROKER', 'api.events.InProcessBroker')
+                _broker = import_string(path)()
+    return _broker
+
+
+def format_sse(event):
+    payload = json.dumps(event, cls=DjangoJSONEncoder, ensure_ascii=False)
+    return f"id: {event['id']}\nevent: {event['tipo']}\ndata: {payload}\n\n"
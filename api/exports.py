@@ -0,0 +1,58 @@
+import csv
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+
+
+EXPORT_CHUNK_SIZE = 2000
+
+CONTENT_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson',
+}
+
+PATIENT_EXPORT_FIELDS = [
+    'id', 'nome', 'cpf', 'rg', 'data_nascimento', 'sexo', 'email', 'profissao', 'status', 'data_cadastro',
+    'endereco__cep', 'endereco__logradouro', 'endereco__numero', 'endereco__complemento',
+    'endereco__bairro', 'endereco__cidade', 'endereco__estado',
+]
+
+APPOINTMENT_EXPORT_FIELDS = [
+    'id', 'paciente_id', 'paciente__nome', 'data', 'horario', 'duracao', 'tipo', 'status', 'observacoes',
+]
+
+
+class Echo:
+    """File-like object whose write() returns the value, for streaming csv.writer output."""
+
+    def write(self, value):
+        return value
+
+
+def iter_csv(rows, fields):
+    writer = csv.writer(Echo())
+    yield writer.writerow(fields)
+    for row in rows:
+        yield writer.writerow([row[field] for field in fields])
+
+
+def iter_ndjson(rows):
+    encoder = DjangoJSONEncoder(ensure_ascii=False)
+    for row in rows:
+        yield encoder.encode(row) + '\n'
+
+
+def streaming_export(queryset, fields, formato, filename):
+    """Stream ``queryset`` as CSV or NDJSON without loading it into memory.
+
+    Rows are read as dicts through ``.values()`` with ``iterator()``, so no
+    model instances are built and memory stays constant regardless of size.
+    """
+    rows = queryset.prefetch_related(None).values(*fields).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+    if formato == 'csv':
+        content = iter_csv(rows, fields)
+    else:
+        content = iter_ndjson(rows)
+    response = StreamingHttpResponse(content, content_type=CONTENT_TYPES[formato])
+    response['Content-Disposition'] = f'attachment; filename="{filename}.{formato}"'
+    return response
@@ -0,0 +1,29 @@
+from rest_framework.response import Response
+
+from .instrumentation import measure_serializer
+from .renderers import fast_mode_enabled
+
+
+class FastListMixin:
+    """Serve ``list`` from ``.values()`` rows when API_FAST_MODE is on.
+
+    ``values_serializer_class`` must produce the same output as
+    ``serializer_class`` (see ``api.serializers.ValuesListSerializer``).
+    Used together with ``SparseFieldsMixin``.
+    """
+
+    values_serializer_class = None
+
+    def list(self, request, *args, **kwargs):
+        if not fast_mode_enabled() or self.values_serializer_class is None:
+            return super().list(request, *args, **kwargs)
+
+        values_serializer = self.values_serializer_class(self.get_sparse_fields())
+        ordering = getattr(self.paginator, 'ordering_fields', ())
+        queryset = values_serializer.prepare(self.filter_queryset(self.get_queryset()), ordering)
+        page = self.paginate_queryset(queryset)
+        with measure_serializer():
+            data = values_serializer.serialize(page if page is not None else queryset)
+        if page is not None:
+            return self.get_paginated_response(data)
+        return Response(data)
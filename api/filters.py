@@ -0,0 +1,19 @@
+from rest_framework.filters import BaseFilterBackend
+
+from .search import build_match_query, search_q
+
+
+class FullTextSearchFilter(BaseFilterBackend):
+    """Accent-insensitive, prefix-matching replacement for DRF's SearchFilter.
+
+    Uses the FTS5 shadow table of the view's model (see ``api.search``) instead of
+    ``LIKE '%x%'`` chains, so it does not scan the whole table.
+    """
+
+    search_param = 'search'
+
+    def filter_queryset(self, request, queryset, view):
+        text = request.query_params.get(self.search_param, '')
+        if not build_match_query(text):
+            return queryset
+        return queryset.filter(search_q(queryset.model, text, queryset.db))
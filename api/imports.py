@@ -0,0 +1,200 @@
+import codecs
+import csv
+import json
+
+from django.db import IntegrityError, transaction
+
+from .models import Patient, Address, Contact, Anamnesis
+from .serializers import PatientImportSerializer
+from .signals import patients_bulk_imported
+from .summary import refresh_patient_summaries
+
+
+IMPORT_BATCH_SIZE = 500
+IMPORT_FORMATS = ('csv', 'ndjson')
+# utf-8-sig also reads plain UTF-8 and drops the BOM spreadsheets add
+IMPORT_ENCODING = 'utf-8-sig'
+
+
+def check_encoding(codificacao):
+    """Return the normalized codec name, or None if Python does not know it."""
+    try:
+        return codecs.lookup(codificacao).name
+    except LookupError:
+        return None
+
+
+def parse_contacts(value):
+    """Parse the CSV ``contatos`` column: "celular:11999999999:whatsapp;residencial:1133334444"."""
+    contacts = []
+    for item in filter(None, (part.strip() for part in (value or '').split(';'))):
+        tipo, _, rest = item.partition(':')
+        numero, _, flag = rest.partition(':')
+        contacts.append({'tipo': tipo, 'numero': numero, 'is_whatsapp': flag.lower() == 'whatsapp'})
+    return contacts
+
+
+def nest_csv_row(row):
+    """Turn a flat CSV row (``endereco__cep``, ``anamnese__fumante``...) into the nested import shape."""
+    data = {}
+    for key, value in row.items():
+        if key is None or value in (None, ''):
+            continue
+        prefix, sep, field = key.partition('__')
+        if sep and prefix in ('endereco', 'anamnese'):
+            data.setdefault(prefix, {})[field] = value
+        elif key == 'contatos':
+            data['contatos'] = parse_contacts(value)
+        else:
+            data[key] = value
+    return data
+
+
+def read_rows(stream, formato):
+    """Yield (line number, row dict) from a text stream in CSV or NDJSON format.
+
+    Malformed NDJSON lines yield ``None`` as the row so they are reported as errors.
+    """
+    if formato == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, nest_csv_row(row)
+        return
+    for number, line in enumerate(stream, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            row = None
+        yield number, row if isinstance(row, dict) else None
+
+
+def batched(iterable, size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class PatientImporter:
+    """Bulk import of patients with address, contacts and anamnesis.
+
+    Rows are validated and written in batches: each batch is one transaction
+    doing a handful of bulk_create calls, whatever its size. Invalid rows are
+    reported by line number and skipped without aborting the file. A file
+    that is not in the stream's encoding stops the import at the first bad
+    byte; the batches before it stay imported and ``detail`` explains it.
+    """
+
+    def __init__(self, batch_size=IMPORT_BATCH_SIZE):
+        self.batch_size = batch_size
+        self.total = 0
+        self.imported = 0
+        self.patient_ids = []
+        self.errors = []
+        self.detail = None
+
+    def run(self, stream, formato):
+        try:
+            for batch in batched(read_rows(stream, formato), self.batch_size):
+                self.import_batch(batch)
+        except UnicodeDecodeError as exc:
+            self.detail = (
+                f'O arquivo não está na codificação {exc.encoding}. '
+                'Salve-o em UTF-8 ou informe a codificação usada (ex.: latin-1, cp1252).'
+            )
+        if self.imported:
+            # bulk_create does not send post_save, which keeps the summary columns up to date
+            refresh_patient_summaries(self.patient_ids)
+            patients_bulk_imported.send(sender=Patient, count=self.imported)
+        return self.report()
+
+    def report(self):
+        errors = sorted(self.errors, key=lambda error: error['linha'])
+        report = {'total': self.total, 'importados': self.imported, 'erros': errors}
+        if self.detail:
+            report['detail'] = self.detail
+        return report
+
+    def import_batch(self, batch):
+        valid = self.validate_batch(batch)
+        if not valid:
+            return
+        try:
+            with transaction.atomic():
+                patients = self.write(valid)
+        except IntegrityError:
+            # Retry row by row to isolate the rows that break a constraint
+            for line, data in valid:
+                try:
+                    with transaction.atomic():
+                        patients = self.write([(line, data)])
+                except IntegrityError as exc:
+                    self.errors.append({'linha': line, 'erros': {'detail': [str(exc)]}})
+                else:
+                    self.imported += 1
+                    self.patient_ids.extend(patient.pk for patient in patients)
+        else:
+            self.imported += len(valid)
+            self.patient_ids.extend(patient.pk for patient in patients)
+
+    def validate_batch(self, batch):
+        self.total += len(batch)
+        valid = []
+        for line, row in batch:
+            if row is None:
+                self.errors.append({'linha': line, 'erros': {'detail': ['Linha inválida.']}})
+                continue
+            serializer = PatientImportSerializer(data=row)
+            if serializer.is_valid():
+                valid.append((line, serializer.validated_data))
+            else:
+                self.errors.append({'linha': line, 'erros': serializer.errors})
+
+        # CPF uniqueness: one query per batch, plus duplicates inside the file
+        cpfs = [data['cpf'] for _, data in valid]
+        taken = set(Patient.objects.filter(cpf__in=cpfs).values_list('cpf', flat=True))
+        unique = []
+        for line, data in valid:
+            if data['cpf'] in taken:
+                self.errors.append({'linha': line, 'erros': {'cpf': ['Paciente com este CPF já existe.']}})
+                continue
+            taken.add(data['cpf'])
+            unique.append((line, data))
+        return unique
+
+    def write(self, rows):
+        rows = [dict(data) for _, data in rows]
+        endereco_rows = [row for row in rows if row.get('endereco')]
+        addresses = Address.objects.bulk_create([Address(**row['endereco']) for row in endereco_rows])
+        for row, address in zip(endereco_rows, addresses):
+            row['endereco'] = address
+
+        patients = Patient.objects.bulk_create([
+            Patient(**{key: value for key, value in row.items() if key not in ('contatos', 'anamnese')})
+            for row in rows
+        ])
+
+        contacts = []
+        owners = []
+        for row, patient in zip(rows, patients):
+            for contact in row.get('contatos') or []:
+                contacts.append(Contact(**contact))
+                owners.append(patient)
+        contacts = Contact.objects.bulk_create(contacts)
+        Through = Patient.contatos.through
+        Through.objects.bulk_create([
+            Through(patient_id=patient.pk, contact_id=contact.pk) for patient, contact in zip(owners, contacts)
+        ])
+
+        Anamnesis.objects.bulk_create([
+            Anamnesis(paciente=patient, **row['anamnese'])
+            for row, patient in zip(rows, patients) if row.get('anamnese')
+        ])
+        return patients
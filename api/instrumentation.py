@@ -0,0 +1,204 @@
+import logging
+import math
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from rest_framework import serializers
+
+logger = logging.getLogger('api.instrumentation')
+
+_current = ContextVar('api_request_metrics', default=None)
+
+
+class RequestMetrics:
+    """SQL and serializer cost of one request, filled in while it runs."""
+
+    __slots__ = ('started', 'queries', 'sql_ms', 'serializer_ms')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.sql_ms = 0.0
+        self.serializer_ms = 0.0
+
+    def elapsed_ms(self):
+        return (time.perf_counter() - self.started) * 1000
+
+
+@contextmanager
+def measure_serializer():
+    """Add the time spent inside the block to the current request's serializer time."""
+    metrics = _current.get()
+    if metrics is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.serializer_ms += (time.perf_counter() - start) * 1000
+
+
+class TimedListSerializer(serializers.ListSerializer):
+    @property
+    def data(self):
+        with measure_serializer():
+            return super().data
+
+
+class TimedSerializerMixin:
+    """Reports ``.data`` time to the instrumentation middleware.
+
+    Serializers using it should also set ``Meta.list_serializer_class =
+    TimedListSerializer`` so ``many=True`` is measured too.
+    """
+
+    @property
+    def data(self):
+        with measure_serializer():
+            return super().data
+
+
+def _count_query(metrics):
+    def wrapper(execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            metrics.queries += 1
+            metrics.sql_ms += (time.perf_counter() - start) * 1000
+    return wrapper
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not values:
+        return None
+    rank = max(1, math.ceil(pct / 100 * len(values)))
+    return values[rank - 1]
+
+
+class MetricsStore:
+    """Last ``max_samples`` requests per endpoint, kept in process memory."""
+
+    percentiles = (50, 95, 99)
+
+    def __init__(self, max_samples):
+        self.max_samples = max_samples
+        self._lock = threading.Lock()
+        self._samples = defaultdict(lambda: deque(maxlen=self.max_samples))
+
+    def record(self, tag, total_ms, metrics):
+        with self._lock:
+            self._samples[tag].append((total_ms, metrics.sql_ms, metrics.serializer_ms, metrics.queries))
+
+    def reset(self):
+        with self._lock:
+            self._samples.clear()
+
+    def report(self):
+        with self._lock:
+            samples = {tag: list(values) for tag, values in self._samples.items()}
+        report = {}
+        for tag, values in sorted(samples.items()):
+            columns = dict(zip(('total_ms', 'sql_ms', 'serializer_ms', 'queries'), zip(*values)))
+            entry = {'requisicoes': len(values)}
+            for name, column in columns.items():
+                column = sorted(column)
+                entry[name] = {f'p{pct}': round(percentile(column, pct), 2) for pct in self.percentiles}
+                entry[name]['max'] = round(column[-1], 2)
+            report[tag] = entry
+        return report
+
+
+store = MetricsStore(getattr(settings, 'API_METRICS_SAMPLES', 1000))
+
+
+def endpoint_tag(request):
+    """``ViewSet.action`` for DRF views, the URL name for everything else."""
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'nao_resolvido'
+    cls = getattr(match.func, 'cls', None)
+    if cls is None:
+        return match.view_name
+    actions = getattr(match.func, 'actions', None) or {}
+    return f'{cls.__name__}.{actions.get(request.method.lower(), request.method.lower())}'
+
+
+class InstrumentationMiddleware:
+    """Per-request query count, SQL time, serializer time and total latency.
+
+    Adds a ``Server-Timing`` header, aggregates percentiles per endpoint in
+    ``store`` (see ``/api/debug/metricas/``) and logs requests over
+    ``API_QUERY_BUDGET`` queries or ``API_LATENCY_BUDGET_MS`` milliseconds.
+
+    Streaming responses are not consumed: their numbers cover the work done
+    until the headers are sent.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.query_budget = getattr(settings, 'API_QUERY_BUDGET', 0)
+        self.latency_budget_ms = getattr(settings, 'API_LATENCY_BUDGET_MS', 0)
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        try:
+            with self.count_queries(metrics):
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, metrics)
+
+    async def __acall__(self, request):
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        try:
+            with self.count_queries(metrics):
+                response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, metrics)
+
+    def count_queries(self, metrics):
+        stack = ExitStack()
+        wrapper = _count_query(metrics)
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(wrapper))
+        return stack
+
+    def finish(self, request, response, metrics):
+        total_ms = metrics.elapsed_ms()
+        tag = endpoint_tag(request)
+        store.record(tag, total_ms, metrics)
+
+        response['Server-Timing'] = ', '.join([
+            f'db;dur={metrics.sql_ms:.1f};desc="{metrics.queries} queries"',
+            f'serializer;dur={metrics.serializer_ms:.1f}',
+            f'total;dur={total_ms:.1f}',
+        ])
+
+        over_queries = self.query_budget and metrics.queries > self.query_budget
+        over_latency = self.latency_budget_ms and total_ms > self.latency_budget_ms
+        if over_queries or over_latency:
+            logger.warning(
+                'Over budget: %s %s (%s) %d queries, %.1f ms total, %.1f ms SQL, %.1f ms serializer',
+                request.method, request.get_full_path(), tag,
+                metrics.queries, total_ms, metrics.sql_ms, metrics.serializer_ms,
+            )
+        return response
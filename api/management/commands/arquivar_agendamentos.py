@@ -0,0 +1,45 @@
+import datetime
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from api.archive import archivable, archive_appointments
+
+
+class Command(BaseCommand):
+    help = (
+        "Move appointments older than the cutoff with a terminal status (concluido, cancelado, "
+        "nao_compareceu) to the archive table, in chunked transactions. "
+        "They remain available in /api/pacientes/{id}/historico/."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dias', type=int, default=getattr(settings, 'ARCHIVE_DIAS', 365),
+                            help='Archive appointments older than this many days (ARCHIVE_DIAS)')
+        parser.add_argument('--antes', help='Cutoff date YYYY-MM-DD, overriding --dias')
+        parser.add_argument('--lote', type=int, default=1000, help='Appointments per transaction')
+        parser.add_argument('--simular', action='store_true', help='Only count what would be archived')
+
+    def handle(self, *args, **options):
+        if options['antes']:
+            try:
+                antes = datetime.date.fromisoformat(options['antes'])
+            except ValueError:
+                raise CommandError('Data inválida em --antes. Use YYYY-MM-DD.')
+        else:
+            antes = timezone.localdate() - datetime.timedelta(days=options['dias'])
+
+        if options['simular']:
+            self.stdout.write(f'{archivable(antes).count()} agendamentos seriam arquivados (antes de {antes}).')
+            return
+
+        began = time.perf_counter()
+        total = archive_appointments(
+            antes, options['lote'],
+            on_chunk=lambda total: self.stdout.write(f'  {total} arquivados...') if options['verbosity'] > 1 else None,
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'{total} agendamentos anteriores a {antes} arquivados em {time.perf_counter() - began:.2f} s.'
+        ))
@@ -0,0 +1,46 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.models import Patient
+from api.summary import LOTE, overdue_patients, refresh_patient_summaries
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the appointment summary of the patients (ultima_visita, proxima_visita, "
+        "total_visitas, total_faltas). Without options every patient is rebuilt (backfill); "
+        "--vencidos only refreshes patients whose next visit has passed, for a daily cron."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--vencidos', action='store_true',
+                            help='Only patients whose proxima_visita is before today')
+        parser.add_argument('--lote', type=int, default=LOTE * 10, help='Patients read per batch')
+
+    def handle(self, *args, **options):
+        began = time.perf_counter()
+        total = changed = 0
+        for ids in self.batches(options['vencidos'], options['lote']):
+            changed += refresh_patient_summaries(ids)
+            total += len(ids)
+            if options['verbosity'] > 1:
+                self.stdout.write(f'  {total} pacientes verificados...')
+        self.stdout.write(self.style.SUCCESS(
+            f'{total} pacientes verificados, {changed} resumos atualizados em {time.perf_counter() - began:.2f} s.'
+        ))
+
+    def batches(self, vencidos, lote):
+        if vencidos:
+            # Usually few rows: read them at once through the (proxima_visita, id) index
+            ids = sorted(overdue_patients().values_list('pk', flat=True))
+            for start in range(0, len(ids), lote):
+                yield ids[start:start + lote]
+            return
+        last_id = 0
+        while True:
+            ids = list(Patient.objects.filter(pk__gt=last_id).order_by('pk').values_list('pk', flat=True)[:lote])
+            if not ids:
+                return
+            yield ids
+            last_id = ids[-1]
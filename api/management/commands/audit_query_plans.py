@@ -0,0 +1,171 @@
+import datetime
+import re
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.utils import timezone
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from api.models import Patient, Appointment, Address, Contact, Anamnesis
+from api.archive import archivable, patient_history
+from api.stats import daily_totals_queryset
+from api.summary import overdue_patients
+from api.views import PatientViewSet, AppointmentViewSet
+
+
+SCAN_RE = re.compile(r'\bSCAN (?:TABLE )?"?(\w+)"?(.*)$')
+ALIAS_RE = re.compile(r'"(\w+)" (?:AS )?"?([A-Z]\d+)"?')
+
+
+class Command(BaseCommand):
+    help = (
+        "Run EXPLAIN QUERY PLAN over the querysets generated by the API viewsets "
+        "and fail if any of them does a full table scan on a large table. Walking an "
+        "index under a LIMIT (first page of a keyset list) is not counted as a full scan."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--min-rows', type=int, default=1000,
+            help='Only full scans on tables with at least this many rows fail the audit (default: 1000).',
+        )
+        parser.add_argument('--database', default='default')
+        parser.add_argument('--show-plans', action='store_true', help='Print the full plan of every query.')
+
+    def handle(self, *args, **options):
+        connection = connections[options['database']]
+        if connection.vendor != 'sqlite':
+            raise CommandError('audit_query_plans only supports SQLite (EXPLAIN QUERY PLAN).')
+
+        self.database = options['database']
+        table_sizes = {}
+        failures = []
+
+        for label, queryset, reads_whole_table in self.get_querysets():
+            queryset = queryset.using(self.database)
+            limited = queryset.query.high_mark is not None
+            sql, params = queryset.query.sql_with_params()
+            aliases = {alias: table for table, alias in ALIAS_RE.findall(sql)}
+            with connection.cursor() as cursor:
+                cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+                details = [row[-1] for row in cursor.fetchall()]
+
+            problems = []
+            for detail in details:
+                match = SCAN_RE.search(detail)
+                if not match or reads_whole_table:
+                    continue
+                if limited and 'USING' in match.group(2):
+                    continue
+                if 'VIRTUAL TABLE' in match.group(2):
+                    # FTS5 MATCH lookups go through the full-text index
+                    continue
+                table = aliases.get(match.group(1), match.group(1))
+                if table not in table_sizes:
+                    table_sizes[table] = self.count_rows(connection, table)
+                if table_sizes[table] >= options['min_rows']:
+                    problems.append(f'full scan on {table} ({table_sizes[table]} rows)')
+
+            if problems:
+                failures.append(label)
+                self.stdout.write(self.style.ERROR(f'FAIL {label}: {"; ".join(problems)}'))
+            else:
+                self.stdout.write(self.style.SUCCESS(f'ok   {label}'))
+            if options['show_plans'] or problems:
+                for detail in details:
+                    self.stdout.write(f'       {detail}')
+
+        if failures:
+            raise CommandError(f'{len(failures)} queryset(s) do full table scans: {", ".join(failures)}')
+
+    def count_rows(self, connection, table):
+        known = {model._meta.db_table for model in (Patient, Appointment, Address, Contact, Anamnesis)}
+        known.add(Patient.contatos.through._meta.db_table)
+        if table not in known:
+            return 0
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT COUNT(*) FROM {connection.ops.quote_name(table)}')
+            return cursor.fetchone()[0]
+
+    def build_view(self, viewset_class, action, params=None):
+        request = Request(APIRequestFactory().get('/', params or {}))
+        view = viewset_class()
+        view.request = request
+        view.action = action
+        view.format_kwarg = None
+        view.kwargs = {}
+        view.args = ()
+        return view
+
+    def sample_appointment_position(self):
+        first = Appointment.objects.using(self.database).order_by('data', 'horario', 'id').first()
+        if first is None:
+            return [timezone.localdate().isoformat(), '08:00', '0']
+        return [first.data.isoformat(), first.horario, str(first.id)]
+
+    def sample_patient_position(self):
+        first = Patient.objects.using(self.database).order_by('nome', 'id').first()
+        if first is None:
+            return ['A', '0']
+        return [first.nome, str(first.id)]
+
+    def get_querysets(self):
+        """Yield (label, queryset, reads_whole_table) for every query shape the viewsets issue.
+
+        ``reads_whole_table`` marks queries whose result is the whole table
+        (the unpaginated legacy lists), where a scan is expected.
+        """
+        today = timezone.localdate().isoformat()
+
+        # Patients
+        view = self.build_view(PatientViewSet, 'list')
+        paginator = view.paginator
+        queryset = view.filter_queryset(view.get_queryset())
+        position = self.sample_patient_position()
+        yield 'pacientes list (legacy)', queryset, True
+        yield 'pacientes list (first page)', paginator.get_page_queryset(queryset), False
+        yield 'pacientes list (next page)', paginator.get_page_queryset(queryset, position), False
+        yield 'pacientes list (previous page)', paginator.get_page_queryset(queryset, position, reverse=True), False
+        view = self.build_view(PatientViewSet, 'list', {'search': 'silva'})
+        yield 'pacientes list ?search=', view.filter_queryset(view.get_queryset()), False
+        view = self.build_view(PatientViewSet, 'retrieve')
+        yield 'pacientes retrieve', view.get_queryset().filter(pk=1), False
+        for ordering, params in (
+                (('ultima_visita', 'id'), {'ultima_visita_antes': today}),
+                (('proxima_visita', 'id'), {'com_proxima_visita': 'true'}),
+                (('-total_faltas', '-id'), {'min_faltas': '1'})):
+            view = self.build_view(PatientViewSet, 'list', params)
+            view.paginator.ordering = ordering
+            query = '&'.join(f'{key}=' for key in params)
+            yield f'pacientes list ?ordenar={ordering[0]}&{query}', view.paginator.get_page_queryset(
+                view.filter_queryset(view.get_queryset())), False
+        yield 'resumo pacientes (vencidos)', overdue_patients().values_list('pk', flat=True), False
+
+        # Appointments
+        view = self.build_view(AppointmentViewSet, 'list')
+        paginator = view.paginator
+        queryset = view.filter_queryset(view.get_queryset())
+        position = self.sample_appointment_position()
+        yield 'agendamentos list (legacy)', queryset, True
+        yield 'agendamentos list (first page)', paginator.get_page_queryset(queryset), False
+        yield 'agendamentos list (next page)', paginator.get_page_queryset(queryset, position), False
+        yield 'agendamentos list (previous page)', paginator.get_page_queryset(queryset, position, reverse=True), False
+        for params in ({'data': today}, {'status': 'agendado'}, {'data': today, 'status': 'agendado'},
+                       {'busca': 'silva'}):
+            view = self.build_view(AppointmentViewSet, 'list', params)
+            query = '&'.join(f'{key}=' for key in params)
+            yield f'agendamentos list ?{query}', view.filter_queryset(view.get_queryset()), False
+        view = self.build_view(AppointmentViewSet, 'proximas', {'data': today})
+        yield 'agendamentos proximas', view.get_queryset().filter(data=today), False
+        view = self.build_view(AppointmentViewSet, 'retrieve')
+        yield 'agendamentos retrieve', view.get_queryset().filter(pk=1), False
+
+        # totais-diarios
+        day = timezone.localdate()
+        yield 'totais-diarios (dia)', daily_totals_queryset(day, day), False
+        yield 'totais-diarios (intervalo)', daily_totals_queryset(day, day + datetime.timedelta(days=30)), False
+
+        # Archive
+        yield 'pacientes historico', patient_history(1), False
+        yield 'arquivamento (lote)', archivable(day).order_by('id').values_list('id', flat=True)[:1000], False
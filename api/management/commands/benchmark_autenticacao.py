@@ -0,0 +1,64 @@
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.test import APIRequestFactory
+from rest_framework.views import APIView
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.tokens import AccessToken
+
+from api.authentication import CachedJWTAuthentication, token_cache
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure the per-request cost of JWT authentication (an authenticated no-op DRF view) with "
+        "JWTAuthentication and with CachedJWTAuthentication. The test user is rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requisicoes', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            user = get_user_model().objects.create_user('benchmark-autenticacao', password='x')
+            token = str(AccessToken.for_user(user))
+            results = {}
+            for authentication_class in (JWTAuthentication, CachedJWTAuthentication):
+                token_cache.clear()
+                results[authentication_class.__name__] = self.measure(authentication_class, token, options['requisicoes'])
+            transaction.set_rollback(True)
+
+        self.stdout.write(f'{options["requisicoes"]} requisições autenticadas:')
+        for name, (per_request, queries) in results.items():
+            self.stdout.write(f'  {name:<26} {per_request:8.1f} µs/req  {queries} queries/req')
+        before, after = (per_request for per_request, _ in results.values())
+        self.stdout.write(f'  speedup: {before / after:.1f}x')
+
+    def measure(self, authentication_class, token, requisicoes):
+        class Ping(APIView):
+            authentication_classes = [authentication_class]
+            permission_classes = [IsAuthenticated]
+
+            def get(self, request):
+                return Response({'ok': True})
+
+        view = Ping.as_view()
+        factory = APIRequestFactory()
+
+        def call():
+            response = view(factory.get('/ping/', HTTP_AUTHORIZATION=f'Bearer {token}'))
+            assert response.status_code == 200, response.data
+
+        call()  # warm up (and fill the cache for the cached class)
+        with CaptureQueriesContext(connection) as queries:
+            call()
+        begin = time.perf_counter()
+        for _ in range(requisicoes):
+            call()
+        elapsed = time.perf_counter() - begin
+        return elapsed / requisicoes * 1e6, len(queries)
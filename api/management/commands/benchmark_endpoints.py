@@ -0,0 +1,204 @@
+import datetime
+import json
+import random
+import subprocess
+import time
+from contextlib import ExitStack
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.models import Max
+from django.test import Client
+from django.utils import timezone
+
+from api.instrumentation import percentile
+from api.models import Patient, Appointment
+
+# The endpoint mix of scripts/test_endpoints.py followed by the main agenda screens.
+# Placeholders are filled per request from a seeded sample of existing rows.
+ENDPOINTS = {
+    'pacientes': '/api/pacientes/',
+    'enderecos': '/api/enderecos/',
+    'contatos': '/api/contatos/',
+    'anamneses': '/api/anamneses/',
+    'agendamentos': '/api/agendamentos/',
+    'paciente': '/api/pacientes/{paciente}/',
+    'paciente_busca': '/api/pacientes/?search={nome}',
+    'agendamentos_dia': '/api/agendamentos/?data={data}',
+    'agendamento_detalhes': '/api/agendamentos/{agendamento}/detalhes/',
+    'proximas': '/api/agendamentos/proximas/?data={data}',
+    'disponibilidade': '/api/agendamentos/disponibilidade/?inicio={data}&fim={data_fim}',
+    'totais_diarios': '/api/agendamentos/totais-diarios/?inicio={data}&fim={data_fim}',
+}
+DEFAULT_RESULTS = settings.BASE_DIR / 'benchmarks' / 'resultados.jsonl'
+
+
+def git_revision():
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+        dirty = subprocess.run(
+            ['git', 'status', '--porcelain', '--untracked-files=no'], cwd=settings.BASE_DIR,
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return f'{commit}-dirty' if dirty else commit
+
+
+class Command(BaseCommand):
+    help = (
+        "Replay the API endpoint mix with Django's test client against the current database and report "
+        "throughput and p50/p95/p99 latency per endpoint. Results are appended to a JSON lines file "
+        "and compared with the previous run. Generate data first with gerar_dados_clinica."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requisicoes', type=int, default=50, help='Requests per endpoint')
+        parser.add_argument('--aquecimento', type=int, default=3, help='Untimed requests per endpoint')
+        parser.add_argument('--endpoints', help=f'Comma-separated subset of: {", ".join(ENDPOINTS)}')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--saida', default=str(DEFAULT_RESULTS), help='JSON lines file with the run history')
+        parser.add_argument('--nao-salvar', action='store_true')
+        parser.add_argument('--limite', type=float, default=20.0, help='p95 increase (%%) reported as regression')
+        parser.add_argument('--falhar-em-regressao', action='store_true')
+
+    def handle(self, *args, **options):
+        names = list(ENDPOINTS)
+        if options['endpoints']:
+            names = [name.strip() for name in options['endpoints'].split(',') if name.strip()]
+            invalid = sorted(set(names) - set(ENDPOINTS))
+            if invalid:
+                raise CommandError(f'Endpoints inválidos: {invalid}. Valores válidos: {list(ENDPOINTS)}')
+        if options['requisicoes'] <= 0:
+            raise CommandError('--requisicoes deve ser maior que zero.')
+
+        rng = random.Random(options['seed'])
+        samples = self.sample_rows(rng)
+        # 'localhost' is in ALLOWED_HOSTS; the default 'testserver' is not outside the test runner
+        client = Client(SERVER_NAME='localhost')
+
+        for _ in range(options['aquecimento']):
+            for name in names:
+                self.request(client, name, self.build_url(name, samples, rng))
+
+        timings = {name: [] for name in names}
+        queries = {name: [] for name in names}
+        for _ in range(options['requisicoes']):
+            for name in names:
+                elapsed, count = self.request(client, name, self.build_url(name, samples, rng))
+                timings[name].append(elapsed)
+                queries[name].append(count)
+
+        results = {}
+        for name in names:
+            values = sorted(timings[name])
+            results[name] = {
+                'requisicoes': len(values),
+                'req_por_s': round(len(values) / (sum(values) / 1000), 1),
+                'p50_ms': round(percentile(values, 50), 2),
+                'p95_ms': round(percentile(values, 95), 2),
+                'p99_ms': round(percentile(values, 99), 2),
+                'queries': max(queries[name]),
+            }
+
+        run = {
+            'commit': git_revision(),
+            'data': timezone.now().isoformat(timespec='seconds'),
+            'fast_mode': getattr(settings, 'API_FAST_MODE', False),
+            'pacientes': Patient.objects.count(),
+            'agendamentos': Appointment.objects.count(),
+            'endpoints': results,
+        }
+        previous = self.previous_run(options['saida'])
+        regressions = self.report(run, previous, options['limite'])
+        if not options['nao_salvar']:
+            self.save(options['saida'], run)
+        if regressions and options['falhar_em_regressao']:
+            raise CommandError(f'Regressão de p95 acima de {options["limite"]}%: {", ".join(regressions)}')
+
+    def sample_rows(self, rng, size=100):
+        """Seeded sample of existing patients and appointments, stable across runs on the same data."""
+        patients, appointment_ids = [], []
+        for model, sample, fields in ((Patient, patients, ('id', 'nome')), (Appointment, appointment_ids, ('id',))):
+            maior = model.objects.aggregate(maior=Max('id'))['maior']
+            if maior is None:
+                raise CommandError('Banco sem pacientes ou agendamentos. Rode gerar_dados_clinica antes.')
+            for _ in range(size):
+                row = model.objects.filter(id__gte=rng.randint(1, maior)).order_by('id').values_list(*fields).first()
+                sample.append(row if len(fields) > 1 else row[0])
+        return {'pacientes': patients, 'agendamentos': appointment_ids}
+
+    def build_url(self, name, samples, rng):
+        paciente, nome = rng.choice(samples['pacientes'])
+        data = timezone.localdate() + datetime.timedelta(days=rng.randrange(-30, 30))
+        return ENDPOINTS[name].format(
+            paciente=paciente, nome=nome.split()[-1], agendamento=rng.choice(samples['agendamentos']),
+            data=data.isoformat(), data_fim=(data + datetime.timedelta(days=6)).isoformat(),
+        )
+
+    def request(self, client, name, url):
+        count = 0
+
+        def count_queries(execute, sql, params, many, context):
+            nonlocal count
+            count += 1
+            return execute(sql, params, many, context)
+
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(count_queries))
+            begin = time.perf_counter()
+            response = client.get(url, HTTP_ACCEPT='application/json')
+            if response.streaming:
+                b''.join(response.streaming_content)
+            else:
+                response.content
+            elapsed = (time.perf_counter() - begin) * 1000
+        if response.status_code >= 400:
+            raise CommandError(f'{name}: GET {url} retornou {response.status_code}')
+        return elapsed, count
+
+    def previous_run(self, path):
+        try:
+            with open(path, encoding='utf-8') as history:
+                lines = [line for line in history if line.strip()]
+        except FileNotFoundError:
+            return None
+        return json.loads(lines[-1]) if lines else None
+
+    def report(self, run, previous, limite):
+        self.stdout.write(
+            f'commit {run["commit"] or "?"} | {run["pacientes"]} pacientes, {run["agendamentos"]} agendamentos'
+            f' | fast_mode={run["fast_mode"]}'
+        )
+        if previous:
+            self.stdout.write(f'comparando com {previous.get("commit") or "?"} ({previous.get("data")})')
+        self.stdout.write(
+            f'{"endpoint":<22} {"req/s":>8} {"p50 ms":>9} {"p95 ms":>9} {"p99 ms":>9} {"queries":>8} {"Δp95":>8}'
+        )
+        regressions = []
+        for name, result in run['endpoints'].items():
+            delta = ''
+            before = (previous or {}).get('endpoints', {}).get(name)
+            if before and before.get('p95_ms'):
+                change = (result['p95_ms'] - before['p95_ms']) / before['p95_ms'] * 100
+                delta = f'{change:+.0f}%'
+                if change > limite:
+                    regressions.append(name)
+            line = (
+                f'{name:<22} {result["req_por_s"]:>8} {result["p50_ms"]:>9} {result["p95_ms"]:>9} '
+                f'{result["p99_ms"]:>9} {result["queries"]:>8} {delta:>8}'
+            )
+            self.stdout.write(self.style.ERROR(line) if name in regressions else line)
+        return regressions
+
+    def save(self, path, run):
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, 'a', encoding='utf-8') as history:
+            history.write(json.dumps(run, ensure_ascii=False) + '\n')
+        self.stdout.write(f'resultado salvo em {path}')
@@ -0,0 +1,55 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test.utils import override_settings
+from rest_framework.test import APIClient
+
+from api.models import Patient
+
+
+FIRST_NAMES = ['João', 'José', 'Maria', 'Ana', 'Luís', 'Antônio', 'Francisca', 'Conceição', 'Márcia', 'Sérgio']
+LAST_NAMES = ['Silva', 'Santos', 'Oliveira', 'Souza', 'Araújo', 'Gonçalves', 'Conceição', 'Lima', 'Ribeiro', 'Simões']
+QUERIES = ['joao', 'conceicao', 'sil', 'maria arau', 'sergio simoes']
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure GET /api/pacientes/?search= latency at growing table sizes. "
+        "Synthetic patients are created inside a transaction that is rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+        parser.add_argument('--repeat', type=int, default=20, help='Requests per query and size (default: 20).')
+
+    def handle(self, *args, **options):
+        client = APIClient()
+        rng = random.Random(42)
+        with override_settings(ALLOWED_HOSTS=['testserver']), transaction.atomic():
+            created = 0
+            for size in sorted(options['sizes']):
+                batch = []
+                while created < size:
+                    batch.append(Patient(
+                        nome=f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)} {rng.choice(LAST_NAMES)}',
+                        # 7xx: gerar_dados_clinica uses 9xx and benchmark_serializacao 8xx
+                        cpf=f'{70000000000 + created:011d}',
+                    ))
+                    created += 1
+                Patient.objects.bulk_create(batch, batch_size=1000)
+
+                timings = []
+                for query in QUERIES:
+                    for _ in range(options['repeat']):
+                        start = time.perf_counter()
+                        response = client.get('/api/pacientes/', {'search': query, 'page_size': 20})
+                        timings.append((time.perf_counter() - start) * 1000)
+                        assert response.status_code == 200, response.content
+                self.stdout.write(
+                    f'{size:>8} pacientes: p50={statistics.median(timings):.2f}ms '
+                    f'max={max(timings):.2f}ms'
+                )
+            transaction.set_rollback(True)
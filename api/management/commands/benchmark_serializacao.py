@@ -0,0 +1,93 @@
+import datetime
+import json
+import random
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from rest_framework.renderers import JSONRenderer
+
+from api.models import Patient, Appointment, Address, Contact, Anamnesis
+from api.renderers import FastJSONRenderer, orjson
+from api.serializers import (
+    AppointmentSerializer, PatientSerializer, AppointmentValuesSerializer, PatientValuesSerializer,
+)
+from api.views import AppointmentViewSet, PatientViewSet
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare list serialization time (ModelSerializer + JSONRenderer vs .values() rows + "
+        "FastJSONRenderer). Synthetic data is created inside a transaction that is rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--agendamentos', type=int, default=10000)
+        parser.add_argument('--pacientes', type=int, default=2000)
+        parser.add_argument('--repeat', type=int, default=3)
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"orjson: {'instalado' if orjson else 'ausente (fallback para json da stdlib)'}")
+        with transaction.atomic():
+            self.create_data(options['pacientes'], options['agendamentos'])
+            self.compare(
+                'agendamentos', AppointmentViewSet.queryset, AppointmentSerializer, AppointmentValuesSerializer,
+                options['repeat'],
+            )
+            self.compare(
+                'pacientes', PatientViewSet.queryset, PatientSerializer, PatientValuesSerializer, options['repeat'],
+            )
+            transaction.set_rollback(True)
+
+    def create_data(self, pacientes, agendamentos):
+        rng = random.Random(42)
+        addresses = Address.objects.bulk_create([
+            Address(cep='01001000', logradouro=f'Rua {i}', numero=str(i), bairro='Centro', cidade='São Paulo', estado='SP')
+            for i in range(pacientes)
+        ])
+        patients = Patient.objects.bulk_create([
+            Patient(nome=f'Paciente {i:06d}', cpf=f'{80000000000 + i:011d}', endereco=address)
+            for i, address in enumerate(addresses)
+        ])
+        contacts = Contact.objects.bulk_create([
+            Contact(tipo='celular', numero=f'119{i:08d}', is_whatsapp=True) for i in range(pacientes)
+        ])
+        Patient.contatos.through.objects.bulk_create([
+            Patient.contatos.through(patient_id=patient.pk, contact_id=contact.pk)
+            for patient, contact in zip(patients, contacts)
+        ])
+        Anamnesis.objects.bulk_create([Anamnesis(paciente=patient) for patient in patients[::2]])
+        start = datetime.date(2024, 1, 1)
+        Appointment.objects.bulk_create([
+            Appointment(
+                paciente=rng.choice(patients), data=start + datetime.timedelta(days=i // 20),
+                horario=f'{8 + (i % 20) // 2:02d}:{30 * (i % 2):02d}', tipo='Consulta',
+            )
+            for i in range(agendamentos)
+        ], batch_size=1000)
+
+    def compare(self, label, queryset, serializer_class, values_serializer_class, repeat):
+        def standard():
+            return JSONRenderer().render(serializer_class(list(queryset.all()), many=True).data)
+
+        def fast():
+            values_serializer = values_serializer_class()
+            return FastJSONRenderer().render(values_serializer.serialize(values_serializer.prepare(queryset.all())))
+
+        if json.loads(standard()) != json.loads(fast()):
+            raise CommandError(f'{label}: the fast path output differs from the ModelSerializer output')
+
+        results = {}
+        for name, func in (('ModelSerializer + JSONRenderer', standard), ('values() + FastJSONRenderer', fast)):
+            timings = []
+            for _ in range(repeat):
+                begin = time.perf_counter()
+                func()
+                timings.append(time.perf_counter() - begin)
+            results[name] = min(timings) * 1000
+        count = queryset.count()
+        before, after = results.values()
+        self.stdout.write(f'{label} ({count} linhas):')
+        for name, elapsed in results.items():
+            self.stdout.write(f'  {name:<32} {elapsed:8.1f} ms')
+        self.stdout.write(f'  speedup: {before / after:.1f}x')
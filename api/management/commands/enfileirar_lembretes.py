@@ -0,0 +1,25 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from api.reminders import enqueue_reminders
+
+
+class Command(BaseCommand):
+    help = (
+        "Queue WhatsApp/SMS reminders for the appointments starting in the next --horas hours. "
+        "Safe to run repeatedly (e.g. hourly from cron): appointments already queued are skipped."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--horas', type=int, default=getattr(settings, 'REMINDER_HORAS', 24))
+
+    def handle(self, *args, **options):
+        began = time.perf_counter()
+        result = enqueue_reminders(options['horas'])
+        self.stdout.write(
+            f'{result["agendamentos"]} agendamentos nas próximas {options["horas"]} h: '
+            f'enfileirados={result["enfileirados"]} ja_enfileirados={result["ja_enfileirados"]} '
+            f'sem_contato={result["sem_contato"]} em {time.perf_counter() - began:.2f} s'
+        )
@@ -0,0 +1,203 @@
+import datetime
+import random
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from api.models import Patient, Appointment, Address, Contact, Anamnesis
+from api.signals import patients_bulk_imported
+from api.summary import refresh_patient_summaries
+from api.versions import bump_table_versions
+
+NOMES = [
+    'Ana', 'Beatriz', 'Bruno', 'Camila', 'Carlos', 'Daniela', 'Eduardo', 'Fernanda', 'Gabriel', 'Gabriela',
+    'Helena', 'Igor', 'Isabela', 'João', 'Júlia', 'Lucas', 'Luiza', 'Marcos', 'Mariana', 'Mateus',
+    'Natália', 'Paulo', 'Pedro', 'Rafael', 'Renata', 'Rodrigo', 'Sofia', 'Thiago', 'Vinícius', 'Yasmin',
+]
+SOBRENOMES = [
+    'Almeida', 'Alves', 'Araújo', 'Barbosa', 'Cardoso', 'Carvalho', 'Castro', 'Costa', 'Dias', 'Fernandes',
+    'Ferreira', 'Gomes', 'Lima', 'Martins', 'Melo', 'Moreira', 'Nascimento', 'Oliveira', 'Pereira', 'Ribeiro',
+    'Rocha', 'Rodrigues', 'Santos', 'Silva', 'Soares', 'Souza', 'Teixeira', 'Vieira',
+]
+BAIRROS = ['Centro', 'Jardim América', 'Vila Nova', 'Boa Vista', 'Santa Cecília', 'Liberdade', 'Mooca', 'Pinheiros']
+CIDADES = [('São Paulo', 'SP'), ('Campinas', 'SP'), ('Santos', 'SP'), ('Rio de Janeiro', 'RJ'), ('Belo Horizonte', 'MG')]
+TIPOS_CONSULTA = [
+    ('Consulta', 30), ('Limpeza', 45), ('Restauração', 60), ('Canal', 90),
+    ('Extração', 60), ('Clareamento', 60), ('Avaliação ortodôntica', 30), ('Manutenção aparelho', 30),
+]
+# Opening hours in minutes since midnight; appointments start on the 30-minute grid.
+# The clinic has a single agenda, so a day fits about 11 appointments.
+ABERTURA, FECHAMENTO, GRADE = 8 * 60, 18 * 60, 30
+STATUS_PASSADOS = [('concluido', 80), ('nao_compareceu', 8), ('cancelado', 8), ('remarcado', 4)]
+STATUS_FUTUROS = [('agendado', 70), ('confirmado', 25), ('cancelado', 5)]
+
+
+def weighted(rng, choices):
+    values, weights = zip(*choices)
+    return rng.choices(values, weights)[0]
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate a synthetic clinic (patients, addresses, contacts, anamneses and appointments) "
+        "with bulk_create, for load testing. Seeded, so the same options produce the same data. "
+        "Appointments never overlap (one agenda, like the API enforces), so their number is bounded "
+        "by the days in the window: about 11 per working day at full occupancy."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pacientes', type=int, default=50000)
+        parser.add_argument('--agendamentos', type=int,
+                            help='Stop after this many appointments (default: fill the window)')
+        parser.add_argument('--anos', type=float, default=10, help='History length, ending today')
+        parser.add_argument('--dias-futuros', type=int, default=90)
+        parser.add_argument('--ocupacao', type=float, default=0.85, help='Share of the free slots that get booked')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Rows per transaction')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        if options['pacientes'] <= 0 or options['batch_size'] <= 0:
+            raise CommandError('--pacientes e --batch-size devem ser maiores que zero.')
+        if not 0 < options['ocupacao'] <= 1:
+            raise CommandError('--ocupacao deve estar entre 0 e 1.')
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        began = time.perf_counter()
+
+        # One transaction per batch: the SQLite write lock is never held for
+        # the whole run, and a failure keeps the batches already written
+        patient_ids = self.create_patients(options['pacientes'])
+        created = self.create_appointments(
+            patient_ids, options['agendamentos'], options['anos'], options['dias_futuros'], options['ocupacao'],
+        )
+        # bulk_create skips post_save: fill the summary columns and invalidate
+        # caches and ETags once for the whole run
+        self.stdout.write('  resumos dos pacientes...')
+        refresh_patient_summaries(patient_ids)
+        patients_bulk_imported.send(sender=Patient, count=len(patient_ids))
+        bump_table_versions(Appointment)
+
+        if options['agendamentos'] is not None and created < options['agendamentos']:
+            self.stdout.write(self.style.WARNING(
+                f'Só {created} agendamentos cabem na janela sem sobreposição; aumente --anos para gerar mais.'
+            ))
+        self.stdout.write(self.style.SUCCESS(
+            f'{len(patient_ids)} pacientes e {created} agendamentos criados '
+            f'em {time.perf_counter() - began:.1f} s.'
+        ))
+
+    def batches(self, total):
+        for start in range(0, total, self.batch_size):
+            yield start, min(start + self.batch_size, total)
+
+    def create_patients(self, total):
+        rng = self.rng
+        # CPFs continue after the existing rows so the command can be run more than once;
+        # 9xx is this command's range (benchmark_search uses 7xx, benchmark_serializacao 8xx)
+        offset = (Patient.objects.aggregate(maior=Max('id'))['maior'] or 0) + 1
+        patient_ids = []
+        for start, end in self.batches(total):
+            with transaction.atomic():
+                patient_ids.extend(self.create_patient_batch(rng, offset, start, end))
+            self.stdout.write(f'  pacientes: {end}/{total}')
+        return patient_ids
+
+    def create_patient_batch(self, rng, offset, start, end):
+        count = end - start
+        addresses = Address.objects.bulk_create([
+            Address(
+                cep=f'{rng.randrange(1000000, 99999999):08d}', logradouro=f'Rua {rng.choice(SOBRENOMES)}',
+                numero=str(rng.randrange(1, 3000)), bairro=rng.choice(BAIRROS),
+                cidade=cidade, estado=estado,
+            )
+            for cidade, estado in (rng.choice(CIDADES) for _ in range(count))
+        ])
+        patients = []
+        for index, address in zip(range(start, end), addresses):
+            nome = f'{rng.choice(NOMES)} {rng.choice(SOBRENOMES)} {rng.choice(SOBRENOMES)}'
+            patients.append(Patient(
+                nome=nome, cpf=f'{90000000000 + offset + index:011d}',
+                data_nascimento=datetime.date(rng.randrange(1940, 2020), rng.randrange(1, 13), rng.randrange(1, 29)),
+                sexo=rng.choice('MF'), email=f'paciente{offset + index}@exemplo.com.br',
+                endereco=address if rng.random() < 0.9 else None,
+                status='ativo' if rng.random() < 0.9 else 'inativo',
+            ))
+        patients = Patient.objects.bulk_create(patients)
+
+        contacts, links = [], []
+        for patient in patients:
+            for tipo in ['celular'] + (['residencial'] if rng.random() < 0.3 else []):
+                contacts.append(Contact(tipo=tipo, numero=f'119{rng.randrange(10 ** 8):08d}', is_whatsapp=tipo == 'celular'))
+                links.append(patient.pk)
+        contacts = Contact.objects.bulk_create(contacts)
+        Patient.contatos.through.objects.bulk_create([
+            Patient.contatos.through(patient_id=patient_id, contact_id=contact.pk)
+            for patient_id, contact in zip(links, contacts)
+        ])
+        Anamnesis.objects.bulk_create([
+            Anamnesis(
+                paciente=patient, fumante=rng.random() < 0.15, diabetes=rng.random() < 0.08,
+                hipertensao=rng.random() < 0.2, usa_fio_dental=rng.random() < 0.5,
+                frequencia_escovacao=rng.choice(['1x ao dia', '2x ao dia', '3x ao dia']),
+            )
+            for patient in patients if rng.random() < 0.6
+        ])
+        return [patient.pk for patient in patients]
+
+    def free_days(self, anos, dias_futuros):
+        """Working days of the window with no appointment yet, in random order so a
+        --agendamentos cap still spreads over past and future."""
+        today = timezone.localdate()
+        first_day = today - datetime.timedelta(days=int(anos * 365))
+        last_day = today + datetime.timedelta(days=dias_futuros)
+        # Days booked by an earlier run are left alone rather than overbooked
+        taken = set(Appointment.objects.filter(data__range=(first_day, last_day)).values_list('data', flat=True).distinct())
+        days = [
+            day for day in (first_day + datetime.timedelta(days=offset) for offset in range((last_day - first_day).days + 1))
+            if day.weekday() != 6 and day not in taken
+        ]
+        self.rng.shuffle(days)
+        return days
+
+    def day_schedule(self, day, ocupacao):
+        """(horario, tipo, duracao) of back-to-back, non-overlapping appointments for one day."""
+        rng = self.rng
+        cursor = ABERTURA
+        while cursor < FECHAMENTO:
+            if rng.random() >= ocupacao:
+                cursor += GRADE
+                continue
+            tipo, duracao = rng.choice([choice for choice in TIPOS_CONSULTA if cursor + choice[1] <= FECHAMENTO])
+            yield f'{cursor // 60:02d}:{cursor % 60:02d}', tipo, duracao
+            cursor += -(-duracao // GRADE) * GRADE
+
+    def create_appointments(self, patient_ids, total, anos, dias_futuros, ocupacao):
+        rng = self.rng
+        today = timezone.localdate()
+        created = 0
+        batch = []
+        for day in self.free_days(anos, dias_futuros):
+            for horario, tipo, duracao in self.day_schedule(day, ocupacao):
+                appointment = Appointment(
+                    paciente_id=rng.choice(patient_ids), data=day, horario=horario, tipo=tipo, duracao=duracao,
+                    status=weighted(rng, STATUS_PASSADOS if day < today else STATUS_FUTUROS),
+                )
+                # bulk_create does not call save(), which derives the slot columns
+                appointment.update_slot()
+                batch.append(appointment)
+                created += 1
+                if len(batch) >= self.batch_size:
+                    Appointment.objects.bulk_create(batch)
+                    batch = []
+                    self.stdout.write(f'  agendamentos: {created}')
+                if created == total:
+                    break
+            if created == total:
+                break
+        if batch:
+            Appointment.objects.bulk_create(batch)
+        self.stdout.write(f'  agendamentos: {created}')
+        return created
@@ -0,0 +1,37 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.imports import PatientImporter, IMPORT_BATCH_SIZE, IMPORT_ENCODING, IMPORT_FORMATS, check_encoding
+
+
+class Command(BaseCommand):
+    help = "Bulk import patients (address, contacts, anamnesis) from a CSV or NDJSON file."
+
+    def add_arguments(self, parser):
+        parser.add_argument('arquivo')
+        parser.add_argument('--formato', choices=IMPORT_FORMATS, help='Defaults to the file extension.')
+        parser.add_argument('--lote', type=int, default=IMPORT_BATCH_SIZE,
+                            help=f'Rows per transaction (default: {IMPORT_BATCH_SIZE}).')
+        parser.add_argument('--codificacao', default=IMPORT_ENCODING,
+                            help='Text encoding of the file, e.g. latin-1 or cp1252 (default: UTF-8).')
+
+    def handle(self, *args, **options):
+        path = options['arquivo']
+        formato = options['formato'] or path.rsplit('.', 1)[-1].lower()
+        if formato not in IMPORT_FORMATS:
+            raise CommandError(f'Formato inválido: {formato}. Use --formato {"/".join(IMPORT_FORMATS)}.')
+        codificacao = check_encoding(options['codificacao'])
+        if codificacao is None:
+            raise CommandError(f'Codificação inválida: {options["codificacao"]}.')
+
+        with open(path, encoding=codificacao, newline='') as stream:
+            report = PatientImporter(batch_size=options['lote']).run(stream, formato)
+
+        for error in report['erros']:
+            self.stderr.write(f"linha {error['linha']}: {json.dumps(error['erros'], ensure_ascii=False)}")
+        if 'detail' in report:
+            self.stderr.write(f"{report['detail']} Use --codificacao.")
+        self.stdout.write(self.style.SUCCESS(
+            f"{report['importados']} de {report['total']} pacientes importados, {len(report['erros'])} com erro."
+        ))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from api.models import Tombstone
+from api.sync import tombstone_retention
+
+
+class Command(BaseCommand):
+    help = "Delete sync tombstones older than SYNC_TOMBSTONE_DIAS (clients that old get a full snapshot)."
+
+    def handle(self, *args, **options):
+        deleted, _ = Tombstone.objects.filter(removido_em__lt=timezone.now() - tombstone_retention()).delete()
+        self.stdout.write(self.style.SUCCESS(f'{deleted} tombstones removidos.'))
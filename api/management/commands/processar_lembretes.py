@@ -0,0 +1,47 @@
+import time
+
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.module_loading import import_string
+
+from api.reminders import ReminderWorker
+
+
+class Command(BaseCommand):
+    help = (
+        "Send the queued reminders through REMINDER_TRANSPORT in batches, from several threads, "
+        "with retries and a rate limit. Exits when nothing is due, unless --continuo."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, help='Reminders claimed per batch (REMINDER_LOTE)')
+        parser.add_argument('--workers', type=int, help='Sending threads (REMINDER_WORKERS)')
+        parser.add_argument('--taxa', type=float, help='Messages per second, 0 for no limit (REMINDER_TAXA)')
+        parser.add_argument('--max-tentativas', type=int, help='REMINDER_MAX_TENTATIVAS')
+        parser.add_argument('--transporte', help='Dotted path of the transport class, overriding REMINDER_TRANSPORT')
+        parser.add_argument('--continuo', action='store_true', help='Keep polling the queue')
+        parser.add_argument('--intervalo', type=float, default=30, help='Seconds between polls with --continuo')
+
+    def handle(self, *args, **options):
+        transport = import_string(options['transporte'])() if options['transporte'] else None
+        try:
+            worker = ReminderWorker(
+                transport=transport, lote=options['lote'], workers=options['workers'],
+                taxa=options['taxa'], max_tentativas=options['max_tentativas'],
+            )
+        except ImproperlyConfigured as exc:
+            raise CommandError(f'{exc} Nenhum lembrete foi enviado.')
+        while True:
+            began = time.perf_counter()
+            totals = worker.run()
+            elapsed = time.perf_counter() - began
+            if totals or not options['continuo']:
+                processed = sum(totals.values())
+                self.stdout.write(
+                    f'{processed} lembretes em {elapsed:.2f} s ({processed / elapsed if elapsed else 0:.0f}/s): '
+                    f'enviados={totals["enviado"]} reagendados={totals["pendente"]} falharam={totals["falhou"]} '
+                    f'obsoletos={totals["obsoleto"]}'
+                )
+            if not options['continuo']:
+                return
+            time.sleep(options['intervalo'])
@@ -0,0 +1,60 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:15
+
+import re
+
+from django.db import migrations, models
+
+
+HORARIO_RE = re.compile(r'^\s*(\d{1,2})\s*(?:[:hH]\s*(\d{2})?)?(?::\d{2})?\s*$')
+
+
+def fill_time_slots(apps, schema_editor):
+    """Derive inicio/fim minutes from the free-form horario strings.
+
+    Parseable values are also normalized to HH:MM so string ordering on
+    horario matches chronological order. Unparseable rows are left with a
+    null slot.
+    """
+    Appointment = apps.get_model('api', 'Appointment')
+    batch = []
+    for appointment in Appointment.objects.only('id', 'horario', 'duracao').iterator(chunk_size=1000):
+        match = HORARIO_RE.match(appointment.horario or '')
+        if not match:
+            continue
+        hours, minutes = int(match.group(1)), int(match.group(2) or 0)
+        if hours > 23 or minutes > 59:
+            continue
+        appointment.inicio_minutos = hours * 60 + minutes
+        appointment.fim_minutos = appointment.inicio_minutos + max(appointment.duracao or 0, 0)
+        appointment.horario = f'{hours:02d}:{minutes:02d}'
+        batch.append(appointment)
+        if len(batch) >= 1000:
+            Appointment.objects.bulk_update(batch, ['horario', 'inicio_minutos', 'fim_minutos'])
+            batch = []
+    if batch:
+        Appointment.objects.bulk_update(batch, ['horario', 'inicio_minutos', 'fim_minutos'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_appointment_patient_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='appointment',
+            name='fim_minutos',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='appointment',
+            name='inicio_minutos',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['data', 'inicio_minutos', 'fim_minutos'], name='appointment_slot_idx'),
+        ),
+        migrations.RunPython(fill_time_slots, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,69 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:21
+
+from importlib import import_module
+
+from django.db import migrations, models
+
+search_fts = import_module('api.migrations.0005_search_fts')
+
+
+def restore_fts_triggers(apps, schema_editor):
+    """Recreate the FTS5 sync triggers and reindex.
+
+    SQLite rebuilds a table to add or alter a column (as the AddField and
+    AlterField below do), which drops the triggers created in 0005 and
+    leaves the search index stale.
+    """
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for source, table, columns in search_fts.FTS_TABLES:
+        for suffix in ('ai', 'ad', 'au'):
+            schema_editor.execute(f'DROP TRIGGER IF EXISTS {table}_{suffix}')
+        # Skip the CREATE VIRTUAL TABLE, the index table itself survives
+        for statement in search_fts.fts_statements(source, table, columns)[1:]:
+            schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_tableversion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Tombstone',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tabela', models.CharField(max_length=50)),
+                ('objeto_id', models.IntegerField()),
+                ('removido_em', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='address',
+            name='atualizado_em',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+        migrations.AddField(
+            model_name='appointment',
+            name='atualizado_em',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+        migrations.AddField(
+            model_name='contact',
+            name='atualizado_em',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+        migrations.AddField(
+            model_name='patient',
+            name='atualizado_em',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+        migrations.AlterField(
+            model_name='anamnesis',
+            name='data_atualizacao',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+        migrations.RunPython(restore_fts_triggers, migrations.RunPython.noop),
+    ]
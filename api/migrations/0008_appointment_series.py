@@ -0,0 +1,62 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:37
+
+import api.models
+import django.db.models.deletion
+from importlib import import_module
+
+from django.db import migrations, models
+
+# The appointment_serie_ocorrencia_unique constraint rebuilds api_appointment
+# on SQLite, dropping its FTS triggers again (see 0007)
+sync_timestamps = import_module('api.migrations.0007_sync_timestamps_tombstone')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_sync_timestamps_tombstone'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='appointment',
+            name='data_original',
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='AppointmentSeries',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(max_length=100)),
+                ('horario', models.CharField(max_length=10)),
+                ('duracao', models.IntegerField(default=30)),
+                ('observacoes', models.TextField(blank=True, null=True)),
+                ('frequencia', models.CharField(choices=[('semanal', 'Semanal'), ('mensal', 'Mensal')], max_length=10)),
+                ('intervalo', models.PositiveIntegerField(default=1)),
+                ('inicio', models.DateField()),
+                ('quantidade', models.PositiveIntegerField(blank=True, null=True)),
+                ('ate', models.DateField(blank=True, null=True)),
+                ('fim', models.DateField(blank=True, editable=False, null=True)),
+                ('inicio_minutos', models.PositiveIntegerField(blank=True, editable=False, null=True)),
+                ('fim_minutos', models.PositiveIntegerField(blank=True, editable=False, null=True)),
+                ('criado_em', models.DateTimeField(auto_now_add=True)),
+                ('atualizado_em', models.DateTimeField(auto_now=True, db_index=True)),
+                ('paciente', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='series', to='api.patient')),
+            ],
+            bases=(api.models.TimeSlotMixin, models.Model),
+        ),
+        migrations.AddField(
+            model_name='appointment',
+            name='serie',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='ocorrencias', to='api.appointmentseries'),
+        ),
+        migrations.AddConstraint(
+            model_name='appointment',
+            constraint=models.UniqueConstraint(fields=('serie', 'data_original'), name='appointment_serie_ocorrencia_unique'),
+        ),
+        migrations.AddIndex(
+            model_name='appointmentseries',
+            index=models.Index(fields=['inicio', 'fim'], name='series_periodo_idx'),
+        ),
+        migrations.RunPython(sync_timestamps.restore_fts_triggers, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:44
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_reminder'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedAppointment',
+            fields=[
+                ('id', models.IntegerField(primary_key=True, serialize=False)),
+                ('data', models.DateField()),
+                ('horario', models.CharField(max_length=10)),
+                ('tipo', models.CharField(max_length=100)),
+                ('status', models.CharField(choices=[('agendado', 'Agendado'), ('confirmado', 'Confirmado'), ('em_andamento', 'Em Andamento'), ('concluido', 'Concluído'), ('cancelado', 'Cancelado'), ('remarcado', 'Remarcado'), ('nao_compareceu', 'Não Compareceu')], max_length=20)),
+                ('observacoes', models.TextField(blank=True, null=True)),
+                ('duracao', models.IntegerField(default=30)),
+                ('inicio_minutos', models.PositiveIntegerField(blank=True, null=True)),
+                ('fim_minutos', models.PositiveIntegerField(blank=True, null=True)),
+                ('atualizado_em', models.DateTimeField()),
+                ('data_original', models.DateField(blank=True, null=True)),
+                ('arquivado_em', models.DateTimeField(auto_now_add=True)),
+                ('paciente', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='agendamentos_arquivados', to='api.patient')),
+                ('serie', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='ocorrencias_arquivadas', to='api.appointmentseries')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['paciente', 'data'], name='archived_paciente_data_idx'), models.Index(fields=['data'], name='archived_data_idx'), models.Index(fields=['serie', 'data_original'], name='archived_serie_ocorrencia_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:50
+
+from importlib import import_module
+
+from django.db import migrations, models
+
+# Adding NOT NULL columns rebuilds api_patient on SQLite, dropping its FTS triggers
+sync_timestamps = import_module('api.migrations.0007_sync_timestamps_tombstone')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_archived_appointment'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='patient',
+            name='proxima_visita',
+            field=models.DateField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='patient',
+            name='total_faltas',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='patient',
+            name='total_visitas',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='patient',
+            name='ultima_visita',
+            field=models.DateField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='patient',
+            index=models.Index(fields=['ultima_visita', 'id'], name='patient_ultima_visita_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='patient',
+            index=models.Index(fields=['proxima_visita', 'id'], name='patient_proxima_visita_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='patient',
+            index=models.Index(fields=['total_faltas', 'id'], name='patient_total_faltas_idx'),
+        ),
+        migrations.RunPython(sync_timestamps.restore_fts_triggers, migrations.RunPython.noop),
+    ]
@@ -1,7 +1,27 @@
+import re
+
 from django.db import models
 from django.core.validators import RegexValidator
 
 
+HORARIO_RE = re.compile(r'^\s*(\d{1,2})\s*(?:[:hH]\s*(\d{2})?)?(?::\d{2})?\s*$')
+
+
+def parse_horario(value):
+    """Parse a free-form time such as "14:00", "9:30" or "14h" into minutes since midnight."""
+    match = HORARIO_RE.match(value or '')
+    if not match:
+        raise ValueError(f'Horário inválido: {value!r}')
+    hours, minutes = int(match.group(1)), int(match.group(2) or 0)
+    if hours > 23 or minutes > 59:
+        raise ValueError(f'Horário inválido: {value!r}')
+    return hours * 60 + minutes
+
+
+def format_horario(minutes):
+    return f'{minutes // 60:02d}:{minutes % 60:02d}'
+
+
 class Address(models.Model):
     cep = models.CharField(max_length=8)
     logradouro = models.CharField(max_length=255)
@@ -10,6 +30,7 @@ class Address(models.Model):
     bairro = models.CharField(max_length=100)
     cidade = models.CharField(max_length=100)
     estado = models.CharField(max_length=2)
+    atualizado_em = models.DateTimeField(auto_now=True, db_index=True)
 
     def __str__(self):
         return f"{self.logradouro}, {self.numero} - {self.cidade}/{self.estado}"
@@ -27,11 +48,16 @@ class Contact(models.Model):
     numero = models.CharField(max_length=20)
     is_whatsapp = models.BooleanField(default=False)
     observacao = models.CharField(max_length=100, blank=True, null=True)
+    atualizado_em = models.DateTimeField(auto_now=True, db_index=True)
 
     def __str__(self):
         return f"{self.get_tipo_display()}: {self.numero}"
 
 
+# Patient columns derived from the appointments (see api.summary)
+SUMMARY_FIELDS = ('ultima_visita', 'proxima_visita', 'total_visitas', 'total_faltas')
+
+
 class Patient(models.Model):
     STATUS_CHOICES = [
         ('ativo', 'Ativo'),
@@ -74,14 +100,41 @@ class Patient(models.Model):
     alergias = models.TextField(blank=True, null=True)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="ativo")
     data_cadastro = models.DateTimeField(auto_now_add=True)
+    atualizado_em = models.DateTimeField(auto_now=True, db_index=True)
+
+    # Appointment summary, kept up to date from the appointment signals (see api.summary)
+    ultima_visita = models.DateField(blank=True, null=True, editable=False)
+    proxima_visita = models.DateField(blank=True, null=True, editable=False)
+    total_visitas = models.PositiveIntegerField(default=0, editable=False)
+    total_faltas = models.PositiveIntegerField(default=0, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['nome', 'id'], name='patient_nome_idx'),
+            models.Index(fields=['status'], name='patient_status_idx'),
+            models.Index(fields=['ultima_visita', 'id'], name='patient_ultima_visita_idx'),
+            models.Index(fields=['proxima_visita', 'id'], name='patient_proxima_visita_idx'),
+            models.Index(fields=['total_faltas', 'id'], name='patient_total_faltas_idx'),
+        ]
 
     def __str__(self):
         return self.nome
 
+    def save(self, *args, **kwargs):
+        # The summary is written by api.summary only: a copy loaded before a
+        # refresh must not put the old values back
+        if not self._state.adding and kwargs.get('update_fields') is None and not kwargs.get('force_insert'):
+            deferred = self.get_deferred_fields()
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in SUMMARY_FIELDS and field.attname not in deferred
+            ]
+        super().save(*args, **kwargs)
+
 
 class Anamnesis(models.Model):
     paciente = models.OneToOneField(Patient, on_delete=models.CASCADE, related_name='anamnese')
-    data_atualizacao = models.DateTimeField(auto_now=True)
+    data_atualizacao = models.DateTimeField(auto_now=True, db_index=True)
     problemas_saude = models.TextField(blank=True, null=True)
     medicamentos = models.TextField(blank=True, null=True)
     alergias = models.TextField(blank=True, null=True)
@@ -107,7 +160,33 @@ class Anamnesis(models.Model):
         return f"Anamnese - {self.paciente.nome}"
 
 
-class Appointment(models.Model):
+class TimeSlotMixin:
+    """Derives inicio_minutos / fim_minutos from horario and duracao."""
+
+    def update_slot(self):
+        try:
+            self.inicio_minutos = parse_horario(self.horario)
+        except ValueError:
+            self.inicio_minutos = self.fim_minutos = None
+            return
+        self.fim_minutos = self.inicio_minutos + max(self.duracao or 0, 0)
+
+
+class AppointmentQuerySet(models.QuerySet):
+    def blocking(self):
+        """Appointments that occupy their time slot."""
+        return self.exclude(status__in=Appointment.NON_BLOCKING_STATUSES)
+
+    def overlapping(self, data, inicio, fim):
+        """Blocking appointments on ``data`` whose [inicio, fim) intersects the given one.
+
+        Served by the (data, inicio_minutos, fim_minutos) index: a range seek on
+        the day plus ``inicio_minutos < fim``.
+        """
+        return self.blocking().filter(data=data, inicio_minutos__lt=fim, fim_minutos__gt=inicio)
+
+
+class Appointment(TimeSlotMixin, models.Model):
     paciente = models.ForeignKey(Patient, related_name="agendamentos", on_delete=models.CASCADE)
     data = models.DateField()
     horario = models.CharField(max_length=10)
@@ -121,9 +200,210 @@ class Appointment(models.Model):
         ('remarcado', 'Remarcado'),
         ('nao_compareceu', 'Não Compareceu'),
     ]
+    STATUS_DISPLAY = dict(STATUS_CHOICES)
+    # Statuses that free the time slot for other bookings
+    NON_BLOCKING_STATUSES = ('cancelado', 'remarcado')
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='agendado')
     observacoes = models.TextField(blank=True, null=True)
     duracao = models.IntegerField(default=30)
+    # Normalized slot in minutes since midnight, derived from horario/duracao on save
+    inicio_minutos = models.PositiveIntegerField(blank=True, null=True, editable=False)
+    fim_minutos = models.PositiveIntegerField(blank=True, null=True, editable=False)
+    atualizado_em = models.DateTimeField(auto_now=True, db_index=True)
+    # Set on occurrences of a recurring series that were edited (materialized);
+    # data_original is the occurrence date this row replaces.
+    serie = models.ForeignKey(
+        'AppointmentSeries', related_name='ocorrencias', on_delete=models.SET_NULL, blank=True, null=True,
+    )
+    data_original = models.DateField(blank=True, null=True)
+
+    objects = AppointmentQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['data', 'horario', 'id'], name='appointment_data_horario_idx'),
+            models.Index(fields=['status', 'data'], name='appointment_status_data_idx'),
+            models.Index(fields=['data', 'inicio_minutos', 'fim_minutos'], name='appointment_slot_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['serie', 'data_original'], name='appointment_serie_ocorrencia_unique'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the loaded values so signal handlers can tell what changed
+        instance._loaded_values = {
+            name: value for name, value in zip(field_names, values) if name in ('data', 'status', 'paciente_id')
+        }
+        return instance
+
+    def save(self, *args, **kwargs):
+        self.update_slot()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            update_fields = set(update_fields) | {'atualizado_em'}
+            if {'horario', 'duracao'} & update_fields:
+                update_fields |= {'inicio_minutos', 'fim_minutos'}
+            kwargs['update_fields'] = update_fields
+        super().save(*args, **kwargs)
+        # Every post_save handler compared against the loaded values; the saved
+        # ones are the baseline for the next save
+        self._loaded_values = {'data': self.data, 'status': self.status, 'paciente_id': self.paciente_id}
+
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        super().refresh_from_db(using=using, fields=fields, from_queryset=from_queryset)
+        # The reloaded values are the baseline, as in from_db
+        self._loaded_values = {**getattr(self, '_loaded_values', {}), **{
+            name: getattr(self, name) for name in ('data', 'status', 'paciente_id')
+            if fields is None or name in fields or name.removesuffix('_id') in fields
+        }}
 
     def __str__(self):
         return f"{self.paciente.nome} - {self.data} {self.horario}"
+
+
+class AppointmentSeries(TimeSlotMixin, models.Model):
+    """Recurring appointment stored as a single rule (RRULE-style).
+
+    Occurrences are expanded on demand for the requested window (see
+    ``api.recurrence``); an ``Appointment`` row is only created for an
+    occurrence once it is edited or its status changes.
+    """
+    FREQUENCIA_CHOICES = [
+        ('semanal', 'Semanal'),
+        ('mensal', 'Mensal'),
+    ]
+
+    paciente = models.ForeignKey(Patient, related_name="series", on_delete=models.CASCADE)
+    tipo = models.CharField(max_length=100)
+    horario = models.CharField(max_length=10)
+    duracao = models.IntegerField(default=30)
+    observacoes = models.TextField(blank=True, null=True)
+    frequencia = models.CharField(max_length=10, choices=FREQUENCIA_CHOICES)
+    intervalo = models.PositiveIntegerField(default=1)
+    inicio = models.DateField()
+    # At most one of them; neither means the series has no end
+    quantidade = models.PositiveIntegerField(blank=True, null=True)
+    ate = models.DateField(blank=True, null=True)
+    # Last occurrence date when bounded, derived on save; lets window queries skip ended series
+    fim = models.DateField(blank=True, null=True, editable=False)
+    inicio_minutos = models.PositiveIntegerField(blank=True, null=True, editable=False)
+    fim_minutos = models.PositiveIntegerField(blank=True, null=True, editable=False)
+    criado_em = models.DateTimeField(auto_now_add=True)
+    atualizado_em = models.DateTimeField(auto_now=True, db_index=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['inicio', 'fim'], name='series_periodo_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        from .recurrence import last_occurrence
+
+        self.update_slot()
+        self.fim = last_occurrence(self)
+        super().save(*args, **kwargs)
+
+    def __str__(self):
+        return f"{self.paciente.nome} - {self.get_frequencia_display()} {self.horario}"
+
+
+class ArchivedAppointment(models.Model):
+    """Appointment moved out of ``Appointment`` by ``arquivar_agendamentos``
+    (see api.archive): past and in a terminal status.
+
+    Keeps the original id and columns, so history reads can combine both
+    tables with a UNION.
+    """
+    id = models.IntegerField(primary_key=True)
+    paciente = models.ForeignKey(Patient, related_name="agendamentos_arquivados", on_delete=models.CASCADE)
+    data = models.DateField()
+    horario = models.CharField(max_length=10)
+    tipo = models.CharField(max_length=100)
+    status = models.CharField(max_length=20, choices=Appointment.STATUS_CHOICES)
+    observacoes = models.TextField(blank=True, null=True)
+    duracao = models.IntegerField(default=30)
+    inicio_minutos = models.PositiveIntegerField(blank=True, null=True)
+    fim_minutos = models.PositiveIntegerField(blank=True, null=True)
+    atualizado_em = models.DateTimeField()
+    serie = models.ForeignKey(
+        AppointmentSeries, related_name='ocorrencias_arquivadas', on_delete=models.SET_NULL, blank=True, null=True,
+    )
+    data_original = models.DateField(blank=True, null=True)
+    arquivado_em = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['paciente', 'data'], name='archived_paciente_data_idx'),
+            models.Index(fields=['data'], name='archived_data_idx'),
+            models.Index(fields=['serie', 'data_original'], name='archived_serie_ocorrencia_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.paciente.nome} - {self.data} {self.horario} (arquivado)"
+
+
+class TableVersion(models.Model):
+    """Change counter per table, bumped on every write (see api.signals).
+
+    Lets list endpoints build ETag / Last-Modified headers with one small
+    query instead of hashing the response body.
+    """
+    tabela = models.CharField(max_length=100, primary_key=True)
+    versao = models.BigIntegerField(default=0)
+    atualizado_em = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.tabela} v{self.versao}"
+
+
+class Tombstone(models.Model):
+    """Record of a deleted row, so delta sync clients can drop it (see api.sync)."""
+    tabela = models.CharField(max_length=50)
+    objeto_id = models.IntegerField()
+    removido_em = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return f"{self.tabela} #{self.objeto_id} removido em {self.removido_em}"
+
+
+class Reminder(models.Model):
+    """Queued appointment reminder, sent by ``processar_lembretes`` (see api.reminders)."""
+    CANAL_CHOICES = [
+        ('whatsapp', 'WhatsApp'),
+        ('sms', 'SMS'),
+    ]
+    STATUS_CHOICES = [
+        ('pendente', 'Pendente'),
+        ('enviando', 'Enviando'),
+        ('enviado', 'Enviado'),
+        ('falhou', 'Falhou'),
+        ('obsoleto', 'Obsoleto'),
+    ]
+
+    # Identifies the appointment occurrence (stored appointment or series occurrence)
+    # at its date and time, so enqueueing twice is a no-op and a reschedule gets a new reminder
+    chave = models.CharField(max_length=100, unique=True)
+    paciente = models.ForeignKey(Patient, related_name='lembretes', on_delete=models.CASCADE)
+    agendamento = models.ForeignKey(Appointment, related_name='lembretes', on_delete=models.CASCADE, blank=True, null=True)
+    serie = models.ForeignKey(AppointmentSeries, related_name='lembretes', on_delete=models.CASCADE, blank=True, null=True)
+    canal = models.CharField(max_length=10, choices=CANAL_CHOICES)
+    destino = models.CharField(max_length=20)
+    mensagem = models.TextField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pendente')
+    tentativas = models.PositiveIntegerField(default=0)
+    proxima_tentativa_em = models.DateTimeField()
+    enviado_em = models.DateTimeField(blank=True, null=True)
+    id_externo = models.CharField(max_length=100, blank=True, null=True)
+    erro = models.TextField(blank=True, null=True)
+    criado_em = models.DateTimeField(auto_now_add=True)
+    atualizado_em = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'proxima_tentativa_em'], name='reminder_fila_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_canal_display()} para {self.destino} ({self.status})"
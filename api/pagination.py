@@ -0,0 +1,246 @@
+import base64
+import json
+from types import SimpleNamespace
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models import F, Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+
+
+class KeysetPagination(BasePagination):
+    """Keyset (seek) pagination over a fixed, unique ordering.
+
+    Each page is fetched with ``WHERE (ordering) > (last row seen)`` instead of
+    an OFFSET, so deep pages cost the same as the first one as long as the
+    ordering columns are indexed. The last field of ``ordering`` must be unique
+    (usually ``id``) to break ties. Fields prefixed with '-' sort descending;
+    nullable fields sort NULL as the smallest value.
+
+    Cursors are opaque base64 tokens. Passing ``?paginar=false`` disables
+    pagination and returns the plain list, as the API did before.
+    """
+
+    ordering = ('id',)
+    page_size = getattr(settings, 'API_PAGE_SIZE', 50)
+    max_page_size = getattr(settings, 'API_MAX_PAGE_SIZE', 500)
+    page_size_query_param = 'page_size'
+    cursor_query_param = 'cursor'
+    legacy_query_param = 'paginar'
+    invalid_cursor_message = 'Cursor inválido.'
+
+    def paginate_queryset(self, queryset, request, view=None, extra_rows=None):
+        """``extra_rows`` are objects not stored in ``queryset`` (e.g. virtual
+        occurrences of recurring appointments) to page through along with it."""
+        if self.is_legacy_request(request):
+            return None
+
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        position, reverse = self.decode_cursor(request)
+
+        rows = list(self.get_page_queryset(queryset, position, reverse))
+        if extra_rows:
+            rows = self.merge_rows(queryset.model, rows, extra_rows, position, reverse)
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if reverse:
+            rows.reverse()
+
+        if reverse:
+            self.has_next = position is not None
+            self.has_previous = has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = position is not None
+
+        fields = [queryset.model._meta.get_field(name) for name in self.ordering_fields]
+        if rows:
+            self.next_position = self.get_position(rows[-1], fields)
+            self.previous_position = self.get_position(rows[0], fields)
+        else:
+            # Empty page: both directions continue from the requested position.
+            self.next_position = self.previous_position = position
+
+        self.page = rows
+        return rows
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def is_legacy_request(self, request):
+        value = request.query_params.get(self.legacy_query_param)
+        return value is not None and value.lower() in ('0', 'false', 'nao', 'não')
+
+    def get_page_size(self, request):
+        value = request.query_params.get(self.page_size_query_param)
+        if value:
+            try:
+                size = int(value)
+            except ValueError:
+                return self.page_size
+            if size > 0:
+                return min(size, self.max_page_size)
+        return self.page_size
+
+    @property
+    def ordering_fields(self):
+        return [name.lstrip('-') for name in self.ordering]
+
+    def get_ordering_columns(self, model, reverse=False):
+        """(name, descending, nullable) per ordering field, ``reverse`` flipping the direction."""
+        return [
+            (name.lstrip('-'), name.startswith('-') != reverse, model._meta.get_field(name.lstrip('-')).null)
+            for name in self.ordering
+        ]
+
+    def get_order_by(self, model, reverse=False):
+        expressions = []
+        for name, descending, null in self.get_ordering_columns(model, reverse):
+            if not null:
+                expressions.append(f'-{name}' if descending else name)
+            elif descending:
+                expressions.append(F(name).desc(nulls_last=True))
+            else:
+                expressions.append(F(name).asc(nulls_first=True))
+        return expressions
+
+    def get_page_queryset(self, queryset, position=None, reverse=False):
+        """Return the sliced queryset for one page (plus one row to detect more)."""
+        queryset = queryset.order_by(*self.get_order_by(queryset.model, reverse))
+        if position is not None:
+            values = self.decode_position(queryset.model, position)
+            queryset = queryset.filter(self.get_keyset_filter(queryset.model, values, reverse))
+        return queryset[:self.page_size + 1]
+
+    def decode_position(self, model, position):
+        fields = [model._meta.get_field(name) for name in self.ordering_fields]
+        try:
+            values = [None if value is None else field.to_python(value) for field, value in zip(fields, position)]
+        except (ValidationError, TypeError, ValueError):
+            # Tampered cursor, e.g. a list where a date is expected
+            raise NotFound(self.invalid_cursor_message)
+        if any(value is None and not field.null for field, value in zip(fields, values)):
+            raise NotFound(self.invalid_cursor_message)
+        return values
+
+    def get_row_key(self, row):
+        """Ordering values of a row, compared in Python when merging extra rows."""
+        return tuple(getattr(row, name) for name in self.ordering_fields)
+
+    def merge_rows(self, model, rows, extra_rows, position, reverse):
+        if position is not None:
+            values = tuple(self.decode_position(model, position))
+            if reverse:
+                extra_rows = [row for row in extra_rows if self.get_row_key(row) < values]
+            else:
+                extra_rows = [row for row in extra_rows if self.get_row_key(row) > values]
+        rows = sorted([*rows, *extra_rows], key=self.get_row_key, reverse=reverse)
+        return rows[:self.page_size + 1]
+
+    def get_keyset_filter(self, model, values, reverse):
+        """Expand ``(a, b, c) > (x, y, z)`` into an OR of ANDs.
+
+        "Greater" follows each field's direction. The redundant ``a >= x``
+        bound lets SQLite seek into the index instead of walking it from the
+        start.
+        """
+        columns = self.get_ordering_columns(model, reverse)
+        condition = Q()
+        for index, (name, descending, null) in enumerate(columns):
+            clause = self.get_after_filter(name, values[index], descending, null)
+            for (previous_name, _, _), previous_value in zip(columns[:index], values[:index]):
+                if previous_value is None:
+                    clause &= Q(**{f'{previous_name}__isnull': True})
+                else:
+                    clause &= Q(**{previous_name: previous_value})
+            condition |= clause
+        name, descending, null = columns[0]
+        return self.get_bound_filter(name, values[0], descending, null) & condition
+
+    def get_after_filter(self, name, value, descending, null):
+        """Rows strictly after ``value`` on one field (NULL is the smallest value)."""
+        if not descending:
+            return Q(**{f'{name}__isnull': False}) if value is None else Q(**{f'{name}__gt': value})
+        if value is None:
+            return Q(pk__in=[])
+        clause = Q(**{f'{name}__lt': value})
+        return clause | Q(**{f'{name}__isnull': True}) if null else clause
+
+    def get_bound_filter(self, name, value, descending, null):
+        """Rows at or after ``value`` on the first field."""
+        if not descending:
+            return Q() if value is None else Q(**{f'{name}__gte': value})
+        if value is None:
+            return Q(**{f'{name}__isnull': True})
+        clause = Q(**{f'{name}__lte': value})
+        return clause | Q(**{f'{name}__isnull': True}) if null else clause
+
+    def get_position(self, obj, fields):
+        if isinstance(obj, dict):
+            # .values() rows (see api.serializers.ValuesListSerializer)
+            obj = SimpleNamespace(**{field.attname: obj[field.attname] for field in fields})
+        elif getattr(obj, 'pk', True) is None:
+            # Unsaved extra rows (see merge_rows)
+            obj = SimpleNamespace(**{field.attname: value for field, value in zip(fields, self.get_row_key(obj))})
+        return [None if field.value_from_object(obj) is None else field.value_to_string(obj) for field in fields]
+
+    def encode_cursor(self, position, reverse):
+        payload = json.dumps({'p': position, 'r': reverse}, separators=(',', ':'))
+        cursor = base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii')
+        params = self.request.query_params.copy()
+        params[self.cursor_query_param] = cursor
+        return self.request.build_absolute_uri(f'{self.request.path}?{params.urlencode()}')
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')).decode('utf-8'))
+            position = payload['p']
+            reverse = bool(payload.get('r', False))
+        except (TypeError, ValueError, KeyError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(position, list) or len(position) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        return position, reverse
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return self.encode_cursor(self.next_position, reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        return self.encode_cursor(self.previous_position, reverse=True)
+
+
+class PatientPagination(KeysetPagination):
+    ordering = ('nome', 'id')
+
+
+class AppointmentPagination(KeysetPagination):
+    ordering = ('data', 'horario', 'id')
+
+    def get_row_key(self, row):
+        # Virtual occurrences of recurring series have no id (see api.recurrence)
+        return (row.data, row.horario, row.id if row.id is not None else row.keyset_id)
@@ -0,0 +1,234 @@
+import calendar
+import datetime
+import math
+
+from django.db.models import Q
+from rest_framework.exceptions import ParseError
+from rest_framework.response import Response
+
+from .models import Appointment, AppointmentSeries, ArchivedAppointment
+
+# Series without quantidade/ate are checked for conflicts this far ahead
+SERIE_HORIZONTE_DIAS = 366
+
+
+def add_months(day, months):
+    """``day`` moved ``months`` ahead, or None when that month has no such day."""
+    month_index = day.month - 1 + months
+    year, month = day.year + month_index // 12, month_index % 12 + 1
+    if day.day > calendar.monthrange(year, month)[1]:
+        return None
+    return day.replace(year=year, month=month)
+
+
+def occurrence_dates(series, inicio=None, fim=None):
+    """Yield the occurrence dates of ``series`` inside [inicio, fim], in order.
+
+    Follows RRULE semantics: ``quantidade`` counts occurrences from the start
+    of the series, ``ate`` is inclusive, and monthly dates that do not exist
+    (e.g. the 31st in April) are skipped without counting. Unbounded series
+    need ``fim``.
+    """
+    bounds = [day for day in (fim, series.ate) if day is not None]
+    upper = min(bounds) if bounds else None
+    if upper is None and series.quantidade is None:
+        raise ValueError('An unbounded series needs an end for the expansion.')
+
+    if series.frequencia == 'semanal':
+        step = 7 * series.intervalo
+        index = 0
+        if inicio is not None and inicio > series.inicio:
+            index = math.ceil((inicio - series.inicio).days / step)
+        while series.quantidade is None or index < series.quantidade:
+            day = series.inicio + datetime.timedelta(days=index * step)
+            if upper is not None and day > upper:
+                return
+            yield day
+            index += 1
+        return
+
+    count = months = 0
+    while series.quantidade is None or count < series.quantidade:
+        day = add_months(series.inicio, months * series.intervalo)
+        months += 1
+        if day is None:
+            continue
+        if upper is not None and day > upper:
+            return
+        count += 1
+        if inicio is None or day >= inicio:
+            yield day
+
+
+def last_occurrence(series):
+    """Date of the last occurrence, or None for series without an end."""
+    if series.quantidade is None and series.ate is None:
+        return None
+    last = None
+    for last in occurrence_dates(series):
+        pass
+    return last
+
+
+def is_occurrence(series, day):
+    return any(occurrence_dates(series, day, day))
+
+
+def series_in_window(inicio, fim):
+    """Series that may have occurrences between ``inicio`` and ``fim``."""
+    return AppointmentSeries.objects.filter(inicio__lte=fim).filter(Q(fim__isnull=True) | Q(fim__gte=inicio))
+
+
+def occurrence_defaults(series, day):
+    """Field values of the occurrence of ``series`` on ``day`` before any edit."""
+    return {
+        'paciente': series.paciente_id, 'data': day, 'horario': series.horario, 'duracao': series.duracao,
+        'tipo': series.tipo, 'observacoes': series.observacoes, 'status': 'agendado',
+    }
+
+
+def virtual_occurrences(inicio, fim, series=None):
+    """Unsaved ``Appointment`` objects for the occurrences between ``inicio`` and
+    ``fim`` that have not been materialized, sorted by (data, horario).
+
+    ``series`` defaults to every series overlapping the window. The objects
+    have ``id=None`` and carry ``keyset_id = -serie.id`` so they can be
+    paginated together with real rows (see ``AppointmentPagination``).
+    """
+    if series is None:
+        series = series_in_window(inicio, fim)
+    series = list(series.select_related('paciente'))
+    if not series:
+        return []
+    # Edited occurrences, including those archived since (see api.archive)
+    stored = Appointment.objects.filter(serie__in=series, data_original__range=(inicio, fim))
+    archived = ArchivedAppointment.objects.filter(serie__in=series, data_original__range=(inicio, fim))
+    materialized = set(
+        stored.values_list('serie_id', 'data_original').union(archived.values_list('serie_id', 'data_original'))
+    )
+
+    occurrences = []
+    for serie in series:
+        for day in occurrence_dates(serie, inicio, fim):
+            if (serie.pk, day) in materialized:
+                continue
+            occurrence = Appointment(
+                paciente=serie.paciente, serie=serie, data=day, data_original=day, horario=serie.horario,
+                duracao=serie.duracao, tipo=serie.tipo, observacoes=serie.observacoes, status='agendado',
+            )
+            occurrence.update_slot()
+            occurrence.keyset_id = -serie.pk
+            occurrences.append(occurrence)
+    occurrences.sort(key=lambda occurrence: (occurrence.data, occurrence.horario, occurrence.keyset_id))
+    return occurrences
+
+
+def series_conflict(data, inicio, fim, exclude=None):
+    """First virtual occurrence on ``data`` overlapping [inicio, fim), or None.
+
+    ``exclude`` is a (serie_id, data_original) pair to ignore, i.e. the
+    occurrence being materialized.
+    """
+    candidates = series_in_window(data, data).filter(inicio_minutos__lt=fim, fim_minutos__gt=inicio)
+    for occurrence in virtual_occurrences(data, data, candidates):
+        if exclude is None or (occurrence.serie_id, occurrence.data_original) != tuple(exclude):
+            return occurrence
+    return None
+
+
+def schedule_conflict(series):
+    """First clash between the occurrences of ``series`` (unsaved or being
+    edited) and other appointments or series, as a message, or None.
+
+    Only the first ``SERIE_HORIZONTE_DIAS`` days are checked for series
+    without an end.
+    """
+    series.update_slot()
+    horizon = None
+    if series.quantidade is None and series.ate is None:
+        horizon = series.inicio + datetime.timedelta(days=SERIE_HORIZONTE_DIAS)
+    dates = list(occurrence_dates(series, series.inicio, horizon))
+    if not dates:
+        return None
+    overlapping = Q(inicio_minutos__lt=series.fim_minutos, fim_minutos__gt=series.inicio_minutos)
+
+    appointments = Appointment.objects.blocking().filter(overlapping, data__in=dates)
+    if series.pk is not None:
+        appointments = appointments.exclude(serie=series)
+    conflito = appointments.order_by('data', 'horario').first()
+    if conflito is not None:
+        return f'Conflito com o agendamento #{conflito.id} em {conflito.data} às {conflito.horario}.'
+
+    others = series_in_window(dates[0], dates[-1]).filter(overlapping)
+    if series.pk is not None:
+        others = others.exclude(pk=series.pk)
+    wanted = set(dates)
+    for occurrence in virtual_occurrences(dates[0], dates[-1], others):
+        if occurrence.data in wanted:
+            return f'Conflito com a série #{occurrence.serie_id} em {occurrence.data} às {occurrence.horario}.'
+    return None
+
+
+class OccurrenceListMixin:
+    """Adds the virtual occurrences of recurring series to ``list`` when the
+    request has a date window (``?data=`` or ``?inicio=&fim=``).
+
+    Without a window only stored appointments are listed: series without an
+    end cannot be expanded.
+    """
+
+    max_window_days = 366
+
+    def parse_window(self):
+        """(inicio, fim) from ``?data=`` or ``?inicio=&fim=``, None without them.
+
+        Malformed dates are a 400 instead of reaching the date filters.
+        """
+        params = self.request.query_params
+        try:
+            if params.get('data'):
+                day = datetime.date.fromisoformat(params['data'])
+                return day, day
+            if not (params.get('inicio') and params.get('fim')):
+                return None
+            inicio = datetime.date.fromisoformat(params['inicio'])
+            fim = datetime.date.fromisoformat(params['fim'])
+        except ValueError:
+            raise ParseError('Formato de data inválido. Use YYYY-MM-DD.')
+        if fim < inicio:
+            raise ParseError('"fim" deve ser maior ou igual a "inicio".')
+        return inicio, fim
+
+    def get_window(self):
+        """The listed window, at most ``max_window_days`` long: series without an
+        end cannot be expanded further, and listing the stored rows without
+        their occurrences would be partial."""
+        window = self.parse_window()
+        if window is not None and (window[1] - window[0]).days >= self.max_window_days:
+            raise ParseError(f'Intervalo máximo de {self.max_window_days} dias.')
+        return window
+
+    def get_virtual_occurrences(self):
+        window = self.get_window()
+        if window is None:
+            return []
+        status = self.request.query_params.get('status')
+        if status and status != 'agendado':
+            return []
+        series = self.filter_series(series_in_window(*window))
+        return virtual_occurrences(*window, series)
+
+    def filter_series(self, series):
+        return series
+
+    def list(self, request, *args, **kwargs):
+        occurrences = self.get_virtual_occurrences()
+        if not occurrences:
+            return super().list(request, *args, **kwargs)
+
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginator.paginate_queryset(queryset, request, view=self, extra_rows=occurrences)
+        if page is not None:
+            return self.get_paginated_response(self.get_serializer(page, many=True).data)
+        rows = sorted([*queryset, *occurrences], key=self.paginator.get_row_key)
+        return Response(self.get_serializer(rows, many=True).data)
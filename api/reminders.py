@@ -0,0 +1,352 @@
+import datetime
+import json
+import random
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection, transaction
+from django.db.models import Case, F, IntegerField, Q, When, Window
+from django.db.models.functions import RowNumber
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import Appointment, AppointmentSeries, Patient, Reminder, format_horario
+from .recurrence import virtual_occurrences
+
+# Appointments in these statuses get a reminder
+LEMBRETE_STATUSES = ('agendado', 'confirmado')
+
+MENSAGEM = 'Olá, {nome}! Lembrete da sua consulta ({tipo}) em {data} às {horario}.'
+
+RESULT_FIELDS = ['status', 'tentativas', 'proxima_tentativa_em', 'enviado_em', 'id_externo', 'erro', 'atualizado_em']
+
+
+def preferred_contacts(patient_ids):
+    """{patient_id: (numero, is_whatsapp)} of the contact to message, in one query.
+
+    Only contacts that can receive messages count (WhatsApp or mobile);
+    WhatsApp mobiles come first, then other WhatsApp numbers, then mobiles,
+    and the most recently updated contact breaks ties.
+    """
+    Through = Patient.contatos.through
+    prioridade = Case(
+        When(contact__is_whatsapp=True, contact__tipo='celular', then=0),
+        When(contact__is_whatsapp=True, then=1),
+        default=2,
+        output_field=IntegerField(),
+    )
+    rows = (
+        Through.objects.filter(patient_id__in=patient_ids)
+        .filter(Q(contact__is_whatsapp=True) | Q(contact__tipo='celular'))
+        .annotate(ordem=Window(
+            RowNumber(),
+            partition_by=[F('patient_id')],
+            order_by=[prioridade.asc(), F('contact__atualizado_em').desc(), F('contact_id').asc()],
+        ))
+        .filter(ordem=1)
+        .values_list('patient_id', 'contact__numero', 'contact__is_whatsapp')
+    )
+    return {patient_id: (numero, is_whatsapp) for patient_id, numero, is_whatsapp in rows}
+
+
+def reminder_key(appointment):
+    if appointment.serie_id is not None:
+        # Same key whether the occurrence is still virtual or was stored since
+        return f'serie:{appointment.serie_id}:{appointment.data_original}:{appointment.data}:{appointment.horario}'
+    return f'agendamento:{appointment.pk}:{appointment.data}:{appointment.horario}'
+
+
+def appointment_start(appointment):
+    start = datetime.datetime.combine(appointment.data, datetime.time()) + datetime.timedelta(minutes=appointment.inicio_minutos)
+    return timezone.make_aware(start)
+
+
+def upcoming_appointments(horas, agora):
+    """Stored and virtual appointments starting in (agora, agora + horas], in clinic time."""
+    fim = agora + datetime.timedelta(hours=horas)
+    inicio_dia, fim_dia = timezone.localtime(agora).date(), timezone.localtime(fim).date()
+    stored = (
+        Appointment.objects.select_related('paciente')
+        .filter(data__range=(inicio_dia, fim_dia), status__in=LEMBRETE_STATUSES, inicio_minutos__isnull=False)
+        .order_by('data', 'inicio_minutos')
+    )
+    appointments = [*stored, *virtual_occurrences(inicio_dia, fim_dia)]
+    return [
+        appointment for appointment in appointments
+        if appointment.inicio_minutos is not None and agora < appointment_start(appointment) <= fim
+    ]
+
+
+def enqueue_reminders(horas=None, agora=None):
+    """Queue a reminder for every appointment starting in the next ``horas``.
+
+    Idempotent: appointments already queued (same date and time) are skipped.
+    Returns counts of agendamentos, enfileirados, ja_enfileirados and sem_contato.
+    """
+    horas = horas if horas is not None else getattr(settings, 'REMINDER_HORAS', 24)
+    agora = agora or timezone.now()
+    appointments = upcoming_appointments(horas, agora)
+    contacts = preferred_contacts({appointment.paciente_id for appointment in appointments})
+
+    reminders = {}
+    sem_contato = 0
+    for appointment in appointments:
+        contact = contacts.get(appointment.paciente_id)
+        if contact is None:
+            sem_contato += 1
+            continue
+        numero, is_whatsapp = contact
+        chave = reminder_key(appointment)
+        reminders[chave] = Reminder(
+            chave=chave, paciente_id=appointment.paciente_id, agendamento_id=appointment.pk,
+            serie_id=appointment.serie_id, canal='whatsapp' if is_whatsapp else 'sms', destino=numero,
+            mensagem=MENSAGEM.format(
+                nome=appointment.paciente.nome, tipo=appointment.tipo,
+                data=appointment.data.strftime('%d/%m/%Y'), horario=format_horario(appointment.inicio_minutos),
+            ),
+            proxima_tentativa_em=agora,
+        )
+
+    existing = set()
+    keys = list(reminders)
+    for start in range(0, len(keys), 500):
+        existing.update(Reminder.objects.filter(chave__in=keys[start:start + 500]).values_list('chave', flat=True))
+    new = [reminder for chave, reminder in reminders.items() if chave not in existing]
+    # ignore_conflicts covers a concurrent run queueing the same appointment
+    Reminder.objects.bulk_create(new, batch_size=500, ignore_conflicts=True)
+    return {
+        'agendamentos': len(appointments),
+        'enfileirados': len(new),
+        'ja_enfileirados': len(existing),
+        'sem_contato': sem_contato,
+    }
+
+
+class TransportError(Exception):
+    """A message could not be delivered. ``permanente`` failures (e.g. an
+    invalid number) are not retried."""
+
+    def __init__(self, message, permanente=False):
+        super().__init__(message)
+        self.permanente = permanente
+
+
+class FakeTransport:
+    """Keeps messages in memory instead of sending them, for tests and benchmarks.
+    Never a default: reminders it "sends" are marked as sent.
+
+    ``latencia`` (seconds) simulates the provider round trip and ``falhas``
+    the share of temporary failures.
+    """
+
+    def __init__(self, latencia=0.0, falhas=0.0, seed=None):
+        self.latencia = latencia
+        self.falhas = falhas
+        self.enviadas = []
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def send(self, reminder):
+        if self.latencia:
+            time.sleep(self.latencia)
+        with self._lock:
+            if self._random.random() < self.falhas:
+                raise TransportError('Falha simulada.')
+            self.enviadas.append((reminder.canal, reminder.destino, reminder.mensagem))
+            return f'fake-{len(self.enviadas)}'
+
+
+class WebhookTransport:
+    """POSTs each message as JSON ({canal, destino, mensagem, chave}) to an HTTP
+    gateway in front of the WhatsApp/SMS provider.
+
+    The ``id`` of the JSON response is stored as the external id. 4xx
+    responses are permanent failures; other errors are retried.
+    """
+
+    def __init__(self, url, token=None, timeout=10):
+        self.url = url
+        self.token = token
+        self.timeout = timeout
+
+    def send(self, reminder):
+        body = json.dumps({
+            'canal': reminder.canal, 'destino': reminder.destino, 'mensagem': reminder.mensagem, 'chave': reminder.chave,
+        }).encode('utf-8')
+        request = urllib.request.Request(self.url, data=body, method='POST', headers={'Content-Type': 'application/json'})
+        if self.token:
+            request.add_header('Authorization', f'Bearer {self.token}')
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                payload = json.loads(response.read() or b'{}')
+        except urllib.error.HTTPError as exc:
+            raise TransportError(f'HTTP {exc.code}', permanente=400 <= exc.code < 500 and exc.code != 429)
+        except (urllib.error.URLError, TimeoutError, ValueError) as exc:
+            raise TransportError(str(exc))
+        return str(payload.get('id', '')) or None
+
+
+def get_transport():
+    path = getattr(settings, 'REMINDER_TRANSPORT', '')
+    if not path:
+        raise ImproperlyConfigured('REMINDER_TRANSPORT não configurado (ex.: api.reminders.WebhookTransport).')
+    return import_string(path)(**getattr(settings, 'REMINDER_TRANSPORT_OPTIONS', {}))
+
+
+class RateLimiter:
+    """Spaces calls ``1 / taxa`` seconds apart across threads (``taxa`` <= 0: no limit)."""
+
+    def __init__(self, taxa):
+        self.interval = 1 / taxa if taxa > 0 else 0
+        self._next = time.monotonic()
+        self._lock = threading.Lock()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(self._next, now)
+            self._next = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+def current_keys(reminders):
+    """Keys, among those of ``reminders``, of occurrences that still deserve a reminder.
+
+    A reminder goes stale when its appointment was cancelled or moved to
+    another date or time after it was queued: the key of the occurrence
+    no longer matches.
+    """
+    agendamento_ids = {reminder.agendamento_id for reminder in reminders if reminder.agendamento_id is not None}
+    # Series reminders queued while the occurrence was virtual: serie:<id>:<data_original>:...
+    serie_ids, dates = set(), set()
+    for reminder in reminders:
+        if reminder.agendamento_id is None and reminder.serie_id is not None:
+            serie_ids.add(reminder.serie_id)
+            dates.add(datetime.date.fromisoformat(reminder.chave.split(':')[2]))
+
+    stored = Appointment.objects.filter(pk__in=agendamento_ids)
+    if serie_ids:
+        stored = stored | Appointment.objects.filter(serie_id__in=serie_ids, data_original__in=dates)
+    keys = {reminder_key(appointment) for appointment in stored.filter(status__in=LEMBRETE_STATUSES)}
+    if serie_ids:
+        series = AppointmentSeries.objects.filter(pk__in=serie_ids)
+        keys.update(reminder_key(occurrence) for occurrence in virtual_occurrences(min(dates), max(dates), series))
+    return keys
+
+
+def claim_batch(size, agora=None):
+    """Mark up to ``size`` due reminders as being sent and return them.
+
+    Reminders left 'enviando' by a worker that died are picked up again
+    after ``REMINDER_LEASE`` seconds. Reminders whose appointment was
+    cancelled or rescheduled since they were queued are marked 'obsoleto'
+    instead, and returned with that status so the caller can count them.
+    """
+    agora = agora or timezone.now()
+    lease = datetime.timedelta(seconds=getattr(settings, 'REMINDER_LEASE', 300))
+    with transaction.atomic():
+        due = (
+            Reminder.objects
+            .filter(Q(status='pendente', proxima_tentativa_em__lte=agora) | Q(status='enviando', atualizado_em__lt=agora - lease))
+            .order_by('proxima_tentativa_em', 'id')
+        )
+        if connection.features.has_select_for_update_skip_locked:
+            # Several workers on PostgreSQL/MySQL; SQLite serializes writers already
+            due = due.select_for_update(skip_locked=True)
+        ids = list(due.values_list('id', flat=True)[:size])
+        reminders = list(Reminder.objects.filter(id__in=ids).order_by('id'))
+        keys = current_keys(reminders)
+        for reminder in reminders:
+            reminder.status = 'enviando' if reminder.chave in keys else 'obsoleto'
+            reminder.atualizado_em = agora
+        for status in ('enviando', 'obsoleto'):
+            Reminder.objects.filter(id__in=[reminder.pk for reminder in reminders if reminder.status == status]).update(
+                status=status, atualizado_em=agora,
+            )
+    return reminders
+
+
+def save_results(reminders):
+    """Write the delivery fields of ``reminders`` with one executemany.
+
+    ``bulk_update`` builds a CASE per field and row, which costs more than
+    the sends themselves for batches of a few hundred reminders.
+    """
+    fields = [Reminder._meta.get_field(name) for name in RESULT_FIELDS]
+    quote = connection.ops.quote_name
+    assignments = ', '.join(f'{quote(field.column)} = %s' for field in fields)
+    sql = f'UPDATE {quote(Reminder._meta.db_table)} SET {assignments} WHERE {quote(Reminder._meta.pk.column)} = %s'
+    params = [
+        [field.get_db_prep_save(getattr(reminder, field.attname), connection) for field in fields] + [reminder.pk]
+        for reminder in reminders
+    ]
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.executemany(sql, params)
+
+
+class ReminderWorker:
+    """Drains the reminder queue: claims batches, sends them through the
+    transport from ``workers`` threads under a shared rate limit, and records
+    each batch's outcome in one transaction.
+
+    Failed sends are retried with exponential backoff (``backoff``,
+    ``2 * backoff``, ...) until ``max_tentativas``; the appointment is
+    checked again on every claim, so a retry never reminds of a cancelled
+    or moved appointment.
+    """
+
+    def __init__(self, transport=None, lote=None, workers=None, taxa=None, max_tentativas=None, backoff=None):
+        self.transport = transport or get_transport()
+        self.lote = lote or getattr(settings, 'REMINDER_LOTE', 200)
+        self.workers = workers or getattr(settings, 'REMINDER_WORKERS', 8)
+        self.limiter = RateLimiter(taxa if taxa is not None else getattr(settings, 'REMINDER_TAXA', 50))
+        self.max_tentativas = max_tentativas or getattr(settings, 'REMINDER_MAX_TENTATIVAS', 5)
+        self.backoff = backoff if backoff is not None else getattr(settings, 'REMINDER_BACKOFF', 60)
+
+    def deliver(self, reminder):
+        self.limiter.wait()
+        try:
+            return reminder, self.transport.send(reminder), None
+        except TransportError as exc:
+            return reminder, None, exc
+        except Exception as exc:
+            return reminder, None, TransportError(f'{type(exc).__name__}: {exc}')
+
+    def record(self, results):
+        now = timezone.now()
+        for reminder, id_externo, erro in results:
+            reminder.tentativas += 1
+            reminder.atualizado_em = now
+            if erro is None:
+                reminder.status, reminder.enviado_em, reminder.id_externo, reminder.erro = 'enviado', now, id_externo, None
+                continue
+            reminder.erro = str(erro)
+            if erro.permanente or reminder.tentativas >= self.max_tentativas:
+                reminder.status = 'falhou'
+            else:
+                reminder.status = 'pendente'
+                reminder.proxima_tentativa_em = now + datetime.timedelta(seconds=self.backoff * 2 ** (reminder.tentativas - 1))
+        save_results([reminder for reminder, _, _ in results])
+
+    def run(self):
+        """Send every reminder due now and return the outcome counts."""
+        totals = Counter()
+        with ThreadPoolExecutor(self.workers) as pool:
+            while True:
+                batch = claim_batch(self.lote)
+                if not batch:
+                    return totals
+                totals.update(reminder.status for reminder in batch if reminder.status == 'obsoleto')
+                results = list(pool.map(self.deliver, [reminder for reminder in batch if reminder.status == 'enviando']))
+                if results:
+                    self.record(results)
+                totals.update(reminder.status for reminder, _, _ in results)
@@ -0,0 +1,46 @@
+import json
+
+from django.conf import settings
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:  # optional dependency
+    orjson = None
+
+
+def fast_mode_enabled():
+    return getattr(settings, 'API_FAST_MODE', False)
+
+
+class FastJSONRenderer(JSONRenderer):
+    """JSONRenderer using orjson when installed.
+
+    Falls back to DRF's renderer when orjson is missing or the client asked
+    for indented output (e.g. the browsable API).
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or data is None or self.get_indent(accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+        return orjson.dumps(
+            data,
+            default=JSONEncoder().default,
+            # Dates go through DRF's encoder, which trims microseconds to milliseconds
+            option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS,
+        )
+
+
+class FastJSONParser(JSONParser):
+    """JSONParser using orjson when installed."""
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        if orjson is None:
+            return super().parse(stream, media_type, parser_context)
+        try:
+            return orjson.loads(stream.read())
+        except (orjson.JSONDecodeError, json.JSONDecodeError) as exc:
+            raise ParseError(f'JSON parse error - {exc}')
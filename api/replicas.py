@@ -0,0 +1,110 @@
+import random
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.permissions import SAFE_METHODS
+
+# Replica alias serving the reads of the current request, if any
+_read_alias = ContextVar('api_read_alias', default=None)
+
+RECENT_WRITE_KEY = 'db:escrita-recente:{}'
+
+
+def replica_aliases():
+    return getattr(settings, 'DATABASE_REPLICAS', [])
+
+
+def database_aliases():
+    return ['default', *replica_aliases()]
+
+
+class ReplicaRouter:
+    """Send reads to a replica while the current request allows it, everything else to ``default``.
+
+    Reads only go to a replica inside views using ``ReplicaReadMixin``, so
+    code that reads right after writing in the same request (serializer
+    validation, signals, management commands) keeps seeing the primary.
+    """
+
+    def db_for_read(self, model, **hints):
+        return _read_alias.get() or 'default'
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = set(database_aliases())
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas receive the schema through replication
+        return db not in replica_aliases()
+
+
+def read_alias():
+    """Alias the current request reads from (``default`` outside replica reads)."""
+    return _read_alias.get() or 'default'
+
+
+def cache_timeout(timeout):
+    """Cap the timeout of cache entries built from replica reads.
+
+    Invalidation happens when the primary is written, possibly before the
+    replica has the change, so a replica-built entry may be stale; it must
+    not outlive the replication lag by much.
+    """
+    if _read_alias.get():
+        return min(timeout, getattr(settings, 'DATABASE_REPLICA_LAG', 5))
+    return timeout
+
+
+def client_key(request):
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        return RECENT_WRITE_KEY.format(f'user:{user.pk}')
+    return RECENT_WRITE_KEY.format(f'ip:{request.META.get("REMOTE_ADDR")}')
+
+
+def wrote_recently(request):
+    return cache.get(client_key(request)) is not None
+
+
+class ReadYourWritesMiddleware:
+    """After a successful write, pin the client's reads to the primary for
+    ``DATABASE_REPLICA_LAG`` seconds, so it sees its own changes before the
+    replicas catch up.
+
+    The marker lives in the default cache: with several worker processes that
+    cache must be shared (e.g. Redis or Memcached) for the guarantee to hold.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if replica_aliases() and request.method not in SAFE_METHODS and response.status_code < 400:
+            cache.set(client_key(request), True, getattr(settings, 'DATABASE_REPLICA_LAG', 5))
+        return response
+
+
+class ReplicaReadMixin:
+    """Serve safe requests from a read replica unless the client wrote recently."""
+
+    def dispatch(self, request, *args, **kwargs):
+        token = _read_alias.set(None)
+        try:
+            return super().dispatch(request, *args, **kwargs)
+        finally:
+            _read_alias.reset(token)
+
+    def initial(self, request, *args, **kwargs):
+        # Runs after authentication, so recent writes are matched by user
+        super().initial(request, *args, **kwargs)
+        aliases = replica_aliases()
+        if request.method in SAFE_METHODS and aliases and not wrote_recently(request):
+            # One replica per request, so all its reads come from the same snapshot
+            _read_alias.set(random.choice(aliases))
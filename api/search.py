@@ -0,0 +1,64 @@
+import re
+
+from django.db import connections, router
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+from .models import Patient, Appointment
+
+
+# SQLite FTS5 shadow tables, kept in sync with their source table by the
+# triggers created in migration 0005. The unicode61 tokenizer lowercases and
+# strips accents, so "joao" matches "João".
+FTS_TABLES = {
+    Patient: ('api_patient_fts', ['nome', 'email', 'cpf']),
+    Appointment: ('api_appointment_fts', ['tipo']),
+}
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def fts_available(using='default'):
+    return connections[using].vendor == 'sqlite'
+
+
+def build_match_query(text):
+    """Turn free text into an FTS5 query: every word must match as a prefix."""
+    return ' '.join(f'"{token}"*' for token in TOKEN_RE.findall(text or ''))
+
+
+def match_ids(model, text):
+    """Subquery selecting the primary keys of ``model`` rows matching ``text``."""
+    table, _ = FTS_TABLES[model]
+    return RawSQL(f'SELECT rowid FROM {table} WHERE {table} MATCH %s', [build_match_query(text)])
+
+
+def search_q(model, text, using='default'):
+    """``Q`` restricting ``model`` to rows matching ``text``.
+
+    Falls back to an OR of ``icontains`` lookups on databases without FTS5.
+    """
+    if fts_available(using):
+        return Q(pk__in=match_ids(model, text))
+    _, fields = FTS_TABLES[model]
+    condition = Q()
+    for token in TOKEN_RE.findall(text or ''):
+        token_q = Q()
+        for field in fields:
+            token_q |= Q(**{f'{field}__icontains': token})
+        condition &= token_q
+    return condition
+
+
+def ranked_ids(model, text, limit, using=None):
+    """Primary keys of the best ``limit`` matches, best first (FTS5 bm25 rank)."""
+    using = using or router.db_for_read(model)
+    query = build_match_query(text)
+    if not query:
+        return []
+    if not fts_available(using):
+        return list(model.objects.using(using).filter(search_q(model, text, using)).values_list('pk', flat=True)[:limit])
+    table, _ = FTS_TABLES[model]
+    with connections[using].cursor() as cursor:
+        cursor.execute(f'SELECT rowid FROM {table} WHERE {table} MATCH %s ORDER BY rank LIMIT %s', [query, limit])
+        return [row[0] for row in cursor.fetchall()]
@@ -1,24 +1,42 @@
 from rest_framework import serializers
-from .models import Patient, Appointment, Address, Contact, Anamnesis
+from .models import (
+    Patient, Appointment, AppointmentSeries, Address, Contact, Anamnesis, parse_horario, format_horario,
+)
+from .recurrence import schedule_conflict, series_conflict
+from .instrumentation import TimedSerializerMixin, TimedListSerializer
 
 
-class AddressSerializer(serializers.ModelSerializer):
+class DynamicFieldsMixin:
+    """Accepts ``fields=`` to keep only a subset of the declared fields."""
+
+    def __init__(self, *args, **kwargs):
+        fields = kwargs.pop('fields', None)
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+
+class AddressSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Address
+        list_serializer_class = TimedListSerializer
         fields = ['id', 'cep', 'logradouro', 'numero', 'complemento', 'bairro', 'cidade', 'estado']
 
 
-class ContactSerializer(serializers.ModelSerializer):
+class ContactSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     tipo_display = serializers.CharField(source='get_tipo_display', read_only=True)
 
     class Meta:
         model = Contact
+        list_serializer_class = TimedListSerializer
         fields = ['id', 'tipo', 'tipo_display', 'numero', 'is_whatsapp', 'observacao']
 
 
-class AnamnesisSerializer(serializers.ModelSerializer):
+class AnamnesisSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Anamnesis
+        list_serializer_class = TimedListSerializer
         fields = [
             'id', 'paciente', 'data_atualizacao',
             'problemas_saude', 'medicamentos', 'alergias', 'cirurgias',
@@ -30,17 +48,42 @@ class AnamnesisSerializer(serializers.ModelSerializer):
         ]
 
 
-class PatientSerializer(serializers.ModelSerializer):
+class AnamnesisImportSerializer(AnamnesisSerializer):
+    class Meta(AnamnesisSerializer.Meta):
+        fields = [field for field in AnamnesisSerializer.Meta.fields if field not in ('id', 'paciente', 'data_atualizacao')]
+
+
+class PatientImportSerializer(serializers.ModelSerializer):
+    """Validates one row of a bulk import (see api.imports).
+
+    Only validates: rows are written with bulk_create, and CPF uniqueness is
+    checked once per batch instead of with one query per row.
+    """
+    cpf = serializers.RegexField(r'^\d{11}$', error_messages={'invalid': 'CPF deve conter exatamente 11 dígitos numéricos'})
+    endereco = AddressSerializer(required=False, allow_null=True)
+    contatos = ContactSerializer(many=True, required=False)
+    anamnese = AnamnesisImportSerializer(required=False, allow_null=True)
+
+    class Meta:
+        model = Patient
+        fields = [
+            'nome', 'cpf', 'rg', 'data_nascimento', 'sexo', 'email', 'profissao',
+            'observacoes', 'alergias', 'status', 'endereco', 'contatos', 'anamnese'
+        ]
+
+
+class PatientSerializer(TimedSerializerMixin, DynamicFieldsMixin, serializers.ModelSerializer):
     endereco = AddressSerializer(required=False, allow_null=True)
     contatos = ContactSerializer(many=True, read_only=True)
     anamnese = AnamnesisSerializer(read_only=True)
 
     class Meta:
         model = Patient
+        list_serializer_class = TimedListSerializer
         fields = [
             'id', 'nome', 'cpf', 'rg', 'data_nascimento', 'sexo',
             'email', 'contatos', 'endereco', 'status', 'data_cadastro',
-            'anamnese'
+            'anamnese', 'ultima_visita', 'proxima_visita', 'total_visitas', 'total_faltas'
         ]
 
     def create(self, validated_data):
@@ -65,10 +108,228 @@ class PatientSerializer(serializers.ModelSerializer):
         return super().update(instance, validated_data)
 
 
-class AppointmentSerializer(serializers.ModelSerializer):
+class AppointmentSerializer(TimedSerializerMixin, DynamicFieldsMixin, serializers.ModelSerializer):
     paciente_nome = serializers.CharField(source='paciente.nome', read_only=True)
 
     class Meta:
         model = Appointment
+        list_serializer_class = TimedListSerializer
         fields = ['id', 'paciente', 'paciente_nome', 'data', 'horario', 
-                 'tipo', 'status', 'observacoes', 'duracao']
+                 'tipo', 'status', 'observacoes', 'duracao', 'serie', 'data_original']
+        read_only_fields = ['serie', 'data_original']
+
+    def validate_horario(self, value):
+        try:
+            return format_horario(parse_horario(value))
+        except ValueError:
+            raise serializers.ValidationError('Horário inválido. Use HH:MM.')
+
+    def validate_duracao(self, value):
+        if value <= 0:
+            raise serializers.ValidationError('A duração deve ser maior que zero.')
+        return value
+
+    def validate(self, attrs):
+        attrs = super().validate(attrs)
+
+        def current(field, default=None):
+            if field in attrs:
+                return attrs[field]
+            return getattr(self.instance, field, default)
+
+        if current('status', 'agendado') in Appointment.NON_BLOCKING_STATUSES:
+            return attrs
+        data = current('data')
+        horario = current('horario')
+        if data is None or horario is None:
+            return attrs
+
+        try:
+            inicio = parse_horario(horario)
+        except ValueError:
+            # Legacy free-text horario (e.g. 'manhã') left without a slot by
+            # migration 0004: there is no interval to check
+            return attrs
+        fim = inicio + current('duracao', 30)
+        conflitos = Appointment.objects.overlapping(data, inicio, fim)
+        if self.instance is not None:
+            conflitos = conflitos.exclude(pk=self.instance.pk)
+        conflito = conflitos.only('id', 'horario', 'duracao').first()
+        if conflito is not None:
+            raise serializers.ValidationError({
+                'horario': f'Conflito com o agendamento #{conflito.id} às {conflito.horario} ({conflito.duracao} min).'
+            })
+
+        # Occurrences of recurring series are not rows yet (see api.recurrence)
+        ocorrencia = self.context.get('ocorrencia')
+        if ocorrencia is None and self.instance is not None and self.instance.serie_id is not None:
+            ocorrencia = (self.instance.serie_id, self.instance.data_original)
+        conflito = series_conflict(data, inicio, fim, exclude=ocorrencia)
+        if conflito is not None:
+            raise serializers.ValidationError({
+                'horario': f'Conflito com a série #{conflito.serie_id} às {conflito.horario} ({conflito.duracao} min).'
+            })
+        return attrs
+
+
+class AppointmentSeriesSerializer(serializers.ModelSerializer):
+    paciente_nome = serializers.CharField(source='paciente.nome', read_only=True)
+    MAX_OCORRENCIAS = 520
+
+    class Meta:
+        model = AppointmentSeries
+        fields = [
+            'id', 'paciente', 'paciente_nome', 'tipo', 'horario', 'duracao', 'observacoes',
+            'frequencia', 'intervalo', 'inicio', 'quantidade', 'ate', 'fim', 'criado_em',
+        ]
+        read_only_fields = ['fim', 'criado_em']
+
+    def validate_horario(self, value):
+        try:
+            return format_horario(parse_horario(value))
+        except ValueError:
+            raise serializers.ValidationError('Horário inválido. Use HH:MM.')
+
+    def validate_duracao(self, value):
+        if value <= 0:
+            raise serializers.ValidationError('A duração deve ser maior que zero.')
+        return value
+
+    def validate_intervalo(self, value):
+        if value < 1:
+            raise serializers.ValidationError('O intervalo deve ser maior que zero.')
+        return value
+
+    def validate_quantidade(self, value):
+        if value is not None and not 1 <= value <= self.MAX_OCORRENCIAS:
+            raise serializers.ValidationError(f'A quantidade deve estar entre 1 e {self.MAX_OCORRENCIAS}.')
+        return value
+
+    def validate(self, attrs):
+        attrs = super().validate(attrs)
+        # Unsaved copy with the resulting values; model defaults fill omitted fields
+        fields = ('paciente', 'tipo', 'horario', 'duracao', 'frequencia', 'intervalo', 'inicio', 'quantidade', 'ate')
+        current = {field: getattr(self.instance, field) for field in fields} if self.instance is not None else {}
+        series = AppointmentSeries(**{**current, **{field: attrs[field] for field in fields if field in attrs}})
+        series.pk = getattr(self.instance, 'pk', None)
+        if series.quantidade is not None and series.ate is not None:
+            raise serializers.ValidationError('Informe "quantidade" ou "ate", não ambos.')
+        if series.ate is not None and series.ate < series.inicio:
+            raise serializers.ValidationError({'ate': '"ate" deve ser maior ou igual a "inicio".'})
+        conflito = schedule_conflict(series)
+        if conflito is not None:
+            raise serializers.ValidationError({'horario': conflito})
+        return attrs
+
+
+class ValuesListSerializer:
+    """Read-only list serialization from ``.values()`` rows.
+
+    Produces the same JSON as the matching ModelSerializer for list endpoints
+    without instantiating model objects or DRF fields per row. ``fields`` maps
+    output names to ``values()`` lookups; ``selected`` restricts the output
+    (and the columns read) to a subset of them, as with ``?fields=``.
+    """
+    fields = {}
+    datetime_fields = ()
+
+    def __init__(self, selected=None):
+        self.selected = selected
+
+    def includes(self, name):
+        return self.selected is None or name in self.selected
+
+    def get_lookups(self):
+        return [lookup for name, lookup in self.fields.items() if self.includes(name)]
+
+    def prepare(self, queryset, extra_lookups=()):
+        lookups = self.get_lookups()
+        lookups += [lookup for lookup in extra_lookups if lookup not in lookups]
+        return queryset.select_related(None).prefetch_related(None).values(*lookups)
+
+    def serialize(self, rows):
+        datetime_field = serializers.DateTimeField()
+        items = [(name, lookup) for name, lookup in self.fields.items() if self.includes(name)]
+        datetime_fields = [name for name in self.datetime_fields if self.includes(name)]
+        data = []
+        for row in rows:
+            item = {name: row[lookup] for name, lookup in items}
+            for name in datetime_fields:
+                if item[name] is not None:
+                    item[name] = datetime_field.to_representation(item[name])
+            data.append(item)
+        return data
+
+
+class AppointmentValuesSerializer(ValuesListSerializer):
+    fields = {
+        'id': 'id', 'paciente': 'paciente_id', 'paciente_nome': 'paciente__nome', 'data': 'data',
+        'horario': 'horario', 'tipo': 'tipo', 'status': 'status', 'observacoes': 'observacoes',
+        'duracao': 'duracao', 'serie': 'serie_id', 'data_original': 'data_original',
+    }
+
+
+class PatientValuesSerializer(ValuesListSerializer):
+    fields = {
+        'id': 'id', 'nome': 'nome', 'cpf': 'cpf', 'rg': 'rg', 'data_nascimento': 'data_nascimento',
+        'sexo': 'sexo', 'email': 'email', 'status': 'status', 'data_cadastro': 'data_cadastro',
+        'ultima_visita': 'ultima_visita', 'proxima_visita': 'proxima_visita',
+        'total_visitas': 'total_visitas', 'total_faltas': 'total_faltas',
+    }
+    output_order = PatientSerializer.Meta.fields
+    address_fields = AddressSerializer.Meta.fields
+    anamnesis_fields = AnamnesisSerializer.Meta.fields
+    contact_fields = ['id', 'tipo', 'numero', 'is_whatsapp', 'observacao']
+    tipo_display = dict(Contact.TIPO_CHOICES)
+
+    def get_lookups(self):
+        lookups = super().get_lookups()
+        if 'id' not in lookups:
+            lookups.append('id')
+        if self.includes('endereco'):
+            lookups.append('endereco_id')
+            lookups += [f'endereco__{name}' for name in self.address_fields if name != 'id']
+        if self.includes('anamnese'):
+            lookups += [f'anamnese__{name}' for name in self.anamnesis_fields]
+        return lookups
+
+    def get_contacts(self, rows):
+        contatos = {}
+        Through = Patient.contatos.through
+        contact_lookups = [f'contact__{name}' for name in self.contact_fields]
+        for contact in Through.objects.filter(patient_id__in=[row['id'] for row in rows]).order_by('id').values(
+                'patient_id', *contact_lookups):
+            item = {name: contact[f'contact__{name}'] for name in self.contact_fields}
+            item['tipo_display'] = self.tipo_display.get(item['tipo'], item['tipo'])
+            contatos.setdefault(contact['patient_id'], []).append({
+                name: item[name] for name in ContactSerializer.Meta.fields
+            })
+        return contatos
+
+    def serialize(self, rows):
+        rows = list(rows)
+        datetime_field = serializers.DateTimeField()
+        contatos = self.get_contacts(rows) if self.includes('contatos') else {}
+        names = [name for name in self.output_order if self.includes(name)]
+
+        data = []
+        for row in rows:
+            item = {name: row[name] for name in self.fields if self.includes(name)}
+            if 'data_cadastro' in item:
+                item['data_cadastro'] = datetime_field.to_representation(item['data_cadastro'])
+            if self.includes('contatos'):
+                item['contatos'] = contatos.get(row['id'], [])
+            if self.includes('endereco'):
+                endereco = None
+                if row['endereco_id'] is not None:
+                    endereco = {'id': row['endereco_id']}
+                    endereco.update({name: row[f'endereco__{name}'] for name in self.address_fields if name != 'id'})
+                item['endereco'] = endereco
+            if self.includes('anamnese'):
+                anamnese = None
+                if row['anamnese__id'] is not None:
+                    anamnese = {name: row[f'anamnese__{name}'] for name in self.anamnesis_fields}
+                    anamnese['data_atualizacao'] = datetime_field.to_representation(anamnese['data_atualizacao'])
+                item['anamnese'] = anamnese
+            data.append({name: item[name] for name in names})
+        return data
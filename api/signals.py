@@ -0,0 +1,209 @@
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, pre_delete, m2m_changed
+from django.dispatch import Signal, receiver
+from django.utils import timezone
+
+from .authentication import invalidate_user, token_cache
+from .cache import bump_version
+from .details import details_cache_key, patient_cache_namespace
+from .events import get_broker
+from .models import Patient, Appointment, AppointmentSeries, Address, Contact, Anamnesis, Tombstone
+from .replicas import database_aliases
+from .serializers import AppointmentSerializer
+from .stats import TOTAIS_CACHE_NAMESPACE
+from .summary import schedule_refresh
+from .sync import SYNC_TABLES
+from .versions import bump_table_versions
+
+
+# Sent after queryset.update() / bulk writes on appointments, which bypass
+# post_save. Receives ``ids`` (list of appointment ids) and ``fields``.
+appointments_bulk_updated = Signal()
+
+# Sent after appointments are moved to the archive table (see api.archive),
+# which bypasses post_delete. Receives ``ids``.
+appointments_archived = Signal()
+
+# Sent after a bulk patient import (bulk_create of patients, addresses,
+# contacts and anamneses). Receives ``count``.
+patients_bulk_imported = Signal()
+
+
+@receiver([post_save, post_delete], sender=Appointment)
+@receiver([post_save, post_delete], sender=AppointmentSeries)
+@receiver([post_save, post_delete], sender=Patient)
+@receiver(appointments_bulk_updated)
+@receiver(appointments_archived)
+@receiver(patients_bulk_imported)
+def invalidate_daily_totals(sender, **kwargs):
+    bump_version(TOTAIS_CACHE_NAMESPACE)
+
+
+@receiver([post_save, post_delete], sender=Appointment)
+def invalidate_appointment_details(sender, instance, **kwargs):
+    cache.delete_many([details_cache_key(instance.pk, alias) for alias in database_aliases()])
+
+
+@receiver(appointments_bulk_updated)
+@receiver(appointments_archived)
+def invalidate_bulk_appointment_details(sender, ids, **kwargs):
+    cache.delete_many([details_cache_key(pk, alias) for pk in ids for alias in database_aliases()])
+
+
+@receiver([post_save, post_delete], sender=Patient)
+def invalidate_patient(sender, instance, **kwargs):
+    bump_version(patient_cache_namespace(instance.pk))
+
+
+@receiver([post_save, post_delete], sender=Anamnesis)
+def invalidate_patient_anamnesis(sender, instance, **kwargs):
+    bump_version(patient_cache_namespace(instance.paciente_id))
+
+
+@receiver(post_save, sender=Contact)
+@receiver(pre_delete, sender=Contact)
+def invalidate_contact_patients(sender, instance, **kwargs):
+    # pre_delete: the through rows are gone by post_delete
+    for paciente_id in instance.pacientes.values_list('pk', flat=True):
+        bump_version(patient_cache_namespace(paciente_id))
+
+
+@receiver(m2m_changed, sender=Patient.contatos.through)
+def invalidate_patient_contacts(sender, instance, action, reverse, pk_set, **kwargs):
+    if not action.startswith('post_'):
+        return
+    if not reverse:
+        bump_version(patient_cache_namespace(instance.pk))
+    elif pk_set:
+        for paciente_id in pk_set:
+            bump_version(patient_cache_namespace(paciente_id))
+
+
+@receiver([post_save, post_delete], sender=Patient)
+@receiver([post_save, post_delete], sender=Appointment)
+@receiver([post_save, post_delete], sender=AppointmentSeries)
+@receiver([post_save, post_delete], sender=Address)
+@receiver([post_save, post_delete], sender=Contact)
+@receiver([post_save, post_delete], sender=Anamnesis)
+def bump_table_version(sender, **kwargs):
+    bump_table_versions(sender)
+
+
+@receiver(m2m_changed, sender=Patient.contatos.through)
+def bump_patient_contacts_version(sender, action, **kwargs):
+    if action.startswith('post_'):
+        bump_table_versions(Patient)
+
+
+@receiver(appointments_bulk_updated)
+@receiver(appointments_archived)
+def bump_bulk_appointments_version(sender, **kwargs):
+    bump_table_versions(Appointment)
+
+
+@receiver(patients_bulk_imported)
+def bump_imported_patients_version(sender, **kwargs):
+    bump_table_versions(Patient, Address, Contact, Anamnesis)
+
+
+@receiver(post_delete)
+def record_tombstone(sender, instance, **kwargs):
+    tabela = SYNC_TABLES.get(sender)
+    if tabela is not None:
+        Tombstone.objects.create(tabela=tabela, objeto_id=instance.pk)
+
+
+@receiver(m2m_changed, sender=Patient.contatos.through)
+def touch_patient_contacts(sender, instance, action, reverse, pk_set, **kwargs):
+    # The contatos id list is part of the synced patient row
+    if not action.startswith('post_'):
+        return
+    if not reverse:
+        Patient.objects.filter(pk=instance.pk).update(atualizado_em=timezone.now())
+    elif pk_set:
+        Patient.objects.filter(pk__in=pk_set).update(atualizado_em=timezone.now())
+
+
+@receiver(post_save, sender=Appointment)
+def refresh_saved_appointment_summary(sender, instance, created, **kwargs):
+    loaded = getattr(instance, '_loaded_values', {})
+    tracked = {'data': instance.data, 'status': instance.status, 'paciente_id': instance.paciente_id}
+    if not created and len(loaded) == len(tracked) and all(loaded[name] == value for name, value in tracked.items()):
+        # e.g. only observacoes changed
+        return
+    schedule_refresh({instance.paciente_id, loaded.get('paciente_id')})
+
+
+@receiver(post_delete, sender=Appointment)
+@receiver([post_save, post_delete], sender=AppointmentSeries)
+def refresh_patient_summary(sender, instance, **kwargs):
+    schedule_refresh({instance.paciente_id})
+
+
+@receiver(appointments_bulk_updated)
+def refresh_bulk_patient_summaries(sender, ids, **kwargs):
+    # Archived appointments (appointments_archived) keep counting in the summary
+    schedule_refresh(set(Appointment.objects.filter(id__in=ids).values_list('paciente_id', flat=True).distinct()))
+
+
+def publish_agenda_events(events):
+    """Publish (data, event) pairs to the agenda broker once the transaction commits."""
+    broker = get_broker()
+    transaction.on_commit(lambda: [broker.publish(data, event) for data, event in events])
+
+
+@receiver(post_save, sender=Appointment)
+def push_appointment_saved(sender, instance, created, **kwargs):
+    loaded = getattr(instance, '_loaded_values', {})
+
+    datas = {str(instance.data)}
+    if loaded.get('data') is not None:
+        # Moved to another day: subscribers of the old day must see it too
+        datas.add(str(loaded['data']))
+    broker = get_broker()
+    if not any(broker.has_subscribers(data) for data in datas):
+        return
+
+    if created:
+        tipo = 'criado'
+    elif 'status' in loaded and loaded['status'] != instance.status:
+        tipo = 'status'
+    else:
+        tipo = 'atualizado'
+    event = {'tipo': tipo, 'agendamento': AppointmentSerializer(instance).data}
+    publish_agenda_events([(data, event) for data in datas])
+
+
+@receiver(post_delete, sender=Appointment)
+def push_appointment_deleted(sender, instance, **kwargs):
+    if get_broker().has_subscribers(instance.data):
+        publish_agenda_events([(instance.data, {'tipo': 'removido', 'agendamento': {'id': instance.pk}})])
+
+
+@receiver(appointments_bulk_updated)
+def push_bulk_appointments(sender, ids, **kwargs):
+    if not get_broker().has_subscribers():
+        return
+    appointments = Appointment.objects.filter(id__in=ids).select_related('paciente')
+    publish_agenda_events([
+        (appointment.data, {'tipo': 'status', 'agendamento': AppointmentSerializer(appointment).data})
+        for appointment in appointments
+    ])
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL)
+def evict_cached_user_tokens(sender, instance, **kwargs):
+    # Password, is_active or permission changes must not be served from the token cache
+    invalidate_user(instance.pk)
+
+
+if apps.is_installed('rest_framework_simplejwt.token_blacklist'):
+    from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+
+    @receiver(post_save, sender=BlacklistedToken)
+    def evict_blacklisted_token(sender, instance, **kwargs):
+        token_cache.evict_jti(instance.token.jti)
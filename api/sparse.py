@@ -0,0 +1,84 @@
+from rest_framework.exceptions import ValidationError
+
+
+class SparseFieldsMixin:
+    """``?fields=`` and ``?expand=`` on list/retrieve.
+
+    ``?fields=id,nome`` keeps only those top-level fields. ``?expand=endereco``
+    embeds only the listed relations (``?expand=`` embeds none); without it every
+    relation in ``expandable`` is embedded, as before. Both trim the SQL too:
+    omitted relations are not joined or prefetched and the other columns are
+    deferred with ``only()``.
+
+    ``expandable`` maps a relation field to its ``select_related`` /
+    ``prefetch_related`` lookups; ``sparse_columns`` maps computed fields to the
+    model columns they need (other fields map to themselves).
+    """
+
+    sparse_actions = ('list', 'retrieve')
+    expandable = {}
+    sparse_columns = {}
+    sparse_required_columns = ('id',)
+
+    def get_sparse_fields(self):
+        """Return the output fields to keep, or None for all of them."""
+        if getattr(self, 'action', None) not in self.sparse_actions:
+            return None
+        if hasattr(self, '_sparse_fields'):
+            return self._sparse_fields
+
+        all_fields = list(self.get_serializer_class().Meta.fields)
+        params = self.request.query_params
+        selected = list(all_fields)
+        if 'fields' in params:
+            requested = [name.strip() for name in params['fields'].split(',') if name.strip()]
+            invalid = sorted(set(requested) - set(all_fields))
+            if invalid:
+                raise ValidationError({'fields': f'Campos inválidos: {invalid}. Valores válidos: {all_fields}'})
+            selected = [name for name in all_fields if name in requested]
+        if 'expand' in params:
+            requested = [name.strip() for name in params['expand'].split(',') if name.strip()]
+            invalid = sorted(set(requested) - set(self.expandable))
+            if invalid:
+                raise ValidationError({'expand': f'Relações inválidas: {invalid}. Valores válidos: {sorted(self.expandable)}'})
+            selected = [name for name in selected if name not in self.expandable or name in requested]
+
+        self._sparse_fields = None if selected == all_fields else selected
+        return self._sparse_fields
+
+    def narrow_queryset(self, queryset, fields):
+        queryset = queryset.select_related(None).prefetch_related(None)
+        columns = set(self.sparse_required_columns)
+        # Keyset cursors are built from the ordering columns of the last row
+        columns.update(getattr(self.paginator, 'ordering_fields', ()))
+        for name in fields:
+            relation = self.expandable.get(name)
+            if relation is None:
+                columns.update(self.sparse_columns.get(name, [name]))
+                continue
+            select_related = relation.get('select_related', [])
+            if select_related:
+                queryset = queryset.select_related(*select_related)
+            if relation.get('prefetch_related'):
+                queryset = queryset.prefetch_related(*relation['prefetch_related'])
+            if name in self.sparse_columns:
+                columns.update(self.sparse_columns[name])
+            else:
+                # only() must not defer the joined rows themselves.
+                for path in select_related:
+                    related_model = queryset.model._meta.get_field(path).related_model
+                    columns.update(f'{path}__{field.attname}' for field in related_model._meta.concrete_fields)
+        return queryset.only(*columns)
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        fields = self.get_sparse_fields()
+        if fields is None:
+            return queryset
+        return self.narrow_queryset(queryset, fields)
+
+    def get_serializer(self, *args, **kwargs):
+        fields = self.get_sparse_fields()
+        if fields is not None:
+            kwargs.setdefault('fields', fields)
+        return super().get_serializer(*args, **kwargs)
@@ -0,0 +1,20 @@
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+
+@receiver(connection_created)
+def apply_sqlite_pragmas(sender, connection, **kwargs):
+    """Run the SQLITE_PRAGMAS from settings on every new SQLite connection.
+
+    journal_mode=WAL is persistent in the database file, the others are per
+    connection; with CONN_MAX_AGE they run once per worker thread, not per request.
+    """
+    if connection.vendor != 'sqlite':
+        return
+    pragmas = getattr(settings, 'SQLITE_PRAGMAS', {})
+    if not pragmas:
+        return
+    with connection.cursor() as cursor:
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
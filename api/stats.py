@@ -0,0 +1,71 @@
+import datetime
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Q
+
+from .cache import get_version
+from .models import Appointment, ArchivedAppointment, Patient
+from .recurrence import virtual_occurrences
+from .replicas import read_alias, cache_timeout
+
+
+TOTAIS_CACHE_NAMESPACE = 'totais-diarios'
+PENDING_STATUSES = ('agendado', 'confirmado')
+
+
+def daily_totals_queryset(inicio, fim):
+    """Per-day appointment and pending counts in one grouped query."""
+    return (
+        Appointment.objects.filter(data__range=(inicio, fim))
+        .values('data')
+        .annotate(
+            total_agendamentos=Count('id'),
+            total_pendentes=Count('id', filter=Q(status__in=PENDING_STATUSES)),
+        )
+        .order_by()
+    )
+
+
+def archived_totals(inicio, fim):
+    """{data: count} of archived appointments; never pending (see api.archive)."""
+    return dict(
+        ArchivedAppointment.objects.filter(data__range=(inicio, fim))
+        .values('data').annotate(total=Count('id')).order_by().values_list('data', 'total')
+    )
+
+
+def daily_totals(inicio, fim):
+    """Return one row per day between ``inicio`` and ``fim`` (inclusive).
+
+    Includes archived appointments and the occurrences of recurring series.
+    Results are cached until an appointment, series or patient is saved or
+    deleted (see ``api.signals``), with ``API_TOTAIS_CACHE_TIMEOUT`` as a safety net
+    for caches that are not shared between processes.
+    """
+    key = f'{TOTAIS_CACHE_NAMESPACE}:{get_version(TOTAIS_CACHE_NAMESPACE)}:{read_alias()}:{inicio}:{fim}'
+    rows = cache.get(key)
+    if rows is not None:
+        return rows
+
+    counts = {row['data']: row for row in daily_totals_queryset(inicio, fim)}
+    arquivados = archived_totals(inicio, fim)
+    # Occurrences of recurring series not stored yet; always 'agendado', so pending
+    recorrentes = Counter(occurrence.data for occurrence in virtual_occurrences(inicio, fim))
+    total_pacientes = Patient.objects.count()
+
+    rows = []
+    day = inicio
+    while day <= fim:
+        row = counts.get(day, {})
+        rows.append({
+            'data': str(day),
+            'total_agendamentos_no_dia': row.get('total_agendamentos', 0) + arquivados.get(day, 0) + recorrentes[day],
+            'total_pacientes': total_pacientes,
+            'total_pendentes_no_dia': row.get('total_pendentes', 0) + recorrentes[day],
+        })
+        day += datetime.timedelta(days=1)
+
+    cache.set(key, rows, cache_timeout(getattr(settings, 'API_TOTAIS_CACHE_TIMEOUT', 60)))
+    return rows
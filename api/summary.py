@@ -0,0 +1,132 @@
+import datetime
+import threading
+
+from django.db import connection, transaction
+from django.db.models import Count, Max, Min, Q
+from django.utils import timezone
+
+from .models import Appointment, AppointmentSeries, ArchivedAppointment, Patient, SUMMARY_FIELDS
+from .recurrence import SERIE_HORIZONTE_DIAS, virtual_occurrences
+from .stats import PENDING_STATUSES
+from .versions import bump_table_versions
+
+# Patients refreshed per query (keeps the IN lists under SQLite's variable limit)
+LOTE = 500
+
+# Patient ids waiting for the current transaction to commit (see schedule_refresh)
+_pending = threading.local()
+
+
+def compute_summaries(ids, hoje=None):
+    """{patient_id: (ultima_visita, proxima_visita, total_visitas, total_faltas)} for ``ids``.
+
+    One grouped query per table, served by the (paciente, data) indexes.
+    Archived appointments count as history; the next visit may also be a
+    virtual occurrence of a recurring series.
+    """
+    hoje = hoje or timezone.localdate()
+    summaries = {pk: [None, None, 0, 0] for pk in ids}
+
+    current = (
+        Appointment.objects.filter(paciente_id__in=ids).values('paciente_id')
+        .annotate(
+            ultima=Max('data', filter=Q(status='concluido')),
+            proxima=Min('data', filter=Q(status__in=PENDING_STATUSES, data__gte=hoje)),
+            visitas=Count('id', filter=Q(status='concluido')),
+            faltas=Count('id', filter=Q(status='nao_compareceu')),
+        )
+        .order_by()
+    )
+    for row in current:
+        summaries[row['paciente_id']] = [row['ultima'], row['proxima'], row['visitas'], row['faltas']]
+
+    archived = (
+        ArchivedAppointment.objects.filter(paciente_id__in=ids).values('paciente_id')
+        .annotate(
+            ultima=Max('data', filter=Q(status='concluido')),
+            visitas=Count('id', filter=Q(status='concluido')),
+            faltas=Count('id', filter=Q(status='nao_compareceu')),
+        )
+        .order_by()
+    )
+    for row in archived:
+        summary = summaries[row['paciente_id']]
+        if row['ultima'] is not None and (summary[0] is None or row['ultima'] > summary[0]):
+            summary[0] = row['ultima']
+        summary[2] += row['visitas']
+        summary[3] += row['faltas']
+
+    series = AppointmentSeries.objects.filter(paciente_id__in=ids)
+    fim = hoje + datetime.timedelta(days=SERIE_HORIZONTE_DIAS)
+    for occurrence in virtual_occurrences(hoje, fim, series):
+        summary = summaries[occurrence.paciente_id]
+        if summary[1] is None or occurrence.data < summary[1]:
+            summary[1] = occurrence.data
+
+    return {pk: tuple(summary) for pk, summary in summaries.items()}
+
+
+def refresh_patient_summaries(ids, hoje=None):
+    """Recompute the summary of the patients ``ids`` and write the ones that
+    changed, with one executemany per chunk. Returns how many changed.
+
+    ``atualizado_em`` is touched too, so offline clients pick the new values
+    up through /api/sync/.
+    """
+    ids = sorted(set(ids))
+    fields = [Patient._meta.get_field(name) for name in SUMMARY_FIELDS]
+    atualizado_em = Patient._meta.get_field('atualizado_em')
+    quote = connection.ops.quote_name
+    assignments = ', '.join(f'{quote(field.column)} = %s' for field in [*fields, atualizado_em])
+    sql = f'UPDATE {quote(Patient._meta.db_table)} SET {assignments} WHERE {quote(Patient._meta.pk.column)} = %s'
+    now = atualizado_em.get_db_prep_save(timezone.now(), connection)
+
+    changed = 0
+    for start in range(0, len(ids), LOTE):
+        chunk = ids[start:start + LOTE]
+        summaries = compute_summaries(chunk, hoje)
+        params = [
+            [field.get_db_prep_save(value, connection) for field, value in zip(fields, summaries[pk])] + [now, pk]
+            for pk, *stored in Patient.objects.filter(pk__in=chunk).values_list('pk', *SUMMARY_FIELDS)
+            if tuple(stored) != summaries[pk]
+        ]
+        if len(params) == 1:
+            # The usual case after a single save: one statement is atomic on its own
+            with connection.cursor() as cursor:
+                cursor.execute(sql, params[0])
+        elif params:
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.executemany(sql, params)
+        changed += len(params)
+    if changed:
+        bump_table_versions(Patient)
+    return changed
+
+
+def _refresh_pending():
+    ids = getattr(_pending, 'ids', None)
+    if ids:
+        _pending.ids = set()
+        refresh_patient_summaries(ids)
+
+
+def schedule_refresh(ids):
+    """Refresh the summary of ``ids`` once the current transaction commits.
+
+    Patients touched several times in one transaction (a bulk status change,
+    a series materializing occurrences) are refreshed once: the first
+    on_commit callback drains every pending id and the others find nothing.
+    """
+    ids = {pk for pk in ids if pk is not None}
+    if not ids:
+        return
+    if not hasattr(_pending, 'ids'):
+        _pending.ids = set()
+    _pending.ids.update(ids)
+    transaction.on_commit(_refresh_pending)
+
+
+def overdue_patients(hoje=None):
+    """Patients whose next visit is already in the past (the day passed with the
+    appointment still pending), served by the (proxima_visita, id) index."""
+    return Patient.objects.filter(proxima_visita__lt=hoje or timezone.localdate())
@@ -0,0 +1,109 @@
+import base64
+import datetime
+
+from django.conf import settings
+from django.utils import timezone
+from rest_framework.utils.encoders import JSONEncoder
+
+from .models import Patient, Appointment, Address, Contact, Anamnesis, Tombstone
+
+
+# Response key -> (model, modification timestamp field)
+SYNC_MODELS = {
+    'pacientes': (Patient, 'atualizado_em'),
+    'agendamentos': (Appointment, 'atualizado_em'),
+    'contatos': (Contact, 'atualizado_em'),
+    'enderecos': (Address, 'atualizado_em'),
+    'anamneses': (Anamnesis, 'data_atualizacao'),
+}
+
+SYNC_TABLES = {model: key for key, (model, _) in SYNC_MODELS.items()}
+
+# Rows committed while a sync runs may carry a timestamp slightly before the
+# token; re-sending this window makes sure they are not missed (clients upsert).
+SYNC_OVERLAP = datetime.timedelta(seconds=5)
+
+# Rows read per query when streaming a table
+SYNC_CHUNK_SIZE = 2000
+
+
+class InvalidSyncToken(ValueError):
+    pass
+
+
+def encode_token(moment):
+    value = str(int(moment.timestamp() * 1_000_000))
+    return base64.urlsafe_b64encode(value.encode('ascii')).decode('ascii').rstrip('=')
+
+
+def decode_token(token):
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        micros = int(base64.urlsafe_b64decode(padded.encode('ascii')).decode('ascii'))
+        return datetime.datetime.fromtimestamp(micros / 1_000_000, tz=datetime.timezone.utc)
+    except (ValueError, UnicodeError, OverflowError, OSError):
+        raise InvalidSyncToken('Token de sincronização inválido.')
+
+
+def tombstone_retention():
+    return datetime.timedelta(days=getattr(settings, 'SYNC_TOMBSTONE_DIAS', 90))
+
+
+def model_rows(model, queryset):
+    fields = [field.attname for field in model._meta.concrete_fields]
+    rows = list(queryset.values(*fields))
+    if model is Patient and rows:
+        contatos = {}
+        Through = Patient.contatos.through
+        for patient_id, contact_id in Through.objects.filter(
+                patient_id__in=[row['id'] for row in rows]).values_list('patient_id', 'contact_id'):
+            contatos.setdefault(patient_id, []).append(contact_id)
+        for row in rows:
+            row['contatos'] = contatos.get(row['id'], [])
+    return rows
+
+
+def iter_rows(model, queryset):
+    """``model_rows`` of ``queryset`` in pk order, ``SYNC_CHUNK_SIZE`` rows per
+    query (keyset on the pk), so a full snapshot never sits in memory."""
+    last_pk = None
+    while True:
+        chunk = queryset if last_pk is None else queryset.filter(pk__gt=last_pk)
+        rows = model_rows(model, chunk.order_by('pk')[:SYNC_CHUNK_SIZE])
+        if not rows:
+            return
+        yield rows
+        last_pk = rows[-1]['id']
+
+
+def iter_sync(since=None):
+    """Yield, as chunks of JSON text, everything created, updated or deleted after ``since``.
+
+    Each table is read with range queries on its indexed modification
+    timestamp. Without ``since`` (or when it predates the tombstone retention)
+    a full snapshot is returned with ``completo: true``, and the client must
+    replace its local copy. The rows are streamed a chunk at a time.
+    """
+    now = timezone.now()
+    completo = since is None or since < now - tombstone_retention()
+    encoder = JSONEncoder(ensure_ascii=False, separators=(',', ':'))
+
+    yield f'{{"token":{encoder.encode(encode_token(now))},"completo":{encoder.encode(completo)}'
+    for key, (model, field) in SYNC_MODELS.items():
+        queryset = model.objects.all()
+        if not completo:
+            queryset = queryset.filter(**{f'{field}__gt': since - SYNC_OVERLAP})
+        yield f',{encoder.encode(key)}:['
+        separator = ''
+        for rows in iter_rows(model, queryset):
+            yield separator + ','.join(encoder.encode(row) for row in rows)
+            separator = ','
+        yield ']'
+
+    removidos = {key: [] for key in SYNC_MODELS}
+    if not completo:
+        tombstones = Tombstone.objects.filter(removido_em__gt=since - SYNC_OVERLAP).values_list('tabela', 'objeto_id')
+        for tabela, objeto_id in tombstones:
+            if tabela in removidos:
+                removidos[tabela].append(objeto_id)
+    yield f',"removidos":{encoder.encode(removidos)}}}'
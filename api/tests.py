@@ -0,0 +1,1067 @@
+import base64
+import csv
+import datetime
+import decimal
+import io
+import json
+import random
+import threading
+import unittest
+from collections import Counter
+from unittest import mock
+from urllib.parse import parse_qs, urlsplit
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import connection, OperationalError
+from django.db.models import Count
+from django.test import AsyncClient, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from .archive import archive_appointments
+from .availability import free_windows
+from .details import details_cache_key
+from .events import get_broker
+from .exports import EXPORT_CHUNK_SIZE
+from .authentication import REVOKED_KEY, USER_VERSION_KEY, token_cache
+from .models import (
+    Patient, Appointment, AppointmentSeries, ArchivedAppointment, Address, Contact, Anamnesis, Reminder, Tombstone,
+    SUMMARY_FIELDS,
+)
+from .renderers import FastJSONParser, FastJSONRenderer, orjson
+from .replicas import ReplicaRouter, read_alias
+from .reminders import FakeTransport, ReminderWorker, enqueue_reminders
+from .summary import compute_summaries
+from .sync import SYNC_OVERLAP, decode_token, encode_token
+from .versions import table_versions
+
+
+class PatientListQueryCountTests(TestCase):
+    """Listing patients costs the same number of queries whatever the table size."""
+
+    SIZES = (10, 10_000)
+
+    def grow_patients(self, total):
+        """Add patients, each with an address, an anamnesis and two contacts, up to ``total``."""
+        start = Patient.objects.count()
+        indexes = range(start, total)
+        enderecos = Address.objects.bulk_create([
+            Address(cep='01001000', logradouro=f'Rua {index}', numero='1', bairro='Centro', cidade='São Paulo', estado='SP')
+            for index in indexes
+        ])
+        pacientes = Patient.objects.bulk_create([
+            Patient(nome=f'Paciente {index:05d}', cpf=f'{index:011d}', endereco=endereco)
+            for index, endereco in zip(indexes, enderecos)
+        ])
+        Anamnesis.objects.bulk_create([Anamnesis(paciente=paciente) for paciente in pacientes])
+        contatos = Contact.objects.bulk_create([
+            Contact(tipo=tipo, numero=f'11{index:09d}') for index in indexes for tipo in ('celular', 'telefone')
+        ])
+        Through = Patient.contatos.through
+        Through.objects.bulk_create([
+            Through(patient=paciente, contact=contato)
+            for position, paciente in enumerate(pacientes) for contato in contatos[2 * position:2 * position + 2]
+        ])
+
+    def assert_constant_queries(self, url, queries):
+        for size in self.SIZES:
+            self.grow_patients(size)
+            with self.subTest(size=size), self.assertNumQueries(queries):
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            if isinstance(response.json(), list):
+                self.assertEqual(len(response.json()), size)
+
+    def test_list_unpaginated(self):
+        # table versions (ETag), patients joined with endereco and anamnese, contatos
+        self.assert_constant_queries('/api/pacientes/?paginar=false', 3)
+
+    def test_list_page(self):
+        self.assert_constant_queries('/api/pacientes/?page_size=500', 3)
+
+    @override_settings(API_FAST_MODE=True)
+    def test_list_fast_mode(self):
+        self.assert_constant_queries('/api/pacientes/?paginar=false', 3)
+
+    def test_retrieve(self):
+        self.grow_patients(10)
+        paciente = Patient.objects.order_by('pk').first()
+        self.assert_constant_queries(f'/api/pacientes/{paciente.pk}/', 3)
+
+
+class AppointmentDetailsTests(TestCase):
+    """``detalhes`` is built from one joined query plus the contacts prefetch, then cached."""
+
+    def setUp(self):
+        cache.clear()
+        self.paciente = Patient.objects.create(nome='Ana', cpf='00000000002')
+        Anamnesis.objects.create(paciente=self.paciente, alergias='Dipirona')
+        self.paciente.contatos.add(Contact.objects.create(tipo='celular', numero='11999999999'))
+        self.agendamento = Appointment.objects.create(paciente=self.paciente, data='2030-01-02', horario='09:00', tipo='Consulta')
+        self.url = f'/api/agendamentos/{self.agendamento.pk}/detalhes/'
+
+    def test_query_count(self):
+        with self.assertNumQueries(2):
+            response = self.client.get(self.url)
+        self.assertEqual(response.json()['anamnese']['alergias'], 'Dipirona')
+        self.assertEqual(len(response.json()['paciente']['contatos']), 1)
+        with self.assertNumQueries(0):
+            self.client.get(self.url)
+
+    def test_invalidated_when_the_anamnesis_changes(self):
+        self.client.get(self.url)
+        self.paciente.anamnese.alergias = 'Penicilina'
+        self.paciente.anamnese.save()
+        with self.assertNumQueries(2):
+            response = self.client.get(self.url)
+        self.assertEqual(response.json()['anamnese']['alergias'], 'Penicilina')
+
+    def test_invalidated_when_the_appointment_changes(self):
+        self.client.get(self.url)
+        self.agendamento.status = 'confirmado'
+        self.agendamento.save()
+        self.assertEqual(self.client.get(self.url).json()['agendamento']['status'], 'confirmado')
+
+
+class ReminderClaimTests(TestCase):
+    """Reminders of appointments cancelled or moved after queueing are never sent."""
+
+    def setUp(self):
+        self.paciente = Patient.objects.create(nome='Ana', cpf='00000000003')
+        self.paciente.contatos.add(Contact.objects.create(tipo='celular', numero='11999999999', is_whatsapp=True))
+        dia = datetime.date(2024, 3, 4)
+        self.agendamento = Appointment.objects.create(paciente=self.paciente, data=dia, horario='10:00', tipo='Consulta')
+        self.serie = AppointmentSeries.objects.create(
+            paciente=self.paciente, tipo='Ortodontia', horario='11:00', frequencia='semanal', inicio=dia, quantidade=2,
+        )
+        agora = timezone.make_aware(datetime.datetime.combine(dia, datetime.time(8)))
+        self.assertEqual(enqueue_reminders(24, agora)['enfileirados'], 2)
+        self.worker = ReminderWorker(transport=FakeTransport(), taxa=0, backoff=0)
+
+    def test_cancelled_and_moved_are_obsolete(self):
+        self.agendamento.status = 'cancelado'
+        self.agendamento.save()
+        Appointment.objects.create(
+            paciente=self.paciente, serie=self.serie, data=self.serie.inicio, data_original=self.serie.inicio,
+            horario='15:00', tipo='Ortodontia',
+        )
+        self.assertEqual(self.worker.run(), Counter(obsoleto=2))
+        self.assertEqual(self.worker.transport.enviadas, [])
+
+    def test_untouched_are_sent(self):
+        self.assertEqual(self.worker.run(), Counter(enviado=2))
+        self.assertEqual(Reminder.objects.filter(status='enviado').count(), 2)
+
+    def test_retry_after_cancellation_is_obsolete(self):
+        self.worker.transport.falhas, self.worker.backoff = 1, 3600
+        self.assertEqual(self.worker.run(), Counter(pendente=2))
+        self.agendamento.status = 'cancelado'
+        self.agendamento.save()
+        Reminder.objects.update(proxima_tentativa_em=timezone.now())
+        self.worker.transport.falhas = 0
+        self.assertEqual(self.worker.run(), Counter(obsoleto=1, enviado=1))
+        self.assertEqual(Reminder.objects.get(agendamento=self.agendamento).status, 'obsoleto')
+
+    @override_settings(REMINDER_TRANSPORT='')
+    def test_unconfigured_transport_sends_nothing(self):
+        with self.assertRaises(CommandError):
+            call_command('processar_lembretes', stdout=io.StringIO())
+        self.assertFalse(Reminder.objects.exclude(status='pendente').exists())
+
+
+class PatientSummaryTests(TestCase):
+    """The summary columns match the appointments, whichever way these were written."""
+
+    def assert_summaries_current(self):
+        stored = {pk: tuple(values) for pk, *values in Patient.objects.values_list('pk', *SUMMARY_FIELDS)}
+        self.assertEqual(stored, compute_summaries(list(stored)))
+
+    def test_generated_clinic(self):
+        call_command('gerar_dados_clinica', pacientes=30, agendamentos=300, stdout=io.StringIO())
+        self.assertTrue(Patient.objects.filter(total_visitas__gt=0).exists())
+        self.assert_summaries_current()
+
+    def test_saving_twice(self):
+        paciente = Patient.objects.create(nome='Ana', cpf='00000000004')
+        with self.captureOnCommitCallbacks(execute=True):
+            agendamento = Appointment.objects.create(paciente=paciente, data='2024-03-04', horario='10:00', tipo='Consulta')
+        for status in ('concluido', 'nao_compareceu'):
+            agendamento.status = status
+            with self.captureOnCommitCallbacks(execute=True):
+                agendamento.save()
+            self.assert_summaries_current()
+
+
+class GeneratedClinicTests(TestCase):
+    def test_appointments_do_not_overlap(self):
+        out = io.StringIO()
+        call_command('gerar_dados_clinica', pacientes=20, anos=0.1, dias_futuros=10, batch_size=50, stdout=out)
+        self.assertGreater(Appointment.objects.count(), 300)
+        slots = {}
+        for data, inicio, fim in Appointment.objects.values_list('data', 'inicio_minutos', 'fim_minutos'):
+            slots.setdefault(data, []).append((inicio, fim))
+        for data, day in slots.items():
+            day.sort()
+            self.assertTrue(all(anterior[1] <= seguinte[0] for anterior, seguinte in zip(day, day[1:])), data)
+
+        # A second run leaves the booked days alone
+        total = Appointment.objects.count()
+        call_command('gerar_dados_clinica', pacientes=5, anos=0.1, dias_futuros=10, agendamentos=10, stdout=out)
+        self.assertEqual(Appointment.objects.count(), total)
+        self.assertIn('Só 0 agendamentos cabem', out.getvalue())
+
+
+class SharedTokenStateTests(TestCase):
+    """Logouts and user changes made by another process reach the cached tokens of this one.
+
+    The other process only writes the Django cache; the local token cache is left as is.
+    """
+
+    def setUp(self):
+        cache.clear()
+        token_cache.clear()
+        self.user = get_user_model().objects.create_user('recepcao', password='segredo')
+        self.token = AccessToken.for_user(self.user)
+        self.client.defaults['HTTP_AUTHORIZATION'] = f'Bearer {self.token}'
+        self.assertEqual(self.client.get('/api/contatos/').status_code, 200)
+        self.assertEqual(len(token_cache), 1)
+
+    def test_revoked_elsewhere(self):
+        cache.set(REVOKED_KEY.format(self.token['jti']), True)
+        response = self.client.get('/api/contatos/')
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.json()['code'], 'token_revoked')
+
+    def test_user_changed_elsewhere(self):
+        get_user_model().objects.filter(pk=self.user.pk).update(is_active=False)
+        self.assertEqual(self.client.get('/api/contatos/').status_code, 200)
+        cache.set(USER_VERSION_KEY.format(self.user.pk), 1)
+        self.assertEqual(self.client.get('/api/contatos/').status_code, 401)
+
+
+class PatientImportTests(TestCase):
+    """Uploaded CSVs: other encodings (400 naming the problem, or ?codificacao=) and quoted line breaks."""
+
+    CSV = 'nome,cpf\nJosé Antônio,00000000005\n'.encode('cp1252')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(get_user_model().objects.create_superuser('admin', password='segredo'))
+
+    def importar(self, query=''):
+        return self.client.post(
+            f'/api/pacientes/importar/{query}', {'arquivo': SimpleUploadedFile('pacientes.csv', self.CSV)}, format='multipart',
+        )
+
+    def test_wrong_encoding(self):
+        response = self.importar()
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('codificação', response.json()['detail'])
+
+    def test_encoding_parameter(self):
+        self.assertEqual(self.importar('?codificacao=cp1252').status_code, 201)
+        self.assertTrue(Patient.objects.filter(nome='José Antônio').exists())
+        self.assertEqual(self.importar('?codificacao=nenhuma').status_code, 400)
+
+    def test_multiline_quoted_field(self):
+        self.CSV = 'nome,cpf,observacoes\r\nAna,00000000008,"Alérgica a dipirona.\r\nPrefere manhãs."\r\nBia,00000000009,\r\n'.encode()
+        response = self.importar()
+        self.assertEqual(response.status_code, 201, response.json())
+        self.assertEqual(response.json()['importados'], 2)
+        self.assertEqual(Patient.objects.get(cpf='00000000008').observacoes, 'Alérgica a dipirona.\r\nPrefere manhãs.')
+
+
+class BulkStatusTests(TestCase):
+    def test_array_body(self):
+        client = APIClient()
+        client.force_authenticate(get_user_model().objects.create_user('recepcao'))
+        response = client.post('/api/agendamentos/status-em-lote/', [{'id': 1, 'status': 'concluido'}], format='json')
+        self.assertEqual(response.status_code, 400)
+
+
+class TamperedCursorTests(TestCase):
+    def test_wrong_types_are_not_found(self):
+        client = APIClient()
+        client.force_authenticate(get_user_model().objects.create_user('recepcao'))
+        cursor = base64.urlsafe_b64encode(json.dumps({'p': [[1], 'x', 2]}).encode()).decode()
+        self.assertEqual(client.get('/api/agendamentos/', {'cursor': cursor}).status_code, 404)
+
+
+class AgendaEventsTests(TestCase):
+    """Appointment changes reach the subscribers of the days involved through the in-process broker."""
+
+    def setUp(self):
+        self.dia, self.outro_dia = datetime.date(2030, 1, 2), datetime.date(2030, 1, 3)
+        broker = get_broker()
+        self.subscriptions = {dia: broker.subscribe(dia) for dia in (self.dia, self.outro_dia)}
+        for subscription in self.subscriptions.values():
+            self.addCleanup(broker.unsubscribe, subscription)
+        self.client = APIClient()
+        self.client.force_authenticate(get_user_model().objects.create_user('recepcao'))
+        self.paciente = Patient.objects.create(nome='Ana', cpf='00000000006')
+
+    def received(self, dia):
+        """(tipo, agendamento id) of the events queued for ``dia`` since the last call."""
+        queue = self.subscriptions[dia].queue
+        events = []
+        while not queue.empty():
+            event = queue.get_nowait()
+            events.append((event['tipo'], event['agendamento']['id']))
+        return events
+
+    def test_lifecycle(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            agendamento = Appointment.objects.create(paciente=self.paciente, data=self.dia, horario='09:00', tipo='Consulta')
+        self.assertEqual(self.received(self.dia), [('criado', agendamento.pk)])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(f'/api/agendamentos/{agendamento.pk}/update_status/', {'status': 'confirmado'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.received(self.dia), [('status', agendamento.pk)])
+
+        agendamento.refresh_from_db()
+        agendamento.data = self.outro_dia
+        with self.captureOnCommitCallbacks(execute=True):
+            agendamento.save()
+        # The old day hears about the move too
+        self.assertEqual(self.received(self.dia), [('atualizado', agendamento.pk)])
+        self.assertEqual(self.received(self.outro_dia), [('atualizado', agendamento.pk)])
+
+        pk = agendamento.pk
+        with self.captureOnCommitCallbacks(execute=True):
+            agendamento.delete()
+        self.assertEqual(self.received(self.outro_dia), [('removido', pk)])
+        self.assertEqual(self.received(self.dia), [])
+
+    def test_wsgi_is_not_implemented(self):
+        self.assertEqual(self.client.get('/api/agenda/eventos/').status_code, 501)
+
+    @override_settings(AGENDA_STREAM_SECONDS=0.1)
+    async def test_stream_closes_after_its_lifetime(self):
+        response = await AsyncClient().get('/api/agenda/eventos/', {'data': '2030-02-01'})
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        chunks = [chunk async for chunk in response.streaming_content]
+        self.assertEqual(chunks[0], b'retry: 3000\n\n')
+        self.assertFalse(get_broker().has_subscribers('2030-02-01'))
+
+
+@override_settings(MIDDLEWARE=['api.instrumentation.InstrumentationMiddleware', *settings.MIDDLEWARE])
+class InstrumentationTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        User = get_user_model()
+        self.admin = User.objects.create_superuser('admin', password='segredo')
+        self.user = User.objects.create_user('recepcao')
+
+    def test_server_timing(self):
+        self.client.force_authenticate(self.user)
+        response = self.client.get('/api/pacientes/')
+        self.assertRegex(response['Server-Timing'], r'^db;dur=[\d.]+;desc="\d+ queries", serializer;dur=[\d.]+, total;dur=[\d.]+$')
+
+    @override_settings(DEBUG=True)
+    def test_metrics_are_admin_only(self):
+        for method in ('get', 'delete'):
+            self.client.force_authenticate(None)
+            self.assertEqual(getattr(self.client, method)('/api/debug/metricas/').status_code, 401)
+            self.client.force_authenticate(self.user)
+            self.assertEqual(getattr(self.client, method)('/api/debug/metricas/').status_code, 403)
+
+        self.client.force_authenticate(self.admin)
+        self.client.get('/api/pacientes/')
+        self.assertIn('PatientViewSet.list', self.client.get('/api/debug/metricas/').json())
+        self.assertEqual(self.client.delete('/api/debug/metricas/').status_code, 204)
+        self.assertNotIn('PatientViewSet.list', self.client.get('/api/debug/metricas/').json())
+
+
+class ArchiveTests(TestCase):
+    """Finished appointments move to the archive table and stay in the patient's history."""
+
+    def setUp(self):
+        cache.clear()
+        self.paciente = Patient.objects.create(nome='Ana', cpf='00000000007')
+        self.antigos = [
+            Appointment.objects.create(paciente=self.paciente, data='2020-01-06', horario=horario, tipo='Limpeza', status=status)
+            for horario, status in (('09:00', 'concluido'), ('10:00', 'nao_compareceu'))
+        ]
+        self.recente = Appointment.objects.create(paciente=self.paciente, data='2030-01-06', horario='09:00', tipo='Consulta')
+
+    def test_archive(self):
+        antigo = self.antigos[0]
+        self.client.get(f'/api/agendamentos/{antigo.pk}/detalhes/')
+        self.assertIsNotNone(cache.get(details_cache_key(antigo.pk)))
+        versao = table_versions(Appointment)[Appointment._meta.db_table][0]
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(archive_appointments(datetime.date(2021, 1, 1), lote=1), 2)
+
+        self.assertEqual(list(Appointment.objects.values_list('pk', flat=True)), [self.recente.pk])
+        self.assertEqual(
+            sorted(ArchivedAppointment.objects.values_list('pk', 'status')),
+            sorted((agendamento.pk, agendamento.status) for agendamento in self.antigos),
+        )
+        # Archiving is not a deletion: offline clients must not drop them
+        self.assertFalse(Tombstone.objects.exists())
+        self.assertIsNone(cache.get(details_cache_key(antigo.pk)))
+        self.assertGreater(table_versions(Appointment)[Appointment._meta.db_table][0], versao)
+
+        historico = self.client.get(f'/api/pacientes/{self.paciente.pk}/historico/').json()
+        self.assertEqual(
+            [(item['id'], item['arquivado']) for item in historico],
+            [(self.antigos[0].pk, True), (self.antigos[1].pk, True), (self.recente.pk, False)],
+        )
+        self.assertEqual(self.client.get(f'/api/agendamentos/{antigo.pk}/').status_code, 404)
+
+
+class ConditionalGetTests(TestCase):
+    """ETags answer 304 until a write bumps the table version."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(get_user_model().objects.create_user('recepcao'))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.paciente = Patient.objects.create(nome='Ana', cpf='00000000010')
+
+    def assert_revalidates(self, url):
+        response = self.client.get(url)
+        etag = response['ETag']
+        self.assertIn('Last-Modified', response)
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        return etag
+
+    def test_list(self):
+        self.assert_revalidates('/api/pacientes/')
+
+    def test_retrieve(self):
+        self.assert_revalidates(f'/api/pacientes/{self.paciente.pk}/')
+
+    def test_write_invalidates(self):
+        for url in ('/api/pacientes/', f'/api/pacientes/{self.paciente.pk}/'):
+            etag = self.assert_revalidates(url)
+            self.paciente.nome = f'Ana {url}'
+            with self.captureOnCommitCallbacks(execute=True):
+                self.paciente.save()
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotEqual(response['ETag'], etag)
+
+    def test_if_modified_since_alone_is_not_trusted(self):
+        response = self.client.get('/api/pacientes/')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.paciente.save()
+        self.assertEqual(self.client.get('/api/pacientes/', HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code, 200)
+
+
+class FullTextSearchTests(TestCase):
+    """The FTS5 index stays in sync after all migrations, including the ones rebuilding api_patient."""
+
+    def setUp(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('FTS5 is SQLite only')
+        self.client = APIClient()
+        self.client.force_authenticate(get_user_model().objects.create_user('recepcao'))
+
+    def test_triggers_exist(self):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger'")
+            triggers = {name for name, in cursor.fetchall()}
+        expected = {f'{table}_fts_{suffix}' for table in ('api_patient', 'api_appointment') for suffix in ('ai', 'ad', 'au')}
+        self.assertLessEqual(expected, triggers)
+
+    def search(self, termo):
+        return [item['id'] for item in self.client.get('/api/pacientes/', {'search': termo}).json()['results']]
+
+    def test_insert_and_update_are_searchable(self):
+        paciente = Patient.objects.create(nome='João Conceição', cpf='00000000011')
+        self.assertEqual(self.search('joao'), [paciente.pk])
+        paciente.nome = 'Estêvão Araújo'
+        paciente.save()
+        self.assertEqual(self.search('joao'), [])
+        self.assertEqual(self.search('araujo'), [paciente.pk])
+
+    def test_prefix_words_and_delete(self):
+        silva = Patient.objects.create(nome='Maria da Silva', cpf='00000000024')
+        Patient.objects.create(nome='Mário Souza', cpf='00000000025')
+        self.assertEqual(self.search('mar sil'), [silva.pk])
+        self.assertEqual(len(self.search('mar')), 2)
+        silva.delete()
+        self.assertEqual(self.search('sil'), [])
+
+    def test_ranked_busca_and_appointment_busca(self):
+        paciente = Patient.objects.create(nome='Ana Clara', cpf='00000000026')
+        Patient.objects.create(nome='Beatriz', cpf='00000000027', email='ana@example.com')
+        response = self.client.get('/api/pacientes/busca/', {'q': 'ana', 'limite': 1})
+        self.assertEqual(len(response.json()), 1)
+        self.assertEqual(self.client.get('/api/pacientes/busca/').status_code, 400)
+
+        agendamento = Appointment.objects.create(paciente=paciente, data='2030-07-01', horario='09:00', tipo='Extração')
+        outro = Appointment.objects.create(
+            paciente=Patient.objects.create(nome='Caio', cpf='00000000028'), data='2030-07-01', horario='10:00', tipo='Limpeza',
+        )
+        for termo, expected in (('extracao', [agendamento.pk]), ('clara', [agendamento.pk]), ('limp', [outro.pk])):
+            with self.subTest(termo=termo):
+                results = self.client.get('/api/agendamentos/', {'busca': termo}).json()['results']
+                self.assertEqual([item['id'] for item in results], expected)
+
+
+class AppointmentWriteQueryCountTests(TestCase):
+    """Creating or editing an appointment, including its after-commit work, stays within a fixed query budget."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(get_user_model().objects.create_user('recepcao'))
+        self.paciente = Patient.objects.create(nome='Ana', cpf='00000000012')
+        # The first write of each table creates its version row
+        with self.captureOnCommitCallbacks(execute=True):
+            self.post('2030-01-10')
+
+    def post(self, data):
+        payload = {'paciente': self.paciente.pk, 'data': data, 'horario': '09:00', 'tipo': 'consulta', 'duracao': 30}
+        return self.client.post('/api/agendamentos/', payload, format='json')
+
+    def test_create(self):
+        with self.assertNumQueries(13), self.captureOnCommitCallbacks(execute=True):
+            response = self.post('2030-01-09')
+        self.assertEqual(response.status_code, 201)
+
+    def test_update(self):
+        pk = Appointment.objects.get().pk
+        with self.assertNumQueries(7), self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(f'/api/agendamentos/{pk}/', {'observacoes': 'retorno'}, format='json')
+        self.assertEqual(response.status_code, 200)
+
+
+class RecurringSeriesTests(TestCase):
+    """Virtual occurrences of a series are paginated, edited and checked for conflicts like stored appointments."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(get_user_model().objects.create_user('recepcao'))
+        self.paciente = Patient.objects.create(nome='Ana', cpf='00000000013')
+        # Mondays 2030-03-04, 11, 18 and 25
+        self.serie = AppointmentSeries.objects.create(
+            paciente=self.paciente, tipo='Ortodontia', horario='09:00', frequencia='semanal', inicio=datetime.date(2030, 3, 4), quantidade=4,
+        )
+        self.agendamentos = [
+            Appointment.objects.create(paciente=self.paciente, data=data, horario='10:00', tipo='Consulta')
+            for data in ('2030-03-04', '2030-03-11')
+        ]
+
+    def list_keys(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        return [(row['data'], row['horario'], row['id']) for row in body['results']], body
+
+    def test_keyset_pages_cross_real_and_virtual_rows(self):
+        primeiro, segundo = (agendamento.pk for agendamento in self.agendamentos)
+        expected = [
+            ('2030-03-04', '09:00', None), ('2030-03-04', '10:00', primeiro),
+            ('2030-03-11', '09:00', None), ('2030-03-11', '10:00', segundo),
+            ('2030-03-18', '09:00', None), ('2030-03-25', '09:00', None),
+        ]
+        for page_size in (1, 3, 4):
+            with self.subTest(page_size=page_size):
+                seen, url, pages = [], f'/api/agendamentos/?inicio=2030-03-01&fim=2030-03-31&page_size={page_size}', []
+                while url:
+                    rows, body = self.list_keys(url)
+                    seen.extend(rows)
+                    pages.append(rows)
+                    url = body['next']
+                self.assertEqual(seen, expected)
+
+                # And back again from the last page
+                url, back = body['previous'], []
+                while url:
+                    rows, body = self.list_keys(url)
+                    back[:0] = rows
+                    url = body['previous']
+                self.assertEqual(back + pages[-1], expected)
+
+    def test_cursor_of_virtual_row_carries_negative_series_id(self):
+        _, body = self.list_keys('/api/agendamentos/?inicio=2030-03-01&fim=2030-03-31&page_size=1')
+        cursor = parse_qs(urlsplit(body['next']).query)['cursor'][0]
+        position = json.loads(base64.urlsafe_b64decode(cursor))['p']
+        self.assertEqual(position, ['2030-03-04', '09:00', str(-self.serie.pk)])
+
+    def test_edit_occurrence_materializes_it(self):
+        url = f'/api/series/{self.serie.pk}/ocorrencias/2030-03-18/'
+        response = self.client.patch(url, {'horario': '11:00'}, format='json')
+        self.assertEqual(response.status_code, 201)
+        agendamento = Appointment.objects.get(serie=self.serie)
+        self.assertEqual((str(agendamento.data_original), agendamento.horario), ('2030-03-18', '11:00'))
+
+        rows, _ = self.list_keys('/api/agendamentos/?data=2030-03-18')
+        self.assertEqual(rows, [('2030-03-18', '11:00', agendamento.pk)])
+
+        response = self.client.patch(url, {'observacoes': 'Trazer exames'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Appointment.objects.filter(serie=self.serie).count(), 1)
+        self.assertEqual(self.client.patch(f'/api/series/{self.serie.pk}/ocorrencias/2030-03-19/', {}, format='json').status_code, 404)
+
+    def test_conflict_with_virtual_occurrence(self):
+        payload = {'paciente': self.paciente.pk, 'data': '2030-03-25', 'tipo': 'Consulta', 'duracao': 30}
+        response = self.client.post('/api/agendamentos/', {**payload, 'horario': '09:15'}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn(f'série #{self.serie.pk}', response.json()['horario'][0])
+        self.assertEqual(self.client.post('/api/agendamentos/', {**payload, 'horario': '09:30'}, format='json').status_code, 201)
+
+        # The occurrence being materialized does not clash with itself
+        response = self.client.patch(f'/api/series/{self.serie.pk}/ocorrencias/2030-03-25/', {'horario': '09:10', 'duracao': 20}, format='json')
+        self.assertEqual(response.status_code, 201)
+
+
+class KeysetPaginationTests(TestCase):
+    """Cursors walk every row exactly once in both directions, ties on the first field included."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(get_user_model().objects.create_user('recepcao'))
+        nomes = ['Bia', 'Ana', 'Caio', 'Ana', 'Bia', 'Ana', 'Duda']
+        self.pacientes = [Patient.objects.create(nome=nome, cpf=f'{14 + index:011d}') for index, nome in enumerate(nomes)]
+        horarios = [('2030-04-01', '09:00'), ('2030-04-01', '09:00'), ('2030-04-01', '08:00'), ('2030-04-02', '09:00'), ('2030-04-01', '09:00')]
+        self.agendamentos = [
+            Appointment.objects.create(paciente=self.pacientes[0], data=data, horario=horario, tipo='Consulta')
+            for data, horario in horarios
+        ]
+
+    def walk(self, url):
+        """Ids of every page following ``next`` from ``url``, then following ``previous`` back."""
+        forward, pages = [], []
+        while url:
+            body = self.client.get(url).json()
+            pages.append([row['id'] for row in body['results']])
+            forward.extend(pages[-1])
+            url, last = body['next'], body
+        backward, url = list(pages[-1]), last['previous']
+        while url:
+            body = self.client.get(url).json()
+            backward[:0] = [row['id'] for row in body['results']]
+            url = body['previous']
+        return forward, backward
+
+    def test_patients(self):
+        expected = [paciente.pk for paciente in sorted(self.pacientes, key=lambda paciente: (paciente.nome, paciente.pk))]
+        for page_size in (1, 2, 3):
+            with self.subTest(page_size=page_size):
+                self.assertEqual(self.walk(f'/api/pacientes/?page_size={page_size}'), (expected, expected))
+
+    def test_appointments(self):
+        expected = [
+            agendamento.pk
+            for agendamento in sorted(self.agendamentos, key=lambda agendamento: (str(agendamento.data), agendamento.horario, agendamento.pk))
+        ]
+        for page_size in (1, 2, 4):
+            with self.subTest(page_size=page_size):
+                self.assertEqual(self.walk(f'/api/agendamentos/?page_size={page_size}'), (expected, expected))
+
+    def test_unpaginated(self):
+        response = self.client.get('/api/pacientes/', {'paginar': 'false'})
+        self.assertIsInstance(response.json(), list)
+        self.assertEqual([row['id'] for row in response.json()], self.walk('/api/pacientes/?page_size=2')[0])
+        response = self.client.get('/api/agendamentos/', {'paginar': 'false'})
+        self.assertEqual(len(response.json()), len(self.agendamentos))
+
+
+class QueryPlanAuditTests(TestCase):
+    """Every query shape of the list endpoints is served by an index."""
+
+    def audit(self):
+        out = io.StringIO()
+        call_command('audit_query_plans', '--min-rows', '0', stdout=out)
+        return out.getvalue()
+
+    def test_no_full_scans(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('EXPLAIN QUERY PLAN is SQLite-only')
+        self.assertNotIn('FAIL', self.audit())
+
+    def test_missing_index_fails(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('EXPLAIN QUERY PLAN is SQLite-only')
+        with connection.cursor() as cursor:
+            cursor.execute('DROP INDEX appointment_status_data_idx')
+        with self.assertRaisesMessage(CommandError, 'agendamentos list ?status='):
+            self.audit()
+
+
+class DailyTotalsTests(TestCase):
+    """totais-diarios costs a fixed number of queries, is cached and is invalidated by writes."""
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(get_user_model().objects.create_user('recepcao'))
+        self.paciente = Patient.objects.create(nome='Ana', cpf='00000000021')
+        self.agendamento = Appointment.objects.create(paciente=self.paciente, data='2030-05-02', horario='09:00', tipo='Consulta')
+        Appointment.objects.create(paciente=self.paciente, data='2030-05-20', horario='09:00', tipo='Consulta', status='concluido')
+
+    def totais(self, **params):
+        response = self.client.get('/api/agendamentos/totais-diarios/', params or {'data': '2030-05-02'})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_queries_do_not_grow_with_the_range(self):
+        with self.assertNumQueries(4):
+            self.totais(data='2030-05-02')
+        with self.assertNumQueries(4):
+            rows = self.totais(inicio='2030-05-01', fim='2030-05-31')
+        self.assertEqual(len(rows), 31)
+        self.assertEqual([row['total_agendamentos_no_dia'] for row in rows if row['total_agendamentos_no_dia']], [1, 1])
+        self.assertEqual(sum(row['total_pendentes_no_dia'] for row in rows), 1)
+
+    def test_cached_until_a_write(self):
+        self.assertEqual(self.totais()['total_agendamentos_no_dia'], 1)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.totais()['total_pendentes_no_dia'], 1)
+
+        response = self.client.patch(f'/api/agendamentos/{self.agendamento.pk}/update_status/', {'status': 'concluido'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.totais()['total_pendentes_no_dia'], 0)
+
+        payload = {'paciente': self.paciente.pk, 'data': '2030-05-02', 'horario': '10:00', 'tipo': 'Consulta'}
+        self.assertEqual(self.client.post('/api/agendamentos/', payload, format='json').status_code, 201)
+        self.assertEqual(self.totais()['total_agendamentos_no_dia'], 2)
+
+        response = self.client.post('/api/agendamentos/status-em-lote/', {'ids': [self.agendamento.pk], 'status': 'confirmado'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.totais()['total_pendentes_no_dia'], 2)
+
+        Patient.objects.create(nome='Bia', cpf='00000000022')
+        self.assertEqual(self.totais()['total_pacientes'], 2)
+
+
+class AvailabilityTests(TestCase):
+    """The free-window sweep agrees with a minute-by-minute scan, and the endpoint sees every blocking source."""
+
+    @staticmethod
+    def scan(intervals, abertura, fechamento, duracao):
+        busy = {minute for start, end in intervals for minute in range(start, end)}
+        windows, start = [], None
+        for minute in range(abertura, fechamento + 1):
+            free = minute < fechamento and minute not in busy
+            if free and start is None:
+                start = minute
+            elif not free and start is not None:
+                if minute - start >= duracao:
+                    windows.append((start, minute))
+                start = None
+        return windows
+
+    def test_sweep_matches_scan(self):
+        rng = random.Random(6)
+        for _ in range(500):
+            intervals = []
+            for _ in range(rng.randint(0, 8)):
+                start = rng.randrange(420, 1140, 5)
+                intervals.append((start, start + rng.choice((15, 30, 45, 60, 120))))
+            intervals.sort()
+            duracao = rng.choice((15, 30, 60))
+            with self.subTest(intervals=intervals, duracao=duracao):
+                self.assertEqual(list(free_windows(intervals, 480, 1080, duracao)), self.scan(intervals, 480, 1080, duracao))
+
+    def test_endpoint(self):
+        client = APIClient()
+        client.force_authenticate(get_user_model().objects.create_user('recepcao'))
+        paciente = Patient.objects.create(nome='Ana', cpf='00000000023')
+        for horario, duracao, status in (('08:30', 60, 'agendado'), ('09:00', 30, 'confirmado'), ('13:00', 60, 'cancelado')):
+            Appointment.objects.create(paciente=paciente, data='2030-06-03', horario=horario, duracao=duracao, tipo='Consulta', status=status)
+        AppointmentSeries.objects.create(
+            paciente=paciente, tipo='Ortodontia', horario='14:00', duracao=90, frequencia='semanal', inicio=datetime.date(2030, 6, 3), quantidade=2,
+        )
+
+        response = client.get('/api/agendamentos/disponibilidade/', {'inicio': '2030-06-03', 'fim': '2030-06-04', 'duracao': 45})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), [
+            {'data': '2030-06-03', 'livres': [
+                {'inicio': '09:30', 'fim': '14:00'}, {'inicio': '15:30', 'fim': '18:00'},
+            ]},
+            {'data': '2030-06-04', 'livres': [{'inicio': '08:00', 'fim': '18:00'}]},
+        ])
+
+
+class ExportTests(TestCase):
+    """Exports stream every matching row, across chunk boundaries, in the list order."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(get_user_model().objects.create_user('recepcao'))
+
+    def export(self, url, **params):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode('utf-8')
+
+    def test_patients_csv(self):
+        total = EXPORT_CHUNK_SIZE + 10
+        Patient.objects.bulk_create([Patient(nome=f'Paciente {index % 7}', cpf=f'{100 + index:011d}') for index in range(total)])
+        rows = list(csv.DictReader(io.StringIO(self.export('/api/pacientes/exportar/'))))
+        self.assertEqual(len(rows), total)
+        expected = list(Patient.objects.order_by('nome', 'id').values_list('id', flat=True))
+        self.assertEqual([int(row['id']) for row in rows], expected)
+
+    def test_appointments_csv_and_ndjson(self):
+        paciente = Patient.objects.create(nome='Ana', cpf='00000000029')
+        observacoes = 'Alergia: dipirona, "AAS"\nRetorno em 15 dias'
+        Appointment.objects.create(paciente=paciente, data='2030-08-01', horario='09:00', tipo='Consulta', observacoes=observacoes)
+        Appointment.objects.create(paciente=paciente, data='2030-08-01', horario='10:00', tipo='Consulta', status='cancelado')
+
+        rows = list(csv.DictReader(io.StringIO(self.export('/api/agendamentos/exportar/'))))
+        self.assertEqual([row['observacoes'] for row in rows], [observacoes, ''])
+        rows = list(csv.DictReader(io.StringIO(self.export('/api/agendamentos/exportar/', status='cancelado'))))
+        self.assertEqual([row['status'] for row in rows], ['cancelado'])
+
+        lines = self.export('/api/agendamentos/exportar/', formato='ndjson').splitlines()
+        self.assertEqual([json.loads(line)['observacoes'] for line in lines], [observacoes, None])
+        self.assertEqual(self.client.get('/api/agendamentos/exportar/', {'formato': 'xlsx'}).status_code, 400)
+
+
+class DeltaSyncTests(TestCase):
+    """Delta sync returns what changed after the token, re-sending the overlap window, plus tombstones."""
+
+    def sync(self, since=None):
+        response = self.client.get('/api/sync/', {'since': since} if since else {})
+        self.assertEqual(response.status_code, 200)
+        return json.loads(b''.join(response.streaming_content))
+
+    def test_snapshot_then_delta(self):
+        ana = Patient.objects.create(nome='Ana', cpf='00000000030')
+        bia = Patient.objects.create(nome='Bia', cpf='00000000031')
+        agendamento = Appointment.objects.create(paciente=ana, data='2030-09-01', horario='09:00', tipo='Consulta')
+        snapshot = self.sync()
+        self.assertTrue(snapshot['completo'])
+        self.assertEqual({row['id'] for row in snapshot['pacientes']}, {ana.pk, bia.pk})
+        self.assertEqual([row['id'] for row in snapshot['agendamentos']], [agendamento.pk])
+
+        since = decode_token(snapshot['token'])
+        # Written before the token, but inside the overlap window: sent again
+        Patient.objects.filter(pk=ana.pk).update(atualizado_em=since - SYNC_OVERLAP / 2)
+        # Written before the overlap window: already known to the client
+        Patient.objects.filter(pk=bia.pk).update(atualizado_em=since - 2 * SYNC_OVERLAP)
+        Appointment.objects.filter(pk=agendamento.pk).update(atualizado_em=since - 2 * SYNC_OVERLAP)
+        caio = Patient.objects.create(nome='Caio', cpf='00000000032')
+        removido = agendamento.pk
+        agendamento.delete()
+        Tombstone.objects.create(tabela='pacientes', objeto_id=999)
+        Tombstone.objects.filter(objeto_id=999).update(removido_em=since - 2 * SYNC_OVERLAP)
+
+        delta = self.sync(snapshot['token'])
+        self.assertFalse(delta['completo'])
+        self.assertEqual(sorted(row['id'] for row in delta['pacientes']), [ana.pk, caio.pk])
+        self.assertEqual(delta['agendamentos'], [])
+        self.assertEqual(delta['removidos']['agendamentos'], [removido])
+        self.assertEqual(delta['removidos']['pacientes'], [])
+
+    def test_tokens(self):
+        self.assertEqual(self.client.get('/api/sync/', {'since': 'nao-e-um-token'}).status_code, 400)
+        expired = encode_token(timezone.now() - datetime.timedelta(days=getattr(settings, 'SYNC_TOMBSTONE_DIAS', 90) + 1))
+        self.assertTrue(self.sync(expired)['completo'])
+
+
+class FastModeTests(TestCase):
+    """The .values() list path and the orjson renderer produce the same JSON as DRF."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(get_user_model().objects.create_user('recepcao'))
+        endereco = Address.objects.create(cep='01001000', logradouro='Praça da Sé', numero='1', bairro='Sé', cidade='São Paulo', estado='SP')
+        ana = Patient.objects.create(
+            nome='Ana', cpf='00000000033', endereco=endereco, data_nascimento='1990-02-03', email='ana@example.com',
+        )
+        Anamnesis.objects.create(paciente=ana, alergias='Dipirona', fumante=True, ultima_consulta_dentista='2024-01-10')
+        ana.contatos.add(
+            Contact.objects.create(tipo='celular', numero='11999990000', is_whatsapp=True),
+            Contact.objects.create(tipo='telefone', numero='1133330000', observacao='Recado'),
+        )
+        Patient.objects.create(nome='Bia', cpf='00000000034')
+        serie = AppointmentSeries.objects.create(
+            paciente=ana, tipo='Ortodontia', horario='14:00', frequencia='mensal', inicio=datetime.date(2030, 10, 1), quantidade=2,
+        )
+        Appointment.objects.create(paciente=ana, data='2030-10-01', horario='09:00', tipo='Consulta', observacoes='Retorno')
+        Appointment.objects.create(
+            paciente=ana, serie=serie, data='2030-11-02', data_original=datetime.date(2030, 11, 1), horario='14:00', tipo='Ortodontia',
+        )
+
+    def test_lists_match_serializer(self):
+        for url in ('/api/pacientes/', '/api/pacientes/?fields=id,nome,contatos', '/api/pacientes/?expand=endereco',
+                    '/api/agendamentos/', '/api/agendamentos/?fields=id,paciente_nome,data_original', '/api/agendamentos/?paginar=false'):
+            with self.subTest(url=url):
+                with override_settings(API_FAST_MODE=False):
+                    expected = self.client.get(url).json()
+                with override_settings(API_FAST_MODE=True):
+                    self.assertEqual(self.client.get(url).json(), expected)
+
+    @unittest.skipIf(orjson is None, 'orjson is not installed')
+    def test_renderer_matches_drf(self):
+        data = {
+            'quando': timezone.now(), 'dia': datetime.date(2030, 1, 2), 'nome': 'João', 'ids': [1, 2],
+            'vazio': None, 'valor': decimal.Decimal('10.50'), 1: 'chave numérica',
+        }
+        self.assertEqual(json.loads(FastJSONRenderer().render(data)), json.loads(JSONRenderer().render(data)))
+        self.assertEqual(FastJSONParser().parse(io.BytesIO('{"nome": "João"}'.encode())), {'nome': 'João'})
+
+
+class SparseFieldsTests(TestCase):
+    """?fields= and ?expand= trim the response and the SQL behind it."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(get_user_model().objects.create_user('recepcao'))
+        endereco = Address.objects.create(cep='01001000', logradouro='Praça da Sé', numero='1', bairro='Sé', cidade='São Paulo', estado='SP')
+        self.paciente = Patient.objects.create(nome='Ana', cpf='00000000035', endereco=endereco)
+        self.paciente.contatos.add(Contact.objects.create(tipo='celular', numero='11999990000'))
+        Appointment.objects.create(paciente=self.paciente, data='2030-12-01', horario='09:00', tipo='Consulta', observacoes='Retorno')
+
+    def get(self, url, table):
+        """Response JSON and the SELECTs reading ``table`` or the prefetched relations, main query first."""
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        selects = [
+            query['sql'] for query in queries
+            if query['sql'].startswith('SELECT') and (f'"{table}"' in query['sql'] or f'"{table}_' in query['sql'])
+        ]
+        return response.json(), selects
+
+    def test_patient_fields(self):
+        body, selects = self.get('/api/pacientes/?fields=id,nome', 'api_patient')
+        self.assertEqual([set(row) for row in body['results']], [{'id', 'nome'}])
+        self.assertEqual(len(selects), 1)
+        self.assertNotIn('"cpf"', selects[0])
+        self.assertNotIn('JOIN', selects[0])
+
+        body, selects = self.get(f'/api/pacientes/{self.paciente.pk}/?fields=id,contatos', 'api_patient')
+        self.assertEqual(set(body), {'id', 'contatos'})
+        self.assertEqual(len(body['contatos']), 1)
+        self.assertEqual(len(selects), 2)
+        self.assertNotIn('"cpf"', selects[0])
+
+    def test_patient_expand(self):
+        body, selects = self.get('/api/pacientes/?expand=endereco', 'api_patient')
+        row = body['results'][0]
+        self.assertEqual(row['endereco']['cep'], '01001000')
+        self.assertNotIn('contatos', row)
+        self.assertNotIn('anamnese', row)
+        self.assertIn('"api_address"', selects[0])
+        self.assertEqual(len(selects), 1)
+
+        body, selects = self.get('/api/pacientes/?expand=', 'api_patient')
+        self.assertNotIn('endereco', body['results'][0])
+        self.assertNotIn('JOIN', selects[0])
+
+    def test_appointment_fields(self):
+        body, selects = self.get('/api/agendamentos/?fields=id,paciente_nome', 'api_appointment')
+        self.assertEqual(body['results'], [{'id': Appointment.objects.get().pk, 'paciente_nome': 'Ana'}])
+        self.assertNotIn('"observacoes"', selects[0])
+        self.assertIn('JOIN "api_patient"', selects[0])
+
+    def test_invalid(self):
+        self.assertEqual(self.client.get('/api/pacientes/', {'fields': 'id,senha'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/pacientes/', {'expand': 'consultas'}).status_code, 400)
+
+
+@override_settings(DATABASE_REPLICAS=['replica1'])
+class ReplicaRoutingTests(TestCase):
+    """Safe requests on the replica-aware views read from a replica, except right after the client wrote."""
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(get_user_model().objects.create_user('recepcao'))
+        Patient.objects.create(nome='Ana', cpf='00000000036')
+        # The test database has no replica: record where each read would go, then read from default
+        self.reads = []
+
+        def db_for_read(router, model, **hints):
+            self.reads.append(read_alias())
+            return 'default'
+
+        patcher = mock.patch.object(ReplicaRouter, 'db_for_read', db_for_read)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def read_from(self, method, url, data=None):
+        self.reads.clear()
+        response = getattr(self.client, method)(url, data, format='json')
+        self.assertLess(response.status_code, 400, response.content)
+        return set(self.reads)
+
+    def test_reads_go_to_the_replica(self):
+        self.assertEqual(self.read_from('get', '/api/pacientes/'), {'replica1'})
+        self.assertEqual(self.read_from('get', '/api/agendamentos/'), {'replica1'})
+        # Views without ReplicaReadMixin stay on the primary
+        self.assertEqual(self.read_from('get', '/api/enderecos/'), {'default'})
+
+    def test_read_your_writes(self):
+        # Validation reads of the write itself use the primary
+        self.assertEqual(self.read_from('post', '/api/pacientes/', {'nome': 'Bia', 'cpf': '00000000037'}), {'default'})
+        self.assertEqual(self.read_from('get', '/api/pacientes/'), {'default'})
+        # Once the replication lag has passed
+        cache.clear()
+        self.assertEqual(self.read_from('get', '/api/pacientes/'), {'replica1'})
+
+    def test_other_clients_keep_reading_the_replica(self):
+        self.read_from('post', '/api/pacientes/', {'nome': 'Bia', 'cpf': '00000000037'})
+        self.client.force_authenticate(get_user_model().objects.create_user('dentista'))
+        self.assertEqual(self.read_from('get', '/api/pacientes/'), {'replica1'})
+
+    def test_failed_writes_do_not_pin(self):
+        self.client.post('/api/pacientes/', {'nome': 'Ana', 'cpf': '00000000036'}, format='json')
+        self.assertEqual(self.read_from('get', '/api/pacientes/'), {'replica1'})
+
+
+class ConcurrentBookingTests(TransactionTestCase):
+    """Several workers booking the same slots through the API at the same time."""
+
+    THREADS = 8
+    HORARIOS = [f'{8 + index // 2:02d}:{30 * (index % 2):02d}' for index in range(10)]
+
+    def test_concurrent_bookings_neither_lock_nor_double_book(self):
+        paciente = Patient.objects.create(nome='Teste de concorrência', cpf='00000000001')
+        results = Counter()
+        lock = threading.Lock()
+        start = threading.Barrier(self.THREADS)
+
+        def book(seed):
+            local = Counter()
+            order = self.HORARIOS[:]
+            random.Random(seed).shuffle(order)
+            client = APIClient()
+            start.wait()
+            try:
+                for horario in order:
+                    try:
+                        response = client.post('/api/agendamentos/', {
+                            'paciente': paciente.pk, 'data': '2999-01-01', 'horario': horario,
+                            'tipo': 'Consulta', 'duracao': 30,
+                        }, format='json')
+                        local[response.status_code] += 1
+                    except OperationalError as exc:
+                        local['bloqueios' if 'locked' in str(exc) else 'outros_erros'] += 1
+            finally:
+                connection.close()
+                with lock:
+                    results.update(local)
+
+        threads = [threading.Thread(target=book, args=(seed,)) for seed in range(self.THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(results[201], len(self.HORARIOS))
+        self.assertEqual(results[400], len(self.HORARIOS) * (self.THREADS - 1))
+        self.assertEqual(sum(results.values()), len(self.HORARIOS) * self.THREADS)
+        duplicados = (
+            Appointment.objects.filter(paciente=paciente).values('horario')
+            .annotate(total=Count('id')).filter(total__gt=1)
+        )
+        self.assertFalse(duplicados.exists())
@@ -1,14 +1,15 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from .views import (
-    PatientViewSet, AppointmentViewSet,
+    PatientViewSet, AppointmentViewSet, AppointmentSeriesViewSet,
     AddressViewSet, ContactViewSet, AnamnesisViewSet,
-    CustomTokenObtainPairView,
+    CustomTokenObtainPairView, LogoutView, SyncView, MetricasView, agenda_eventos,
 )
 
 router = DefaultRouter()
 router.register(r"pacientes", PatientViewSet)
 router.register(r"agendamentos", AppointmentViewSet)
+router.register(r"series", AppointmentSeriesViewSet)
 router.register(r"enderecos", AddressViewSet)
 router.register(r"contatos", ContactViewSet)
 router.register(r"anamneses", AnamnesisViewSet)
@@ -16,4 +17,8 @@ router.register(r"anamneses", AnamnesisViewSet)
 urlpatterns = [
     path("", include(router.urls)),
     path("auth/login/", CustomTokenObtainPairView.as_view(), name="token_obtain_pair_custom"),
+    path("auth/logout/", LogoutView.as_view(), name="logout"),
+    path("sync/", SyncView.as_view(), name="sync"),
+    path("agenda/eventos/", agenda_eventos, name="agenda_eventos"),
+    path("debug/metricas/", MetricasView.as_view(), name="debug_metricas"),
 ]
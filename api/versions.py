@@ -0,0 +1,58 @@
+import threading
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import TableVersion
+
+# Tables waiting for the current transaction to commit (see bump_table_versions)
+_pending = threading.local()
+
+
+def _bump(tabelas):
+    updated = TableVersion.objects.filter(tabela__in=tabelas).update(versao=F('versao') + 1, atualizado_em=timezone.now())
+    if updated < len(tabelas):
+        # Tables written for the first time
+        existing = set(TableVersion.objects.filter(tabela__in=tabelas).values_list('tabela', flat=True))
+        for tabela in tabelas:
+            if tabela not in existing:
+                TableVersion.objects.get_or_create(tabela=tabela, defaults={'versao': 1})
+
+
+def _bump_pending():
+    tabelas = getattr(_pending, 'tabelas', None)
+    if tabelas:
+        _pending.tabelas = set()
+        _bump(sorted(tabelas))
+
+
+def bump_table_versions(*models):
+    """Increment the change counter of each model's table.
+
+    Inside a transaction the bump waits for the commit, and every table
+    touched by the transaction is bumped with one UPDATE: a request saving
+    several rows pays for one write, and a rollback leaves the versions alone
+    (the pending tables are then bumped with the next commit, which only
+    costs an extra revalidation).
+    """
+    tabelas = {model._meta.db_table for model in models}
+    if not transaction.get_connection().in_atomic_block:
+        _bump(sorted(tabelas))
+        return
+    if not hasattr(_pending, 'tabelas'):
+        _pending.tabelas = set()
+    _pending.tabelas.update(tabelas)
+    transaction.on_commit(_bump_pending)
+
+
+def table_versions(*models):
+    """Return {db_table: (versao, atualizado_em)} for the given models, in one query.
+
+    Tables never written since the counter was introduced are reported as (0, None).
+    """
+    tabelas = [model._meta.db_table for model in models]
+    versions = {tabela: (0, None) for tabela in tabelas}
+    for row in TableVersion.objects.filter(tabela__in=tabelas):
+        versions[row.tabela] = (row.versao, row.atualizado_em)
+    return versions
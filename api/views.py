@@ -1,20 +1,57 @@
+import asyncio
+import io
+
 from rest_framework import viewsets, filters, status
-from .models import Patient, Appointment, Address, Contact, Anamnesis
+from .models import Patient, Appointment, AppointmentSeries, Address, Contact, Anamnesis, parse_horario
 from .serializers import (
     PatientSerializer, AppointmentSerializer,
-    AddressSerializer, ContactSerializer, AnamnesisSerializer
+    AddressSerializer, ContactSerializer, AnamnesisSerializer,
+    PatientValuesSerializer, AppointmentValuesSerializer, AppointmentSeriesSerializer,
+)
+from .pagination import PatientPagination, AppointmentPagination
+from .stats import daily_totals
+from .details import appointment_details
+from .conditional import ConditionalGetMixin
+from .fastpath import FastListMixin
+from .sparse import SparseFieldsMixin
+from .replicas import ReplicaReadMixin
+from .recurrence import (
+    OccurrenceListMixin, is_occurrence, occurrence_defaults, series_conflict, virtual_occurrences,
+)
+from .sync import iter_sync, decode_token, InvalidSyncToken
+from .events import get_broker, format_sse
+from .authentication import revoke_token
+from .instrumentation import store as metrics_store
+from .signals import appointments_bulk_updated
+from .availability import availability
+from .archive import patient_history
+from .filters import FullTextSearchFilter
+from .search import build_match_query, ranked_ids, search_q
+from .imports import PatientImporter, IMPORT_ENCODING, IMPORT_FORMATS, check_encoding
+from .exports import (
+    CONTENT_TYPES as EXPORT_FORMATS, PATIENT_EXPORT_FIELDS, APPOINTMENT_EXPORT_FIELDS, streaming_export,
 )
-from rest_framework.permissions import IsAuthenticatedOrReadOnly
+from rest_framework.permissions import IsAuthenticated, IsAuthenticatedOrReadOnly, IsAdminUser
 from rest_framework.decorators import action
+from rest_framework.views import APIView
+from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.response import Response
+from django.db import transaction
+from django.apps import apps as django_apps
+from django.conf import settings
 from django.db.models import Q
 from django.utils import timezone
+from django.core.handlers.asgi import ASGIRequest
+from django.http import JsonResponse, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET
 from django.utils.decorators import method_decorator
 
 # Authentication helpers
 from rest_framework_simplejwt.views import TokenObtainPairView
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt.exceptions import TokenError
 from rest_framework.permissions import AllowAny
 
 
@@ -38,6 +75,22 @@ class CustomTokenObtainPairView(TokenObtainPairView):
     serializer_class = CustomTokenObtainPairSerializer
 
 
+class LogoutView(APIView):
+    """Revoke the access token of the request (and blacklist ``refresh`` when
+    the simplejwt blacklist app is installed)."""
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        refresh = request.data.get('refresh')
+        if refresh and django_apps.is_installed('rest_framework_simplejwt.token_blacklist'):
+            try:
+                RefreshToken(refresh).blacklist()
+            except TokenError:
+                return Response({'detail': 'Refresh token inválido.'}, status=status.HTTP_400_BAD_REQUEST)
+        revoke_token(request.auth)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
 class AddressViewSet(viewsets.ModelViewSet):
     queryset = Address.objects.all()
     serializer_class = AddressSerializer
@@ -72,12 +125,110 @@ class AnamnesisViewSet(viewsets.ModelViewSet):
         return qs
 
 
-class PatientViewSet(viewsets.ModelViewSet):
-    queryset = Patient.objects.all().order_by('nome')
+class PatientViewSet(ReplicaReadMixin, ConditionalGetMixin, FastListMixin, SparseFieldsMixin, viewsets.ModelViewSet):
+    # endereco and anamnese are joined in the main query and contatos is
+    # prefetched, so serializing a list costs two queries regardless of size.
+    queryset = (
+        Patient.objects.all()
+        .select_related('endereco', 'anamnese')
+        .prefetch_related('contatos')
+        .order_by('nome')
+    )
     serializer_class = PatientSerializer
+    values_serializer_class = PatientValuesSerializer
     permission_classes = [AllowAny]
-    filter_backends = [filters.SearchFilter]
-    search_fields = ['nome', 'email', 'cpf']
+    pagination_class = PatientPagination
+    conditional_models = (Patient, Address, Contact, Anamnesis)
+    expandable = {
+        'endereco': {'select_related': ['endereco']},
+        'anamnese': {'select_related': ['anamnese']},
+        'contatos': {'prefetch_related': ['contatos']},
+    }
+    sparse_columns = {'endereco': ['endereco']}
+    sparse_required_columns = ('id', 'nome')
+    filter_backends = [FullTextSearchFilter]
+    BUSCA_MAX_RESULTADOS = 100
+    # ?ordenar= values; each has an index on (campo, id), see api.summary
+    ORDENAVEIS = ('nome', 'ultima_visita', 'proxima_visita', 'total_faltas')
+
+    def get_ordering(self):
+        ordenar = self.request.query_params.get('ordenar', 'nome')
+        if ordenar.lstrip('-') not in self.ORDENAVEIS:
+            validos = [f'{prefix}{name}' for name in self.ORDENAVEIS for prefix in ('', '-')]
+            raise ValidationError({'ordenar': f'Ordenação inválida. Valores válidos: {validos}'})
+        return (ordenar, '-id' if ordenar.startswith('-') else 'id')
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if self.action == 'list' and self.paginator is not None:
+            self.paginator.ordering = self.get_ordering()
+
+    def get_queryset(self):
+        qs = super().get_queryset()
+        params = self.request.query_params
+        try:
+            if params.get('ultima_visita_antes'):
+                qs = qs.filter(ultima_visita__lt=timezone.datetime.fromisoformat(params['ultima_visita_antes']).date())
+            if params.get('min_faltas'):
+                qs = qs.filter(total_faltas__gte=int(params['min_faltas']))
+        except ValueError:
+            raise ValidationError({'detail': 'Use YYYY-MM-DD em "ultima_visita_antes" e um número em "min_faltas".'})
+        com_proxima = params.get('com_proxima_visita')
+        if com_proxima:
+            qs = qs.filter(proxima_visita__isnull=com_proxima.lower() in ('0', 'false', 'nao', 'não'))
+        if self.paginator is not None:
+            # Same order as the pages for ?paginar=false
+            qs = qs.order_by(*self.paginator.get_order_by(Patient))
+        return qs
+
+    @action(detail=False, methods=['get'])
+    def busca(self, request):
+        """Ranked, accent-insensitive prefix search: ?q=joao sil&limite=20"""
+        text = request.query_params.get('q', '')
+        if not build_match_query(text):
+            return Response({'detail': 'Parâmetro "q" é obrigatório.'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            limite = min(int(request.query_params.get('limite', 20)), self.BUSCA_MAX_RESULTADOS)
+        except ValueError:
+            limite = 20
+        ids = ranked_ids(Patient, text, max(limite, 1))
+        patients = self.get_queryset().in_bulk(ids)
+        serializer = self.get_serializer([patients[pk] for pk in ids if pk in patients], many=True)
+        return Response(serializer.data)
+
+    @action(detail=False, methods=['get'])
+    def exportar(self, request):
+        """Stream the (filtered) patient list as ?formato=csv (default) or ndjson."""
+        formato = request.query_params.get('formato', 'csv')
+        if formato not in EXPORT_FORMATS:
+            return Response({'detail': f'Formato inválido. Valores válidos: {sorted(EXPORT_FORMATS)}'}, status=status.HTTP_400_BAD_REQUEST)
+        qs = self.filter_queryset(self.get_queryset()).order_by('nome', 'id')
+        return streaming_export(qs, PATIENT_EXPORT_FIELDS, formato, 'pacientes')
+
+    @action(detail=False, methods=['post'])
+    def importar(self, request):
+        """Bulk import patients from an uploaded CSV or NDJSON file (multipart field "arquivo").
+
+        The format comes from ?formato= or the file extension and the text
+        encoding from ?codificacao= (UTF-8 by default). Returns a report with
+        per-line errors; valid lines are imported even if others fail.
+        """
+        arquivo = request.FILES.get('arquivo')
+        if arquivo is None:
+            return Response({'detail': 'Envie o arquivo no campo "arquivo".'}, status=status.HTTP_400_BAD_REQUEST)
+        formato = request.query_params.get('formato') or arquivo.name.rsplit('.', 1)[-1].lower()
+        if formato not in IMPORT_FORMATS:
+            return Response({'detail': f'Formato inválido. Valores válidos: {list(IMPORT_FORMATS)}'}, status=status.HTTP_400_BAD_REQUEST)
+
+        codificacao = check_encoding(request.query_params.get('codificacao') or IMPORT_ENCODING)
+        if codificacao is None:
+            return Response({'detail': 'Codificação inválida. Exemplos: utf-8, latin-1, cp1252.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        # newline='' as the csv module requires: quoted fields may contain line breaks
+        stream = io.TextIOWrapper(arquivo.file, encoding=codificacao, newline='')
+        report = PatientImporter().run(stream, formato)
+        ok = report['importados'] and 'detail' not in report
+        return Response(report, status=status.HTTP_201_CREATED if ok else status.HTTP_400_BAD_REQUEST)
 
     @action(detail=True, methods=['post'])
     def add_contact(self, request, pk=None):
@@ -118,86 +269,137 @@ class PatientViewSet(viewsets.ModelViewSet):
         except Anamnesis.DoesNotExist:
             return Response({'detail': 'Anamnese não encontrada'}, status=status.HTTP_404_NOT_FOUND)
 
+    @action(detail=True, methods=['get'])
+    def historico(self, request, pk=None):
+        """Full appointment history of the patient, including archived appointments
+        (see api.archive), ordered by date. Optional ?status= filter."""
+        patient = self.get_object()
+        return Response(list(patient_history(patient.pk, request.query_params.get('status'))))
+
 
-class AppointmentViewSet(viewsets.ModelViewSet):
-    queryset = Appointment.objects.all().order_by("data", "horario")
+class AppointmentViewSet(ReplicaReadMixin, ConditionalGetMixin, OccurrenceListMixin, FastListMixin, SparseFieldsMixin,
+                         viewsets.ModelViewSet):
+    queryset = Appointment.objects.select_related("paciente").order_by("data", "horario")
     serializer_class = AppointmentSerializer
+    values_serializer_class = AppointmentValuesSerializer
     permission_classes = [AllowAny]
+    pagination_class = AppointmentPagination
+    conditional_models = (Appointment, AppointmentSeries, Patient)
+    expandable = {
+        'paciente_nome': {'select_related': ['paciente']},
+    }
+    sparse_columns = {'paciente_nome': ['paciente', 'paciente__nome']}
+    sparse_required_columns = ('id', 'data', 'horario')
+    TOTAIS_MAX_DIAS = 366
+    STATUS_LOTE_MAX = 1000
+
+    # The overlap check runs in the serializer's validate(); checking and
+    # writing in one transaction (IMMEDIATE on SQLite) keeps concurrent
+    # bookings of the same slot from both passing it
+    def create(self, request, *args, **kwargs):
+        with transaction.atomic():
+            return super().create(request, *args, **kwargs)
+
+    def update(self, request, *args, **kwargs):
+        with transaction.atomic():
+            return super().update(request, *args, **kwargs)
 
     def get_queryset(self):
         qs = super().get_queryset()
-        data = self.request.query_params.get("data")
         status = self.request.query_params.get("status")
         busca = self.request.query_params.get("busca")
-        if data:
-            qs = qs.filter(data=data)
+        window = self.parse_window()
+        if window is not None:
+            qs = qs.filter(data__range=window)
         if status:
             qs = qs.filter(status=status)
-        if busca:
-            qs = qs.filter(Q(paciente__nome__icontains=busca) | Q(tipo__icontains=busca))
+        if busca and build_match_query(busca):
+            qs = qs.filter(
+                Q(paciente_id__in=Patient.objects.filter(search_q(Patient, busca)).values('pk'))
+                | search_q(Appointment, busca)
+            )
         return qs
 
+    def filter_series(self, series):
+        busca = self.request.query_params.get("busca")
+        if busca and build_match_query(busca):
+            series = series.filter(
+                Q(paciente_id__in=Patient.objects.filter(search_q(Patient, busca)).values('pk'))
+                | Q(tipo__icontains=busca)
+            )
+        return series
+
     @action(detail=False, methods=["get"])
     def proximas(self, request):
-        today = request.query_params.get("data")
+        not_modified = self.not_modified(request)
+        if not_modified:
+            return not_modified
+        # ?data= is applied by get_queryset()
         qs = self.get_queryset()
-        if today:
-            qs = qs.filter(data=today)
+        occurrences = self.get_virtual_occurrences()
+        if occurrences:
+            qs = sorted([*qs, *occurrences], key=self.paginator.get_row_key)
         serializer = self.get_serializer(qs, many=True)
         return Response(serializer.data)
 
+    @action(detail=False, methods=['get'])
+    def exportar(self, request):
+        """Stream the appointments matching the list filters (data, status, busca)
+        as ?formato=csv (default) or ndjson."""
+        formato = request.query_params.get('formato', 'csv')
+        if formato not in EXPORT_FORMATS:
+            return Response({'detail': f'Formato inválido. Valores válidos: {sorted(EXPORT_FORMATS)}'}, status=status.HTTP_400_BAD_REQUEST)
+        qs = self.get_queryset().order_by('data', 'horario', 'id')
+        return streaming_export(qs, APPOINTMENT_EXPORT_FIELDS, formato, 'agendamentos')
+
+    @action(detail=False, methods=['get'])
+    def disponibilidade(self, request):
+        """Return the free time windows per day in a date range.
+
+        Query params:
+        - inicio, fim: YYYY-MM-DD (fim defaults to inicio)
+        - abertura, fechamento: working hours, HH:MM (defaults 08:00 and 18:00)
+        - duracao: minimum window length in minutes (default 30)
+        """
+        params = request.query_params
+        try:
+            inicio = timezone.datetime.fromisoformat(params['inicio']).date()
+            fim = timezone.datetime.fromisoformat(params.get('fim', params['inicio'])).date()
+        except Exception:
+            return Response({'detail': 'Informe "inicio" (e opcionalmente "fim") no formato YYYY-MM-DD.'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            abertura = parse_horario(params.get('abertura', '08:00'))
+            fechamento = parse_horario(params.get('fechamento', '18:00'))
+        except ValueError:
+            return Response({'detail': 'Horário inválido. Use HH:MM.'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            duracao = int(params.get('duracao', 30))
+        except ValueError:
+            duracao = 0
+
+        if duracao <= 0:
+            return Response({'detail': 'A duração deve ser um inteiro maior que zero.'}, status=status.HTTP_400_BAD_REQUEST)
+        if fechamento <= abertura:
+            return Response({'detail': '"fechamento" deve ser depois de "abertura".'}, status=status.HTTP_400_BAD_REQUEST)
+        if fim < inicio:
+            return Response({'detail': '"fim" deve ser maior ou igual a "inicio".'}, status=status.HTTP_400_BAD_REQUEST)
+        if (fim - inicio).days >= self.TOTAIS_MAX_DIAS:
+            return Response({'detail': f'Intervalo máximo de {self.TOTAIS_MAX_DIAS} dias.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response(availability(inicio, fim, abertura, fechamento, duracao))
+
     @action(detail=True, methods=['get'])
     def detalhes(self, request, pk=None):
-        agendamento = self.get_object()
-        paciente = agendamento.paciente
-
-        # Dados do paciente
-        dados_paciente = {
-            'id': paciente.id,
-            'nome': paciente.nome,
-            'cpf': paciente.cpf,
-            'data_nascimento': paciente.data_nascimento,
-            'sexo': paciente.get_sexo_display() if paciente.sexo else None,
-            'email': paciente.email,
-            'contatos': ContactSerializer(paciente.contatos.all(), many=True).data
-        }
-
-        # Dados relevantes da anamnese
         try:
-            anamnese = paciente.anamnese
-            dados_anamnese = {
-                'alergias': anamnese.alergias,
-                'medicamentos': anamnese.medicamentos,
-                'problemas_saude': anamnese.problemas_saude,
-                'diabetes': anamnese.diabetes,
-                'hipertensao': anamnese.hipertensao,
-                'problemas_cardiacos': anamnese.problemas_cardiacos,
-                'gestante': anamnese.gestante
-            }
-        except Anamnesis.DoesNotExist:
-            dados_anamnese = None
-
-        # Dados do agendamento
-        dados_agendamento = {
-            'id': agendamento.id,
-            'data': agendamento.data,
-            'horario': agendamento.horario,
-            'tipo': agendamento.tipo,
-            'status': agendamento.status,
-            'status_display': dict(agendamento.STATUS_CHOICES).get(agendamento.status, agendamento.status),
-            'duracao': agendamento.duracao,
-            'observacoes': agendamento.observacoes
-        }
-
-        data = {
-            'agendamento': dados_agendamento,
-            'paciente': dados_paciente,
-            'anamnese': dados_anamnese
-        }
-
+            data = appointment_details(int(pk))
+        except ValueError:
+            data = None
+        if data is None:
+            raise NotFound()
         return Response(data)
 
     @action(detail=True, methods=['patch'], url_path='update_status')
+    @transaction.atomic
     def update_status(self, request, pk=None):
         """Update only the status field of an appointment (partial update).
 
@@ -213,11 +415,98 @@ class AppointmentViewSet(viewsets.ModelViewSet):
         if new_status not in valid_choices:
             return Response({'detail': f'Status inválido. Valores válidos: {sorted(valid_choices)}'}, status=status.HTTP_400_BAD_REQUEST)
 
+        if (agendamento.status in Appointment.NON_BLOCKING_STATUSES
+                and new_status not in Appointment.NON_BLOCKING_STATUSES
+                and agendamento.inicio_minutos is not None):
+            conflito = (
+                Appointment.objects.overlapping(agendamento.data, agendamento.inicio_minutos, agendamento.fim_minutos)
+                .exclude(pk=agendamento.pk)
+                .first()
+            )
+            if conflito is not None:
+                return Response({'detail': f'Conflito com o agendamento #{conflito.id} às {conflito.horario}.'}, status=status.HTTP_409_CONFLICT)
+            ocorrencia = (agendamento.serie_id, agendamento.data_original) if agendamento.serie_id else None
+            conflito = series_conflict(agendamento.data, agendamento.inicio_minutos, agendamento.fim_minutos, exclude=ocorrencia)
+            if conflito is not None:
+                return Response({'detail': f'Conflito com a série #{conflito.serie_id} às {conflito.horario}.'}, status=status.HTTP_409_CONFLICT)
+
         agendamento.status = new_status
         agendamento.save()
         serializer = self.get_serializer(agendamento)
         return Response(serializer.data)
 
+    @action(detail=False, methods=['post'], url_path='status-em-lote')
+    def status_em_lote(self, request):
+        """Change the status of many appointments in one request.
+
+        Expects JSON, either {"ids": [1, 2], "status": "concluido"} or
+        {"atualizacoes": [{"id": 1, "status": "concluido"}, {"id": 2, "status": "nao_compareceu"}]}.
+        Applies one UPDATE per target status in a single transaction and returns
+        the updated ids per status, plus ids not found or rejected for conflict.
+        """
+        if not isinstance(request.data, dict):
+            return Response({'detail': 'O corpo deve ser um objeto JSON com "ids" e "status" ou "atualizacoes".'}, status=status.HTTP_400_BAD_REQUEST)
+        if 'atualizacoes' in request.data:
+            updates = request.data.get('atualizacoes')
+            if not isinstance(updates, list) or not all(isinstance(item, dict) for item in updates):
+                return Response({'detail': '"atualizacoes" deve ser uma lista de {"id", "status"}.'}, status=status.HTTP_400_BAD_REQUEST)
+            pairs = [(item.get('id'), item.get('status')) for item in updates]
+        else:
+            ids = request.data.get('ids')
+            if not isinstance(ids, list):
+                return Response({'detail': 'Campos "ids" (lista) e "status" são obrigatórios.'}, status=status.HTTP_400_BAD_REQUEST)
+            pairs = [(pk, request.data.get('status')) for pk in ids]
+
+        if len(pairs) > self.STATUS_LOTE_MAX:
+            return Response({'detail': f'Máximo de {self.STATUS_LOTE_MAX} agendamentos por requisição.'}, status=status.HTTP_400_BAD_REQUEST)
+        valid_choices = {choice[0] for choice in Appointment.STATUS_CHOICES}
+        invalid = sorted({str(new_status) for _, new_status in pairs if new_status not in valid_choices})
+        if invalid:
+            return Response({'detail': f'Status inválido: {invalid}. Valores válidos: {sorted(valid_choices)}'}, status=status.HTTP_400_BAD_REQUEST)
+        if not all(isinstance(pk, int) and not isinstance(pk, bool) for pk, _ in pairs):
+            return Response({'detail': 'Os ids devem ser inteiros.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        targets = {}
+        for pk, new_status in pairs:
+            targets[pk] = new_status
+
+        with transaction.atomic():
+            current = {
+                row['id']: row
+                for row in Appointment.objects.filter(id__in=targets).values(
+                    'id', 'status', 'data', 'inicio_minutos', 'fim_minutos', 'serie_id', 'data_original',
+                )
+            }
+            by_status = {}
+            conflitos = []
+            for pk, new_status in targets.items():
+                row = current.get(pk)
+                if row is None:
+                    continue
+                if (row['status'] in Appointment.NON_BLOCKING_STATUSES
+                        and new_status not in Appointment.NON_BLOCKING_STATUSES
+                        and row['inicio_minutos'] is not None
+                        and (Appointment.objects.overlapping(row['data'], row['inicio_minutos'], row['fim_minutos'])
+                             .exclude(pk=pk).exists()
+                             or series_conflict(row['data'], row['inicio_minutos'], row['fim_minutos'],
+                                                exclude=(row['serie_id'], row['data_original'])))):
+                    conflitos.append(pk)
+                    continue
+                by_status.setdefault(new_status, []).append(pk)
+
+            for new_status, ids in by_status.items():
+                Appointment.objects.filter(id__in=ids).update(status=new_status, atualizado_em=timezone.now())
+
+        updated = [pk for ids in by_status.values() for pk in ids]
+        if updated:
+            appointments_bulk_updated.send(sender=Appointment, ids=updated, fields=['status'])
+
+        return Response({
+            'atualizados': {new_status: sorted(ids) for new_status, ids in by_status.items()},
+            'nao_encontrados': sorted(pk for pk in targets if pk not in current),
+            'conflitos': sorted(conflitos),
+        })
+
     @action(detail=False, methods=['get'], url_path='totais-diarios')
     def totais_diarios(self, request):
         """Return daily totals:
@@ -226,29 +515,176 @@ class AppointmentViewSet(viewsets.ModelViewSet):
         - total_pendentes_no_dia
 
         Optional query param: ?data=YYYY-MM-DD (defaults to today)
+        Or a range: ?inicio=YYYY-MM-DD&fim=YYYY-MM-DD, returning a list with one
+        row per day (at most TOTAIS_MAX_DIAS days).
         """
-        data_str = request.query_params.get('data')
-        if data_str:
-            try:
-                day = timezone.datetime.fromisoformat(data_str).date()
-            except Exception:
-                return Response({'detail': 'Formato de data inválido. Use YYYY-MM-DD.'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            if 'inicio' in request.query_params or 'fim' in request.query_params:
+                inicio = timezone.datetime.fromisoformat(request.query_params['inicio']).date()
+                fim = timezone.datetime.fromisoformat(request.query_params['fim']).date()
+            else:
+                data_str = request.query_params.get('data')
+                inicio = fim = timezone.datetime.fromisoformat(data_str).date() if data_str else timezone.localdate()
+        except Exception:
+            return Response({'detail': 'Formato de data inválido. Use YYYY-MM-DD.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        if fim < inicio:
+            return Response({'detail': '"fim" deve ser maior ou igual a "inicio".'}, status=status.HTTP_400_BAD_REQUEST)
+        if (fim - inicio).days >= self.TOTAIS_MAX_DIAS:
+            return Response({'detail': f'Intervalo máximo de {self.TOTAIS_MAX_DIAS} dias.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        rows = daily_totals(inicio, fim)
+        if 'inicio' in request.query_params:
+            return Response(rows)
+        return Response(rows[0])
+
+
+class AppointmentSeriesViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
+    """Recurring appointments. Occurrences are expanded on read and only
+    stored as appointments once edited (see ``api.recurrence``)."""
+    queryset = AppointmentSeries.objects.select_related('paciente').order_by('inicio', 'horario', 'id')
+    serializer_class = AppointmentSeriesSerializer
+    permission_classes = [AllowAny]
+    conditional_models = (AppointmentSeries, Appointment, Patient)
+    OCORRENCIA_CAMPOS = ('data', 'horario', 'duracao', 'tipo', 'status', 'observacoes')
+
+    # Conflict checks and writes in one transaction, as in AppointmentViewSet
+    def create(self, request, *args, **kwargs):
+        with transaction.atomic():
+            return super().create(request, *args, **kwargs)
+
+    def update(self, request, *args, **kwargs):
+        with transaction.atomic():
+            return super().update(request, *args, **kwargs)
+
+    @action(detail=True, methods=['get'])
+    def ocorrencias(self, request, pk=None):
+        """Occurrences of the series between ?inicio= and ?fim= (YYYY-MM-DD, at
+        most AppointmentViewSet.TOTAIS_MAX_DIAS days), stored and virtual."""
+        not_modified = self.not_modified(request)
+        if not_modified:
+            return not_modified
+        serie = self.get_object()
+        try:
+            inicio = timezone.datetime.fromisoformat(request.query_params['inicio']).date()
+            fim = timezone.datetime.fromisoformat(request.query_params['fim']).date()
+        except Exception:
+            return Response({'detail': 'Informe "inicio" e "fim" no formato YYYY-MM-DD.'}, status=status.HTTP_400_BAD_REQUEST)
+        if fim < inicio:
+            return Response({'detail': '"fim" deve ser maior ou igual a "inicio".'}, status=status.HTTP_400_BAD_REQUEST)
+        if (fim - inicio).days >= AppointmentViewSet.TOTAIS_MAX_DIAS:
+            return Response({'detail': f'Intervalo máximo de {AppointmentViewSet.TOTAIS_MAX_DIAS} dias.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        stored = Appointment.objects.select_related('paciente').filter(serie=serie, data_original__range=(inicio, fim))
+        virtual = virtual_occurrences(inicio, fim, AppointmentSeries.objects.filter(pk=serie.pk))
+        rows = sorted([*stored, *virtual], key=lambda row: (row.data_original, row.data, row.horario))
+        return Response(AppointmentSerializer(rows, many=True).data)
+
+    @action(detail=True, methods=['patch'], url_path=r'ocorrencias/(?P<data_original>\d{4}-\d{2}-\d{2})')
+    @transaction.atomic
+    def editar_ocorrencia(self, request, pk=None, data_original=None):
+        """Edit one occurrence, storing it as an appointment on first edit.
+
+        Accepts the fields in OCORRENCIA_CAMPOS, e.g. {"horario": "10:00"} to
+        move it or {"status": "cancelado"} to cancel it.
+        """
+        serie = self.get_object()
+        try:
+            day = timezone.datetime.fromisoformat(data_original).date()
+        except ValueError:
+            raise NotFound()
+        if not is_occurrence(serie, day):
+            raise NotFound('Não há ocorrência da série nesta data.')
+
+        changes = {field: request.data[field] for field in self.OCORRENCIA_CAMPOS if field in request.data}
+        instance = Appointment.objects.filter(serie=serie, data_original=day).first()
+        if instance is not None:
+            serializer = AppointmentSerializer(instance, data=changes, partial=True)
         else:
-            day = timezone.localdate()
+            serializer = AppointmentSerializer(
+                data={**occurrence_defaults(serie, day), **changes}, context={'ocorrencia': (serie.pk, day)},
+            )
+        serializer.is_valid(raise_exception=True)
+        serializer.save(serie=serie, data_original=day)
+        return Response(serializer.data, status=status.HTTP_200_OK if instance is not None else status.HTTP_201_CREATED)
 
-        # total appointments on the day
-        total_agendamentos = Appointment.objects.filter(data=day).count()
 
-        # total patients in the system
-        total_pacientes = Patient.objects.count()
+class SyncView(APIView):
+    """Delta sync for offline-capable clients.
 
-        # pending appointments (status equals 'agendado' or other pending statuses) on the day
-        pending_statuses = ['agendado', 'confirmado']
-        total_pendentes = Appointment.objects.filter(data=day, status__in=pending_statuses).count()
+    GET /api/sync/ returns a full snapshot plus a token; GET /api/sync/?since=<token>
+    returns only rows created, updated or deleted since that token. The JSON
+    is streamed, so a full snapshot of a large clinic is never built in memory.
+    """
+    permission_classes = [AllowAny]
 
-        return Response({
-            'data': str(day),
-            'total_agendamentos_no_dia': total_agendamentos,
-            'total_pacientes': total_pacientes,
-            'total_pendentes_no_dia': total_pendentes,
-        })
+    def get(self, request):
+        token = request.query_params.get('since')
+        try:
+            since = decode_token(token) if token else None
+        except InvalidSyncToken as exc:
+            return Response({'detail': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        return StreamingHttpResponse(iter_sync(since), content_type='application/json')
+
+
+class MetricasView(APIView):
+    """Per-endpoint latency and query percentiles collected by InstrumentationMiddleware.
+
+    Admin-only, DEBUG or not. DELETE clears the samples.
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response(metrics_store.report())
+
+    def delete(self, request):
+        metrics_store.reset()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+AGENDA_HEARTBEAT_SECONDS = 15
+
+
+@require_GET
+async def agenda_eventos(request):
+    """Server-sent events with the agenda changes of a day (?data=YYYY-MM-DD, default today).
+
+    Emits ``criado``, ``atualizado``, ``status`` and ``removido`` events as
+    appointments change. Requires an ASGI server (e.g. ``uvicorn backend.asgi:application``):
+    under WSGI (``runserver``) each stream would hold a worker thread, so it
+    answers 501. Each connection is closed after ``AGENDA_STREAM_SECONDS``;
+    EventSource reconnects on its own (``retry``).
+    """
+    if not isinstance(request, ASGIRequest):
+        return JsonResponse(
+            {'detail': 'Eventos da agenda exigem um servidor ASGI (ex.: uvicorn backend.asgi:application).'},
+            status=501,
+        )
+    data_str = request.GET.get('data')
+    try:
+        day = timezone.datetime.fromisoformat(data_str).date() if data_str else timezone.localdate()
+    except ValueError:
+        return JsonResponse({'detail': 'Formato de data inválido. Use YYYY-MM-DD.'}, status=400)
+
+    broker = get_broker()
+    subscription = broker.subscribe(day)
+
+    async def stream():
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + getattr(settings, 'AGENDA_STREAM_SECONDS', 300)
+        try:
+            yield 'retry: 3000\n\n'
+            while (remaining := deadline - loop.time()) > 0:
+                try:
+                    event = await asyncio.wait_for(subscription.get(), timeout=min(AGENDA_HEARTBEAT_SECONDS, remaining))
+                except asyncio.TimeoutError:
+                    yield ': ping\n\n'
+                    continue
+                yield format_sse(event)
+        finally:
+            broker.unsubscribe(subscription)
+
+    response = StreamingHttpResponse(stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
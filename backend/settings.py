@@ -1,5 +1,8 @@
 from pathlib import Path
 import os
+import tempfile
+
+import django
 
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -34,8 +37,18 @@ MIDDLEWARE = [
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
+    "api.replicas.ReadYourWritesMiddleware",
 ]
 
+# Query count / latency instrumentation (Server-Timing header, /api/debug/metricas/),
+# opt-in with API_INSTRUMENTATION=1
+if os.environ.get("API_INSTRUMENTATION", "0") == "1":
+    MIDDLEWARE.insert(0, "api.instrumentation.InstrumentationMiddleware")
+API_METRICS_SAMPLES = int(os.environ.get("API_METRICS_SAMPLES", 1000))
+# Requests above either budget are logged as warnings (0 disables the check)
+API_QUERY_BUDGET = int(os.environ.get("API_QUERY_BUDGET", 20))
+API_LATENCY_BUDGET_MS = int(os.environ.get("API_LATENCY_BUDGET_MS", 500))
+
 ROOT_URLCONF = "backend.urls"
 
 TEMPLATES = [
@@ -60,8 +73,39 @@ DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.sqlite3",
         "NAME": BASE_DIR / "db.sqlite3",
+        # Reuse connections across requests (seconds; 0 closes after each request)
+        "CONN_MAX_AGE": int(os.environ.get("DB_CONN_MAX_AGE", 600)),
+        "CONN_HEALTH_CHECKS": True,
+        # Tests use a file, not the shared-cache in-memory database, so the
+        # concurrency test locks the same way production does; kept out of the
+        # repository so an interrupted run leaves nothing to commit
+        "TEST": {"NAME": Path(tempfile.gettempdir()) / "dental_test.sqlite3"},
     }
 }
+if django.VERSION >= (5, 1):
+    # Take the write lock at BEGIN so concurrent writers wait for busy_timeout
+    # instead of failing with "database is locked" when upgrading a read lock.
+    DATABASES["default"]["OPTIONS"] = {"transaction_mode": "IMMEDIATE"}
+
+# Read replicas: comma-separated SQLite files for local testing (any backend works).
+# GET requests on the patient and appointment endpoints read from them; a client
+# that has just written reads from the primary for DB_REPLICA_LAG seconds.
+DATABASE_REPLICAS = []
+for index, name in enumerate(filter(None, os.environ.get("DB_REPLICAS", "").split(",")), start=1):
+    DATABASES[f"replica{index}"] = {**DATABASES["default"], "NAME": name.strip(), "TEST": {"MIRROR": "default"}}
+    DATABASE_REPLICAS.append(f"replica{index}")
+DATABASE_ROUTERS = ["api.replicas.ReplicaRouter"]
+DATABASE_REPLICA_LAG = int(os.environ.get("DB_REPLICA_LAG", 5))
+
+# Applied on every new SQLite connection (see api/sqlite.py)
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "cache_size": -int(os.environ.get("SQLITE_CACHE_KB", 20000)),
+    "mmap_size": int(os.environ.get("SQLITE_MMAP_BYTES", 128 * 1024 * 1024)),
+    "busy_timeout": int(os.environ.get("SQLITE_BUSY_TIMEOUT_MS", 5000)),
+    "temp_store": "MEMORY",
+}
 
 AUTH_PASSWORD_VALIDATORS = []
 
@@ -74,8 +118,83 @@ STATIC_URL = "/static/"
 
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": (
-        "rest_framework_simplejwt.authentication.JWTAuthentication",
+        "api.authentication.CachedJWTAuthentication",
     ),
 }
 
+# Per-process LRU of verified access tokens (see api/authentication.py). The TTL
+# bounds how long another process may serve a user changed elsewhere.
+JWT_AUTH_CACHE_SIZE = int(os.environ.get("JWT_AUTH_CACHE_SIZE", 1024))
+JWT_AUTH_CACHE_TTL = int(os.environ.get("JWT_AUTH_CACHE_TTL", 300))
+
+# High-throughput mode: orjson rendering/parsing (when installed) and list
+# endpoints serialized straight from .values() rows.
+API_FAST_MODE = os.environ.get("API_FAST_MODE", "0") == "1"
+
+if API_FAST_MODE:
+    REST_FRAMEWORK["DEFAULT_RENDERER_CLASSES"] = (
+        "api.renderers.FastJSONRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    )
+    REST_FRAMEWORK["DEFAULT_PARSER_CLASSES"] = (
+        "api.renderers.FastJSONParser",
+        "rest_framework.parsers.FormParser",
+        "rest_framework.parsers.MultiPartParser",
+    )
+
+# The default LocMemCache is per process: signal invalidation only reaches the
+# worker that did the write. With several workers, point CACHE_BACKEND at a
+# shared cache, e.g. django.core.cache.backends.redis.RedisCache (needs the
+# redis package) with CACHE_LOCATION=redis://127.0.0.1:6379/1.
+CACHE_BACKEND = os.environ.get("CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache")
+CACHES = {
+    "default": {
+        "BACKEND": CACHE_BACKEND,
+        "LOCATION": os.environ.get("CACHE_LOCATION", ""),
+    }
+}
+CACHE_SHARED = CACHE_BACKEND != "django.core.cache.backends.locmem.LocMemCache"
+
+# Cached dashboard totals and appointment details are invalidated by model
+# signals; the timeout bounds staleness across processes that do not share the
+# cache, hence the short default without a shared one (details carry allergies).
+API_TOTAIS_CACHE_TIMEOUT = int(os.environ.get("API_TOTAIS_CACHE_TIMEOUT", 60))
+API_DETALHES_CACHE_TIMEOUT = int(os.environ.get("API_DETALHES_CACHE_TIMEOUT", 300 if CACHE_SHARED else 10))
+
+# Keyset pagination for the patient and appointment lists (see api/pagination.py)
+API_PAGE_SIZE = int(os.environ.get("API_PAGE_SIZE", 50))
+API_MAX_PAGE_SIZE = int(os.environ.get("API_MAX_PAGE_SIZE", 500))
+
+# Delta sync: deletions older than this are forgotten and clients get a full snapshot
+SYNC_TOMBSTONE_DIAS = int(os.environ.get("SYNC_TOMBSTONE_DIAS", 90))
+
+# Broker for the agenda SSE stream (/api/agenda/eventos/). The in-process broker
+# only reaches clients connected to the same worker process.
+AGENDA_EVENTS_BROKER = os.environ.get("AGENDA_EVENTS_BROKER", "api.events.InProcessBroker")
+# Lifetime of one SSE connection, in seconds; clients reconnect after it closes
+AGENDA_STREAM_SECONDS = int(os.environ.get("AGENDA_STREAM_SECONDS", 300))
+
+# arquivar_agendamentos moves finished appointments older than this to the archive table
+ARCHIVE_DIAS = int(os.environ.get("ARCHIVE_DIAS", 365))
+
+# Appointment reminders (see api/reminders.py). The transport is a dotted path
+# instantiated with REMINDER_TRANSPORT_OPTIONS; there is no default, so that
+# processar_lembretes refuses to run instead of marking reminders as sent. E.g.:
+# REMINDER_TRANSPORT=api.reminders.WebhookTransport REMINDER_WEBHOOK_URL=https://...
+REMINDER_TRANSPORT = os.environ.get("REMINDER_TRANSPORT", "")
+REMINDER_TRANSPORT_OPTIONS = (
+    {"url": os.environ["REMINDER_WEBHOOK_URL"], "token": os.environ.get("REMINDER_WEBHOOK_TOKEN")}
+    if os.environ.get("REMINDER_WEBHOOK_URL") else {}
+)
+REMINDER_HORAS = int(os.environ.get("REMINDER_HORAS", 24))
+REMINDER_LOTE = int(os.environ.get("REMINDER_LOTE", 200))
+REMINDER_WORKERS = int(os.environ.get("REMINDER_WORKERS", 8))
+# Provider rate limit, messages per second (0: unlimited)
+REMINDER_TAXA = float(os.environ.get("REMINDER_TAXA", 50))
+REMINDER_MAX_TENTATIVAS = int(os.environ.get("REMINDER_MAX_TENTATIVAS", 5))
+# Retry delay in seconds, doubled after each failed attempt
+REMINDER_BACKOFF = int(os.environ.get("REMINDER_BACKOFF", 60))
+# Reminders stuck in 'enviando' this long (worker died) are sent again
+REMINDER_LEASE = int(os.environ.get("REMINDER_LEASE", 300))
+
 CORS_ALLOW_ALL_ORIGINS = True